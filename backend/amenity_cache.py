@@ -0,0 +1,267 @@
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence
+
+import orjson
+from cachetools import TTLCache
+
+from overpass import Amenity
+
+# One cache entry: {category: [amenity record, ...]}
+Entry = Dict[str, List[Amenity]]
+
+
+class CachedEntry(NamedTuple):
+    entry: Entry
+    fetched_at: float  # time.time() when the entry was fetched from Overpass
+
+
+def encode_entry(entry: Entry) -> bytes:
+    """Compact orjson encoding: records become [id, lat, lng, tags] rows, empty categories are dropped."""
+    return orjson.dumps({cat: [[a.id, a.lat, a.lng, a.tags] for a in recs]
+                         for cat, recs in entry.items() if recs})
+
+
+def decode_entry(blob: bytes) -> Entry:
+    entry: Entry = {"parks": [], "worship": [], "stores": [], "gyms": [], "sports": []}
+    for cat, rows in orjson.loads(blob).items():
+        entry[cat] = [Amenity(r[0], r[1], r[2], r[3]) for r in rows]
+    return entry
+
+
+class AmenityCache:
+    """Backend interface for the amenity tile cache.
+
+    Entries are dropped after the backend's `ttl` (the hard TTL); callers decide from
+    `fetched_at` whether an entry is fresh enough or should be refreshed. Backends that
+    set `blocking` do I/O on reads, so async callers run them in a worker thread.
+    """
+
+    blocking = False
+
+    def get(self, key: Hashable) -> Optional[CachedEntry]:
+        raise NotImplementedError
+
+    def get_many(self, keys: Sequence[Hashable]) -> Dict[Hashable, CachedEntry]:
+        """The entries present for `keys`; missing and expired keys are left out."""
+        hits = {}
+        for key in keys:
+            hit = self.get(key)
+            if hit is not None:
+                hits[key] = hit
+        return hits
+
+    def set(self, key: Hashable, entry: Entry, fetched_at: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def set_many(self, entries: Dict[Hashable, Entry], fetched_at: Optional[float] = None) -> None:
+        """Store every entry of one fetch."""
+        for key, entry in entries.items():
+            self.set(key, entry, fetched_at)
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache counting LRU evictions and TTL expirations into a stats Counter."""
+
+    def __init__(self, maxsize: int, ttl: float, stats: Counter):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._stats = stats
+        self._counting = True
+
+    def popitem(self):
+        item = super().popitem()
+        if self._counting:
+            self._stats["cache_evictions"] += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        if expired and self._counting:
+            self._stats["cache_expirations"] += len(expired)
+        return expired
+
+    def clear(self) -> None:
+        # TTLCache.clear expires then empties the cache through popitem; dropping
+        # everything on purpose is neither an eviction nor an expiration
+        self._counting = False
+        try:
+            super().clear()
+        finally:
+            self._counting = True
+
+
+class MemoryAmenityCache(AmenityCache):
+    """Per-process TTL + LRU cache (the default)."""
+
+    def __init__(self, maxsize: int, ttl: float, stats: Optional[Counter] = None):
+        self.stats = stats if stats is not None else Counter()
+        self._cache: TTLCache = _CountingTTLCache(maxsize, ttl, self.stats)
+
+    def get(self, key: Hashable) -> Optional[CachedEntry]:
+        return self._cache.get(key)
+
+    def set(self, key: Hashable, entry: Entry, fetched_at: Optional[float] = None) -> None:
+        self._cache[key] = CachedEntry(entry, time.time() if fetched_at is None else fetched_at)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+class SqliteAmenityCache(AmenityCache):
+    """SQLite-backed cache shared by every worker process on the host and kept across restarts.
+
+    Entries are stored orjson-encoded with their fetch and expiry times. Writes evict
+    expired rows, then least recently used ones, once more than `maxsize` entries are
+    stored; `set_many` writes a whole fetch in one transaction. Writes wait at most
+    `write_timeout` for the database and raise sqlite3.OperationalError past it. Reads
+    are a single SELECT on their own connection with a short busy timeout
+    (a read that can't get the database in time is a miss, not a stalled request); the
+    access times they bump are buffered and written in one batch at most every
+    `_TOUCH_EVERY` seconds. WAL mode makes concurrent readers and writers from several
+    processes safe.
+    """
+
+    blocking = True
+    # Recount rows for eviction every this many writes instead of on every write
+    _EVICT_EVERY = 32
+    # Flush buffered access times at most this often (seconds)
+    _TOUCH_EVERY = 30.0
+    # Keys per SELECT ... IN (...), well under SQLite's bound parameter limit
+    _READ_BATCH = 500
+
+    def __init__(self, path: str, maxsize: int, ttl: float, stats: Optional[Counter] = None,
+                 read_timeout: float = 0.5, write_timeout: float = 2.0):
+        self.path = path
+        self.stats = stats if stats is not None else Counter()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._writes = 0
+        self._touched: Dict[str, float] = {}
+        self._touched_at = time.time()
+        self._conn = sqlite3.connect(path, timeout=write_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS amenity_cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, fetched_at REAL NOT NULL, expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS amenity_cache_accessed ON amenity_cache (accessed_at)")
+        self._reader = sqlite3.connect(path, timeout=read_timeout, isolation_level=None, check_same_thread=False)
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return orjson.dumps(key).decode()
+
+    def get(self, key: Hashable) -> Optional[CachedEntry]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Sequence[Hashable]) -> Dict[Hashable, CachedEntry]:
+        by_key = {self._key(key): key for key in keys}
+        ks = list(by_key)
+        now = time.time()
+        rows = []
+        try:
+            with self._read_lock:
+                for i in range(0, len(ks), self._READ_BATCH):
+                    batch = ks[i:i + self._READ_BATCH]
+                    rows += self._reader.execute(
+                        "SELECT key, value, fetched_at FROM amenity_cache"
+                        f" WHERE key IN ({','.join('?' * len(batch))}) AND expires_at > ?", (*batch, now)
+                    ).fetchall()
+        except sqlite3.OperationalError:
+            # Locked past the read timeout: miss and let the caller fetch
+            self.stats["cache_read_errors"] += 1
+            return {}
+        hits = {by_key[k]: CachedEntry(decode_entry(value), fetched_at) for k, value, fetched_at in rows}
+        with self._lock:
+            self._touched.update((k, now) for k, _, _ in rows)
+            if now - self._touched_at >= self._TOUCH_EVERY:
+                try:
+                    self._flush_touched(now)
+                except sqlite3.OperationalError:
+                    # Keep the buffer and try again next interval; the read itself succeeded
+                    self.stats["cache_write_errors"] += 1
+        return hits
+
+    def _flush_touched(self, now: float) -> None:
+        """Write the buffered access times in one transaction (called with self._lock held)."""
+        self._touched_at = now
+        if self._touched:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("UPDATE amenity_cache SET accessed_at = ? WHERE key = ?",
+                                       [(t, k) for k, t in self._touched.items()])
+            self._touched.clear()
+
+    def set(self, key: Hashable, entry: Entry, fetched_at: Optional[float] = None) -> None:
+        self.set_many({key: entry}, fetched_at)
+
+    def set_many(self, entries: Dict[Hashable, Entry], fetched_at: Optional[float] = None) -> None:
+        now = time.time()
+        fetched_at = now if fetched_at is None else fetched_at
+        rows = [(self._key(key), encode_entry(entry), fetched_at + self.ttl, now, fetched_at)
+                for key, entry in entries.items()]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO amenity_cache (key, value, expires_at, accessed_at, fetched_at)"
+                    " VALUES (?, ?, ?, ?, ?)", rows,
+                )
+            before, self._writes = self._writes, self._writes + len(rows)
+            if self._writes // self._EVICT_EVERY > before // self._EVICT_EVERY:
+                # LRU order must see the reads since the last flush
+                self._flush_touched(now)
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        expired = self._conn.execute("DELETE FROM amenity_cache WHERE expires_at <= ?", (now,)).rowcount
+        if expired > 0:
+            self.stats["cache_expirations"] += expired
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM amenity_cache").fetchone()
+        if count > self.maxsize:
+            evicted = self._conn.execute(
+                "DELETE FROM amenity_cache WHERE key IN"
+                " (SELECT key FROM amenity_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.maxsize,),
+            ).rowcount
+            self.stats["cache_evictions"] += max(evicted, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM amenity_cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM amenity_cache WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        return count
+
+
+def make_amenity_cache(backend: str, maxsize: int, ttl: float, path: str = "", stats: Optional[Counter] = None) -> AmenityCache:
+    """Build the cache backend named by AMENITY_CACHE_BACKEND ("memory" or "sqlite").
+    Evictions and expirations are counted into `stats`.
+    """
+    if backend == "memory":
+        return MemoryAmenityCache(maxsize, ttl, stats)
+    if backend == "sqlite":
+        return SqliteAmenityCache(path or os.path.join(os.path.dirname(__file__), "amenity_cache.sqlite3"), maxsize, ttl, stats)
+    raise ValueError(f"Unknown amenity cache backend: {backend!r}")
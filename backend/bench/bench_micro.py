@@ -0,0 +1,168 @@
+"""Micro-benchmarks of the search pipeline stages against a local fake Overpass server.
+
+Run from backend/:  python -m bench.bench_micro --listings 1000 100000 --output micro.json
+
+Covers haversine_m, build_overpass_query, fetch_amenities (cold: cache cleared before every
+call, so each one is a fake Overpass round-trip; warm: served from the tile cache) and
+search_listings / get_clusters through the ASGI app for each synthetic inventory size
+(bench/synthetic.py), along with its JSON and compiled snapshot load times. Listing
+searches run with debug=true and report the mean per-stage breakdown next to the
+end-to-end latency.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from bench import fake_overpass
+from bench.common import current_rss_mb, latency_summary, peak_rss_mb, time_calls, write_results
+from bench.synthetic import ensure_listings_file
+
+# A dense viewport of the synthetic inventory, about 10 x 11 km: (west, south, east, north)
+VIEWPORT = (-74.05, 40.68, -73.93, 40.78)
+
+SEARCHES: Dict[str, Dict[str, Any]] = {
+    "plain": {},
+    "parks": {"need_parks": "true", "parks_radius": 500},
+    "multi": {"need_parks": "true", "parks_radius": 800, "stores": "grocery", "gyms": "gym", "gyms_radius": 1500},
+    "sorted_price": {"need_parks": "true", "parks_radius": 500, "sort": "price", "order": "desc", "limit": 50},
+    "compact": {"need_parks": "true", "parks_radius": 500, "payload": "compact", "matched_only": "true"},
+}
+CLUSTERS: Dict[str, Dict[str, Any]] = {
+    "clusters_z11": {"zoom": 11},
+    "clusters_z14_parks": {"zoom": 14, "need_parks": "true", "parks_radius": 500},
+}
+
+
+def bench_sync(repeat: int) -> Dict[str, Any]:
+    import main
+    from geo import haversine_m
+
+    results = {}
+    results["haversine_m"] = time_calls(lambda: haversine_m(40.7128, -74.0060, 40.7306, -73.9352), repeat, 10_000)
+    every_type = (True, list(main.WORSHIP_RELIGION_MAP), list(main.STORE_TAGS), list(main.GYM_TAGS), list(main.SPORTS_TAGS))
+    results["build_overpass_query_all"] = time_calls(lambda: main.build_overpass_query(VIEWPORT, *every_type), repeat, 200)
+    results["build_overpass_query_parks"] = time_calls(lambda: main.build_overpass_query(VIEWPORT, True, [], [], [], []),
+                                                       repeat, 200)
+    return results
+
+
+async def bench_fetch(repeat: int) -> Dict[str, Any]:
+    import main
+
+    args = (VIEWPORT, True, ["church"], ["grocery"], ["gym", "yoga_studio"], ["tennis_court"])
+    cold: List[float] = []
+    for _ in range(repeat):
+        main.amenities_cache.clear()
+        t0 = time.perf_counter()
+        amenities = await main.fetch_amenities(*args)
+        cold.append(time.perf_counter() - t0)
+    warm: List[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await main.fetch_amenities(*args)
+        warm.append(time.perf_counter() - t0)
+    return {"fetch_amenities_cold": latency_summary(cold), "fetch_amenities_warm": latency_summary(warm),
+            "amenities": {cat: len(recs) for cat, recs in amenities.items()}}
+
+
+async def bench_search(client, repeat: int) -> Dict[str, Any]:
+    west, south, east, north = VIEWPORT
+    bbox = {"west": west, "south": south, "east": east, "north": north}
+    results: Dict[str, Any] = {}
+    for name, params in SEARCHES.items():
+        await client.get("/api/listings", params={**bbox, **params})  # warm the amenity cache
+        samples: List[float] = []
+        stages: Dict[str, float] = defaultdict(float)
+        counts: Dict[str, float] = defaultdict(float)
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            resp = await client.get("/api/listings", params={**bbox, **params, "debug": "true"})
+            samples.append(time.perf_counter() - t0)
+            resp.raise_for_status()
+            debug = resp.json()["debug"]
+            for stage, ms in debug["stages_ms"].items():
+                stages[stage] += ms / repeat
+            for key, value in debug["counts"].items():
+                counts[key] += value / repeat
+        results[name] = {**latency_summary(samples), "stages_ms": {k: round(v, 4) for k, v in stages.items()},
+                         "counts": dict(counts)}
+    for name, params in CLUSTERS.items():
+        await client.get("/api/clusters", params={**bbox, **params})
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            (await client.get("/api/clusters", params={**bbox, **params})).raise_for_status()
+            samples.append(time.perf_counter() - t0)
+        results[name] = latency_summary(samples)
+    return results
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    import main
+    from listing_snapshot import ListingSnapshot
+    from listings_store import ListingStore
+
+    results: Dict[str, Any] = {"functions": bench_sync(args.repeat)}
+    tmp = tempfile.mkdtemp()
+    async with main.app.router.lifespan_context(main.app):
+        results["functions"].update(await bench_fetch(args.repeat))
+        results["search"] = {}
+        for n in args.listings:
+            path = ensure_listings_file(n, args.seed)
+            snapshot = os.path.join(tmp, f"listings_{n}.bin")
+            store = ListingStore.from_json(path, dict)
+            ListingSnapshot.write(snapshot, store.records, store.columns(), store.index, store.cell_m)
+            del store
+            t0 = time.perf_counter()
+            ListingStore.from_snapshot(snapshot, main.Listing)
+            snapshot_load_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            main.LISTINGS = ListingStore.from_json(path, main.Listing)
+            load_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            main.LISTINGS.cluster_index(main.CLUSTER_PRECOMPUTE_MAX_ZOOM)
+            cluster_s = time.perf_counter() - t0
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                search = await bench_search(client, args.repeat)
+            results["search"][str(n)] = {"load_s": round(load_s, 4), "snapshot_load_s": round(snapshot_load_s, 4),
+                                         "cluster_index_s": round(cluster_s, 4),
+                                         "rss_mb": current_rss_mb(), **search}
+            print(f"{n:>8} listings: load {load_s:.2f}s (snapshot {snapshot_load_s:.3f}s)  " + "  ".join(
+                f"{name} p50 {r['p50_ms']:.2f}ms" for name, r in search.items()))
+    for name, r in results["functions"].items():
+        if "p50_ms" in r:
+            print(f"{name:28s} p50 {r['p50_ms'] * 1000:10.2f} us  p99 {r['p99_ms'] * 1000:10.2f} us")
+    shutil.rmtree(tmp)
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--elements", type=int, default=50_000, help="fake Overpass element pool size")
+    parser.add_argument("--fixture", help="recorded Overpass JSON response for the fake server")
+    parser.add_argument("--latency-ms", type=float, default=0, help="fake Overpass response delay")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON (compare runs with bench.compare)")
+    args = parser.parse_args()
+
+    with fake_overpass.running(args.elements, args.latency_ms, seed=args.seed, fixture=args.fixture) as url:
+        # main reads its configuration at import time
+        os.environ.update(OVERPASS_URLS=url, PROXIMITY_TABLE_PATH="", HOT_REFRESH_INTERVAL_SECONDS="0",
+                          LISTINGS_RELOAD_INTERVAL_SECONDS="0", AMENITY_CACHE_BACKEND="memory")
+        results = asyncio.run(run(args))
+    write_results(args.output, "micro", vars(args), results)
+
+
+if __name__ == "__main__":
+    main_cli()
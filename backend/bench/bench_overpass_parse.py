@@ -0,0 +1,119 @@
+"""Overpass response parsing benchmark: whole-payload JSON vs streaming element parser.
+
+Run from backend/:  python -m bench.bench_overpass_parse --elements 200000
+Pass --fixture path/to/recorded_overpass.json to use a recorded response instead of a
+synthetic one.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import orjson
+
+from main import classify_amenity, empty_amenities
+from overpass import element_to_amenity, iter_elements
+
+CHUNK_SIZE = 64 * 1024
+
+
+def synthetic_fixture(path: str, n: int, seed: int) -> None:
+    """Write an Overpass-shaped response with realistic tag bloat (addresses, hours, refs)."""
+    rng = random.Random(seed)
+    kinds = [{"leisure": "park"}, {"amenity": "place_of_worship", "religion": "christian"},
+             {"shop": "supermarket"}, {"leisure": "fitness_centre", "sport": "yoga"}, {"leisure": "tennis_court"}]
+    elements = []
+    for i in range(n):
+        lat, lon = rng.uniform(40.5, 41.0), rng.uniform(-74.3, -73.6)
+        tags = dict(rng.choice(kinds), name=f"Place {i}", **{
+            "addr:street": "Broadway", "addr:housenumber": str(i), "addr:postcode": "10001", "addr:city": "New York",
+            "opening_hours": "Mo-Fr 08:00-20:00; Sa 09:00-18:00", "website": f"https://example.com/{i}",
+            "wikidata": f"Q{i}", "check_date": "2024-05-01", "source": "survey",
+        })
+        if i % 3:
+            elements.append({"type": "node", "id": i, "lat": lat, "lon": lon, "tags": tags})
+        else:
+            elements.append({"type": "way", "id": i, "center": {"lat": lat, "lon": lon}, "nodes": list(range(i, i + 12)), "tags": tags})
+    with open(path, "wb") as f:
+        f.write(orjson.dumps({"version": 0.6, "generator": "Overpass API", "osm3s": {}, "elements": elements}))
+
+
+def parse_whole(path: str) -> int:
+    """The previous approach: read the full body, parse it, keep every tag."""
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
+    result = empty_amenities()
+    for el in data.get("elements", []):
+        tags = el.get("tags", {}) or {}
+        if "center" in el:
+            lat, lon = el["center"]["lat"], el["center"]["lon"]
+        else:
+            lat, lon = el.get("lat"), el.get("lon")
+        category = classify_amenity(tags)
+        if category is not None:
+            result[category].append({"id": el.get("id"), "lat": lat, "lng": lon, "tags": tags})
+    return sum(len(v) for v in result.values())
+
+
+async def parse_streaming(path: str) -> int:
+    async def chunks():
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    result = empty_amenities()
+    async for el in iter_elements(chunks()):
+        amenity = element_to_amenity(el)
+        if amenity is None:
+            continue
+        category = classify_amenity(amenity.tags)
+        if category is not None:
+            result[category].append(amenity)
+    return sum(len(v) for v in result.values())
+
+
+def measure(label: str, fn, size: int) -> None:
+    # Timed and memory-traced in separate runs, tracemalloc slows allocation-heavy code a lot
+    t0 = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:10s}: {elapsed * 1000:8.1f} ms  {size / elapsed / 1e6:6.1f} MB/s  peak {peak / 1e6:7.1f} MB  records {count}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=200_000)
+    parser.add_argument("--fixture", help="recorded Overpass JSON response")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    path = args.fixture
+    tmp = None
+    if path is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+        tmp.close()
+        path = tmp.name
+        synthetic_fixture(path, args.elements, args.seed)
+    try:
+        size = os.path.getsize(path)
+        print(f"fixture {path}: {size / 1e6:.1f} MB")
+        measure("whole", lambda: parse_whole(path), size)
+        measure("streaming", lambda: asyncio.run(parse_streaming(path)), size)
+    finally:
+        if tmp is not None:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
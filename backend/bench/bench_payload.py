@@ -0,0 +1,84 @@
+"""Search response encoding benchmark: pydantic response_model vs orjson full/compact/columnar.
+
+Run from backend/:  python -m bench.bench_payload --listings 500 --amenities 20000
+Reports encoded size raw, gzipped and (with the brotli package) brotli-compressed, plus
+encode and compression times per payload mode, and for compact with matched_only.
+"""
+from __future__ import annotations
+import argparse
+import gzip
+import random
+import time
+from typing import Callable
+
+from compression import brotli
+from listings_store import ListingStore
+from main import Listing, SearchResponse, classify_amenity, empty_amenities
+import main
+from overpass import Amenity
+
+
+def synthetic(n_listings: int, n_amenities: int, seed: int):
+    rng = random.Random(seed)
+    records = [dict(id=f"l{i}", title=f"Listing {i}", address=f"{i} Broadway, New York, NY",
+                    lat=rng.uniform(40.6, 40.9), lng=rng.uniform(-74.1, -73.8), price=rng.randint(1000, 3_000_000),
+                    sale_type=rng.choice(["sale", "rent"]), beds=rng.randint(0, 5), baths=rng.randint(1, 4),
+                    sqft=rng.randint(300, 4000), google_maps_link=f"https://www.google.com/maps/search/?api=1&query={i}")
+               for i in range(n_listings)]
+    kinds = [{"leisure": "park"}, {"amenity": "place_of_worship", "religion": "christian"},
+             {"shop": "supermarket"}, {"leisure": "fitness_centre", "sport": "yoga"}, {"leisure": "tennis_court"}]
+    amenities = empty_amenities()
+    for i in range(n_amenities):
+        tags = dict(rng.choice(kinds), name=f"Place {i}")
+        amenities[classify_amenity(tags)].append(Amenity(i, rng.uniform(40.6, 40.9), rng.uniform(-74.1, -73.8), tags))
+    return records, amenities
+
+
+def measure(label: str, encode: Callable[[], bytes], repeat: int, gzip_level: int) -> None:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        body = encode()
+    encode_ms = (time.perf_counter() - t0) / repeat * 1000
+    t0 = time.perf_counter()
+    gz = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    gzip_ms = (time.perf_counter() - t0) * 1000
+    line = f"{label:10s}: encode {encode_ms:8.2f} ms  raw {len(body) / 1e3:9.1f} kB  gzip {len(gz) / 1e3:8.1f} kB ({gzip_ms:6.1f} ms)"
+    if brotli is not None:
+        t0 = time.perf_counter()
+        br = brotli.compress(body, quality=main.RESPONSE_BROTLI_QUALITY)
+        line += f"  br {len(br) / 1e3:8.1f} kB ({(time.perf_counter() - t0) * 1000:6.1f} ms)"
+    print(line)
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listings", type=int, default=500)
+    parser.add_argument("--amenities", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--radius", type=int, default=300, help="proximity radius for the matched_only row (meters)")
+    parser.add_argument("--gzip-level", type=int, default=main.RESPONSE_GZIP_LEVEL)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    records, amenities = synthetic(args.listings, args.amenities, args.seed)
+    main.LISTINGS = ListingStore(records, Listing)
+    rows = list(range(len(records)))
+
+    def pydantic_model() -> bytes:
+        # What response_model did: build and validate the models, then serialize them
+        resp = SearchResponse(listings=main.LISTINGS.rows(rows), amenities_used=amenities)
+        return resp.model_dump_json().encode()
+
+    print(f"{args.listings} listings, {args.amenities} amenities")
+    measure("pydantic", pydantic_model, args.repeat, args.gzip_level)
+    for mode in ("full", "compact", "columnar"):
+        measure(mode, lambda: main.search_payload(rows, amenities, None, mode).body, args.repeat, args.gzip_level)
+    # compact + matched_only: amenities within --radius of a returned listing (includes the matching)
+    preds = {cat: (lambda a: True) for cat in amenities}
+    radii = {cat: args.radius for cat in amenities}
+    measure("matched", lambda: main.search_payload(rows, main.matched_amenities(amenities, preds, radii, rows), None,
+                                                   "compact").body, args.repeat, args.gzip_level)
+
+
+if __name__ == "__main__":
+    main_cli()
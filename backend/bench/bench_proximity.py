@@ -0,0 +1,72 @@
+"""Proximity filter benchmark: brute-force haversine scan vs GridIndex (and VectorProximityEngine if numpy is installed).
+
+Run from backend/:  python -m bench.bench_proximity --listings 10000 --amenities 50000
+"""
+from __future__ import annotations
+import argparse
+import random
+import time
+
+from geo import GridIndex, VectorProximityEngine, any_within_brute, np
+
+# Roughly the default NYC viewport used by the frontend
+BBOX = (-74.1, 40.6, -73.8, 40.9)
+
+
+def random_points(n: int, rng: random.Random):
+    west, south, east, north = BBOX
+    return [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(n)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listings", type=int, default=10_000)
+    parser.add_argument("--amenities", type=int, default=50_000)
+    parser.add_argument("--radius", type=int, default=60,
+                        help="proximity radius in meters (at the default density about 40%% of listings match)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    listings = random_points(args.listings, rng)
+    amenities = random_points(args.amenities, rng)
+
+    t0 = time.perf_counter()
+    brute = [any_within_brute(lat, lng, amenities, args.radius) for lat, lng in listings]
+    t_brute = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index = GridIndex(amenities, cell_m=args.radius)
+    t_build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    grid = [index.any_within(lat, lng, args.radius) for lat, lng in listings]
+    t_grid = time.perf_counter() - t0
+
+    if grid != brute:
+        raise SystemExit("MISMATCH: grid index disagrees with brute-force haversine")
+
+    print(f"listings={args.listings} amenities={args.amenities} radius={args.radius}m matches={sum(grid)}")
+    if sum(grid) in (0, len(grid)):
+        print("warning: every listing got the same answer, so the equivalence checks prove little; "
+              "lower --radius or --amenities")
+    print(f"brute force : {t_brute * 1000:9.1f} ms")
+    print(f"grid build  : {t_build * 1000:9.1f} ms")
+    print(f"grid query  : {t_grid * 1000:9.1f} ms")
+    print(f"speedup     : {t_brute / (t_build + t_grid):9.1f}x")
+
+    if np is None:
+        print("numpy not installed; skipping VectorProximityEngine")
+        return
+    t0 = time.perf_counter()
+    engine = VectorProximityEngine([p[0] for p in listings], [p[1] for p in listings])
+    engine.add_category([p[0] for p in amenities], [p[1] for p in amenities], args.radius)
+    vector = engine.run().tolist()
+    t_vector = time.perf_counter() - t0
+    if vector != brute:
+        raise SystemExit("MISMATCH: vector engine disagrees with brute-force haversine")
+    print(f"numpy engine: {t_vector * 1000:9.1f} ms")
+    print(f"speedup     : {t_brute / t_vector:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Shared helpers for the benchmark scripts: latency summaries, RSS and JSON result files."""
+from __future__ import annotations
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import orjson
+
+try:  # not available on Windows
+    import resource
+except ImportError:
+    resource = None
+
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    """count, mean and p50/p95/p99/max of a list of durations, in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    ordered = sorted(seconds)
+    n = len(ordered)
+
+    def pct(p: float) -> float:
+        # Nearest-rank percentile
+        return round(ordered[min(n - 1, max(0, int(p / 100 * n + 0.5) - 1))] * 1000, 4)
+
+    return {"count": n, "mean_ms": round(sum(ordered) / n * 1000, 4), "p50_ms": pct(50), "p95_ms": pct(95),
+            "p99_ms": pct(99), "max_ms": round(ordered[-1] * 1000, 4)}
+
+
+def time_calls(fn: Callable[[], Any], repeat: int, number: int = 1) -> Dict[str, float]:
+    """latency_summary of `repeat` samples, each the mean time of `number` back-to-back calls."""
+    samples: List[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number)
+    return latency_summary(samples)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def current_rss_mb() -> Optional[float]:
+    """Current resident set size, Linux only."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+def environment() -> Dict[str, Any]:
+    """What a result was measured on, so runs from different machines are not compared blindly."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), "numpy": numpy_version, "git_commit": commit}
+
+
+def write_results(path: Optional[str], benchmark: str, config: Dict[str, Any], results: Dict[str, Any]) -> None:
+    """Write a run's config and results, plus the environment, as JSON for bench.compare."""
+    if not path:
+        return
+    doc = {"benchmark": benchmark, "timestamp": time.time(), "environment": environment(), "config": config,
+           "results": results}
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(doc, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS))
+    print(f"results written to {path}")
@@ -0,0 +1,57 @@
+"""Compare two benchmark result files written with --output.
+
+Run from backend/:  python -m bench.compare before.json after.json [--filter p50] [--threshold 5]
+Prints every numeric result present in both runs with its relative change; lines at or
+above --threshold percent are flagged.
+"""
+from __future__ import annotations
+import argparse
+from typing import Any, Dict
+
+import orjson
+
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, float]:
+    """{"a.b.c": number} for every numeric leaf of nested dicts."""
+    if isinstance(value, bool):
+        return {}
+    if isinstance(value, (int, float)):
+        return {prefix: value}
+    out: Dict[str, float] = {}
+    if isinstance(value, dict):
+        for key, sub in value.items():
+            out.update(flatten(sub, f"{prefix}.{key}" if prefix else str(key)))
+    return out
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--filter", default="", help="only keys containing this substring")
+    parser.add_argument("--threshold", type=float, default=5.0, help="flag changes of at least this many percent")
+    args = parser.parse_args()
+
+    docs = []
+    for path in (args.before, args.after):
+        with open(path, "rb") as f:
+            docs.append(orjson.loads(f.read()))
+    before, after = docs
+    if before["benchmark"] != after["benchmark"]:
+        parser.error(f"different benchmarks: {before['benchmark']} vs {after['benchmark']}")
+    for doc, path in ((before, args.before), (after, args.after)):
+        env = doc["environment"]
+        print(f"{path}: commit {env.get('git_commit')} python {env.get('python')} on {env.get('platform')}")
+
+    old, new = flatten(before["results"]), flatten(after["results"])
+    for key in sorted(old.keys() & new.keys()):
+        if args.filter not in key:
+            continue
+        a, b = old[key], new[key]
+        change = (b - a) / a * 100 if a else (0.0 if b == a else float("inf"))
+        flag = " *" if abs(change) >= args.threshold else ""
+        print(f"{key:60s} {a:14.4f} -> {b:14.4f}  {change:+8.1f}%{flag}")
+
+
+if __name__ == "__main__":
+    main_cli()
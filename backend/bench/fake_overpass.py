@@ -0,0 +1,182 @@
+"""Local stand-in for the Overpass API, for benchmarks that must not hit the public mirrors.
+
+Run from backend/:  python -m bench.fake_overpass --port 8901 --latency-ms 300 --elements 50000
+then start the app with OVERPASS_URLS=http://127.0.0.1:8901/api/interpreter.
+
+Queries are answered from a pool of synthetic elements (or a recorded Overpass response via
+--fixture): the node/way/relation statements of the query built by main.py are parsed and
+each element is returned if it matches any statement's tag filters and bbox, like the real
+union. Every response is delayed by --latency-ms plus up to --jitter-ms, and --error-rate
+of them are 429s with Retry-After: 0 to exercise the client's retries.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import bisect
+import contextlib
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import orjson
+
+# node["k"="v"]["k2"~"^(a|b)$"](S,W,N,E);
+STATEMENT_RE = re.compile(r"(node|way|relation)((?:\[[^\]]*\])+)\(([-\d.e]+),([-\d.e]+),([-\d.e]+),([-\d.e]+)\);")
+FILTER_RE = re.compile(r'\["([^"]+)"(?:(=|~)"([^"]*)")?\]')
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TagTest = Callable[[Dict[str, str]], bool]
+
+
+def _tag_test(key: str, op: str, value: str) -> TagTest:
+    if op == "=":
+        return lambda tags: tags.get(key) == value
+    if op == "~":
+        pattern = re.compile(value)
+        return lambda tags: key in tags and pattern.search(tags[key]) is not None
+    return lambda tags: key in tags
+
+
+def parse_query(query: str) -> List[Tuple[str, List[TagTest], Tuple[float, float, float, float]]]:
+    """(element type, tag tests, (south, west, north, east)) for every statement of the query."""
+    statements = []
+    for kind, filters, s, w, n, e in STATEMENT_RE.findall(query):
+        tests = [_tag_test(k, op, v) for k, op, v in FILTER_RE.findall(filters)]
+        statements.append((kind, tests, (float(s), float(w), float(n), float(e))))
+    return statements
+
+
+def element_center(el: Dict[str, Any]) -> Tuple[float, float]:
+    center = el.get("center", el)
+    return center["lat"], center["lon"]
+
+
+class FakeOverpass:
+    """ASGI app answering Overpass interpreter POSTs from an in-memory element pool."""
+
+    def __init__(self, elements: List[Dict[str, Any]], latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0, seed: int = 42):
+        # (lat, lng, type, id, tags, element) sorted by lat, so a bbox is a bisect plus a lng check
+        self.rows = sorted((*element_center(el), el["type"], el["id"], el.get("tags", {}), el) for el in elements)
+        self.lats = [row[0] for row in self.rows]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+
+    def answer(self, query: str) -> List[Dict[str, Any]]:
+        out: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        rows = self.rows
+        for kind, tests, (south, west, north, east) in parse_query(query):
+            for j in range(bisect.bisect_left(self.lats, south), bisect.bisect_right(self.lats, north)):
+                _, lng, el_type, el_id, tags, el = rows[j]
+                if (el_type == kind and west <= lng <= east and (kind, el_id) not in out
+                        and all(test(tags) for test in tests)):
+                    out[(kind, el_id)] = el
+        return list(out.values())
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        self.requests += 1
+        delay = (self.latency_ms + self.rng.uniform(0, self.jitter_ms)) / 1000
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            await send({"type": "http.response.start", "status": 429, "headers": [(b"retry-after", b"0")]})
+            await send({"type": "http.response.body", "body": b"rate limited"})
+            return
+        if scope["method"] == "POST":
+            query = parse_qs(body.decode()).get("data", [""])[0]
+        else:
+            query = parse_qs(scope.get("query_string", b"").decode()).get("data", [""])[0]
+        payload = orjson.dumps({"version": 0.6, "generator": "fake_overpass", "elements": self.answer(query)})
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]})
+        await send({"type": "http.response.body", "body": payload})
+
+
+def load_elements(fixture: Optional[str], n: int, seed: int) -> List[Dict[str, Any]]:
+    """Elements of a recorded Overpass JSON response, or n synthetic ones."""
+    if fixture:
+        with open(fixture, "rb") as f:
+            return [el for el in orjson.loads(f.read())["elements"] if "center" in el or "lat" in el]
+    from bench.synthetic import synthetic_elements
+    return synthetic_elements(n, seed)
+
+
+@contextlib.contextmanager
+def running(elements: int = 50_000, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+            seed: int = 42, fixture: Optional[str] = None, host: str = "127.0.0.1") -> Iterator[str]:
+    """Run the server in a subprocess, so it does not compete with the app under test for the
+    GIL, and yield its interpreter URL once it accepts connections.
+    """
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        port = sock.getsockname()[1]
+    cmd = [sys.executable, "-m", "bench.fake_overpass", "--host", host, "--port", str(port), "--elements", str(elements),
+           "--latency-ms", str(latency_ms), "--jitter-ms", str(jitter_ms), "--error-rate", str(error_rate),
+           "--seed", str(seed)]
+    if fixture:
+        cmd += ["--fixture", fixture]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                break
+            except OSError:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("fake Overpass server did not start")
+                time.sleep(0.05)
+        yield f"http://{host}:{port}/api/interpreter"
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--elements", type=int, default=50_000, help="synthetic element pool size")
+    parser.add_argument("--fixture", help="recorded Overpass JSON response to serve instead")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = FakeOverpass(load_elements(args.fixture, args.elements, args.seed), args.latency_ms, args.jitter_ms,
+                       args.error_rate, args.seed)
+    print(f"serving {len(app.rows)} elements on http://{args.host}:{args.port}/api/interpreter")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", lifespan="off")
+
+
+if __name__ == "__main__":
+    main_cli()
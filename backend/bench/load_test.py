@@ -0,0 +1,182 @@
+"""End-to-end concurrent load test of the ASGI app against a local fake Overpass server.
+
+Run from backend/:  python -m bench.load_test --listings 100000 --concurrency 32 --requests 2000 --output load.json
+
+The app is imported with LISTINGS_PATH pointing at a synthetic inventory (bench/synthetic.py),
+or with --snapshot its compiled listing snapshot, and OVERPASS_URLS at bench/fake_overpass.py running in a subprocess with --latency-ms, then
+driven in-process through httpx's ASGI transport (middleware included) by --concurrency
+workers. Requests are a seeded mix of scenarios (--mix) over random viewports centred on
+listings, so the same arguments replay the same traffic. --warmup requests run first and
+are not measured; pass --warmup 0 to include cold-cache Overpass fetches.
+
+Reports throughput, p50/p95/p99 latency overall and per scenario, status codes, the
+amenity/search counters from the app and peak RSS of the process.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Tuple
+
+from bench import fake_overpass
+from bench.common import current_rss_mb, latency_summary, peak_rss_mb, write_results
+from bench.synthetic import BACKEND_DIR, listings_path
+from listing_snapshot import ListingSnapshot
+
+DEFAULT_MIX = "plain=30,parks=25,multi=15,sorted=10,clusters=20"
+# Browser viewport the requests are sized for, in pixels
+VIEWPORT_PX = (1280, 800)
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+def viewport(rng: random.Random, lat: float, lng: float, zoom: int) -> Dict[str, float]:
+    """bbox of a VIEWPORT_PX map view at `zoom` centred near (lat, lng)."""
+    half_w = 360 / 2 ** zoom * VIEWPORT_PX[0] / 256 / 2
+    half_h = half_w * VIEWPORT_PX[1] / VIEWPORT_PX[0] * math.cos(math.radians(lat))
+    lat += rng.uniform(-half_h, half_h) / 2
+    lng += rng.uniform(-half_w, half_w) / 2
+    return {"west": round(lng - half_w, 6), "south": round(lat - half_h, 6),
+            "east": round(lng + half_w, 6), "north": round(lat + half_h, 6)}
+
+
+def make_request(rng: random.Random, scenario: str, centres: List[Tuple[float, float]]) -> Request:
+    lat, lng = rng.choice(centres)
+    radius = rng.choice([300, 500, 800, 1000])
+    if scenario == "clusters":
+        zoom = rng.randint(10, 14)
+        return scenario, "/api/clusters", {**viewport(rng, lat, lng, zoom), "zoom": zoom}
+    params: Dict[str, Any] = viewport(rng, lat, lng, rng.randint(13, 15))
+    if scenario == "parks":
+        params.update(need_parks="true", parks_radius=radius)
+    elif scenario == "multi":
+        params.update(need_parks="true", parks_radius=radius, stores=rng.choice(["grocery", "home_improvement"]),
+                      gyms=rng.choice(["gym", "yoga_studio"]), gyms_radius=radius)
+    elif scenario == "sorted":
+        params.update(need_parks="true", parks_radius=radius, sort=rng.choice(["price", "sqft", "distance"]),
+                      order=rng.choice(["asc", "desc"]), limit=50)
+    elif scenario != "plain":
+        raise ValueError(f"unknown scenario {scenario!r}")
+    return scenario, "/api/listings", params
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    import main
+
+    rng = random.Random(args.seed)
+    centres = [(main.LISTINGS.lat[i], main.LISTINGS.lng[i]) for i in range(len(main.LISTINGS))]
+    mix = parse_mix(args.mix)
+    scenarios = rng.choices(list(mix), list(mix.values()), k=args.warmup + args.requests)
+    requests = [make_request(rng, s, centres) for s in scenarios]
+
+    async with main.app.router.lifespan_context(main.app):
+        # Cluster precomputation runs in the background at startup; don't measure it
+        await asyncio.to_thread(main.LISTINGS.cluster_index, main.CLUSTER_PRECOMPUTE_MAX_ZOOM)
+        rss_start = current_rss_mb()
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench",
+                                     limits=limits, timeout=None) as client:
+            samples: List[Tuple[str, int, float, int]] = []
+
+            async def worker(queue: List[Request], record: bool) -> None:
+                while queue:
+                    scenario, url, params = queue.pop()
+                    t0 = time.perf_counter()
+                    resp = await client.get(url, params=params)
+                    elapsed = time.perf_counter() - t0
+                    if record:
+                        samples.append((scenario, resp.status_code, elapsed, len(resp.content)))
+
+            async def phase(batch: List[Request], record: bool) -> float:
+                queue = list(reversed(batch))
+                t0 = time.perf_counter()
+                await asyncio.gather(*(worker(queue, record) for _ in range(args.concurrency)))
+                return time.perf_counter() - t0
+
+            warmup_s = await phase(requests[:args.warmup], False)
+            amenity_before, search_before = Counter(main.amenity_stats), Counter(main.search_stats)
+            wall = await phase(requests[args.warmup:], True)
+
+    by_scenario: Dict[str, List[float]] = defaultdict(list)
+    for scenario, _, elapsed, _ in samples:
+        by_scenario[scenario].append(elapsed)
+    return {
+        "listings": len(centres),
+        "warmup_s": round(warmup_s, 3),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(samples) / wall, 2) if wall else None,
+        "latency": latency_summary([s[2] for s in samples]),
+        "scenarios": {name: latency_summary(v) for name, v in sorted(by_scenario.items())},
+        "status_codes": dict(Counter(str(s[1]) for s in samples)),
+        "mean_response_kb": round(sum(s[3] for s in samples) / len(samples) / 1e3, 2) if samples else None,
+        "amenity_stats": dict(Counter(main.amenity_stats) - amenity_before),
+        "search_stats": dict(Counter(main.search_stats) - search_before),
+        "rss_start_mb": rss_start,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=100_000, help="synthetic inventory size")
+    parser.add_argument("--listings-file", help="listing JSON to load instead of a synthetic inventory")
+    parser.add_argument("--snapshot", action="store_true", help="serve a compiled snapshot of the listings (built if needed)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights: plain, parks, multi, sorted, clusters")
+    parser.add_argument("--elements", type=int, default=50_000, help="fake Overpass element pool size")
+    parser.add_argument("--fixture", help="recorded Overpass JSON response for the fake server")
+    parser.add_argument("--latency-ms", type=float, default=200, help="fake Overpass response delay")
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of Overpass requests answered with 429")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON (compare runs with bench.compare)")
+    args = parser.parse_args()
+
+    path = args.listings_file or listings_path(args.listings, args.seed)
+    if not os.path.exists(path):
+        # Generate in a child process so generation doesn't count towards this process's peak RSS
+        subprocess.run([sys.executable, "-m", "bench.synthetic", "--listings", str(args.listings), "--seed", str(args.seed)],
+                       cwd=BACKEND_DIR, check=True)
+    snapshot = ""  # serve the JSON, even if a snapshot of it exists at the default path
+    if args.snapshot:
+        snapshot = os.path.splitext(path)[0] + ".snapshot.bin"
+        if ListingSnapshot.stale_reason(snapshot, path) is not None:
+            subprocess.run([sys.executable, "build_listing_snapshot.py", "--input", path, "--output", snapshot],
+                           cwd=BACKEND_DIR, check=True)
+
+    with fake_overpass.running(args.elements, args.latency_ms, args.jitter_ms, args.error_rate, args.seed,
+                               args.fixture) as url:
+        # main reads its configuration at import time
+        os.environ.update(LISTINGS_PATH=path, LISTINGS_SNAPSHOT_PATH=snapshot, OVERPASS_URLS=url, PROXIMITY_TABLE_PATH="",
+                          HOT_REFRESH_INTERVAL_SECONDS="0", LISTINGS_RELOAD_INTERVAL_SECONDS="0",
+                          AMENITY_CACHE_BACKEND="memory")
+        results = asyncio.run(run(args))
+
+    lat = results["latency"]
+    print(f"{results['listings']} listings, {args.concurrency} workers: {results['throughput_rps']} req/s  "
+          f"p50 {lat.get('p50_ms')} ms  p95 {lat.get('p95_ms')} ms  p99 {lat.get('p99_ms')} ms  "
+          f"peak RSS {results['peak_rss_mb']} MB  status {results['status_codes']}")
+    for name, r in results["scenarios"].items():
+        print(f"  {name:10s} n={r['count']:5d}  p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms")
+    write_results(args.output, "load_test", vars(args), results)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,130 @@
+"""Reproducible synthetic listing inventories and Overpass elements for the benchmarks.
+
+Run from backend/:  python -m bench.synthetic --listings 1000 10000 100000 1000000
+writes listings_synthetic_<n>.json next to listings_seed.json; start the app on one with
+LISTINGS_PATH=listings_synthetic_100000.json. The same --seed always gives the same file.
+"""
+from __future__ import annotations
+import argparse
+import math
+import os
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# NYC area, as in the other benchmarks: (west, south, east, north)
+BBOX = (-74.3, 40.5, -73.6, 41.0)
+# Listings cluster around neighbourhood centres with this spread (meters), like real inventory
+NEIGHBOURHOODS = 60
+NEIGHBOURHOOD_SIGMA_M = 1500
+
+STREETS = ["Broadway", "Atlantic Ave", "Ocean Ave", "Lexington Ave", "W 73rd St", "Bedford Ave", "Queens Blvd",
+           "Grand Concourse", "Flatbush Ave", "Amsterdam Ave"]
+TITLES = ["Sunny {unit}", "Renovated {unit} Condo", "{unit} Walk-up", "Spacious {unit} Co-op", "{unit} Townhouse"]
+
+# Tag sets covering every category and most types the search filters ask for, with rough weights
+ELEMENT_KINDS: List[Tuple[float, Dict[str, str]]] = [
+    (20, {"leisure": "park"}),
+    (6, {"amenity": "place_of_worship", "religion": "christian"}),
+    (3, {"amenity": "place_of_worship", "religion": "jewish"}),
+    (2, {"amenity": "place_of_worship", "religion": "muslim"}),
+    (1, {"amenity": "place_of_worship", "religion": "buddhist"}),
+    (1, {"amenity": "place_of_worship", "religion": "hindu"}),
+    (8, {"shop": "supermarket"}), (14, {"shop": "convenience"}), (3, {"shop": "greengrocer"}),
+    (3, {"shop": "hardware"}), (2, {"shop": "doityourself"}), (3, {"shop": "electronics"}), (1, {"shop": "appliance"}),
+    (6, {"leisure": "fitness_centre"}), (2, {"amenity": "gym"}),
+    (2, {"leisure": "fitness_centre", "sport": "yoga"}), (1, {"leisure": "fitness_centre", "sport": "pilates"}),
+    (1, {"leisure": "fitness_centre", "sport": "crossfit"}), (1, {"leisure": "fitness_centre", "sport": "dance"}),
+    (4, {"leisure": "tennis_court"}), (1, {"leisure": "sports_centre", "sport": "tennis"}),
+    (1, {"leisure": "golf_course"}), (1, {"golf": "driving_range"}),
+]
+
+
+def _jitter(rng: random.Random, lat: float, lng: float, sigma_m: float) -> Tuple[float, float]:
+    west, south, east, north = BBOX
+    lat += rng.gauss(0, sigma_m) / 111_320
+    lng += rng.gauss(0, sigma_m) / (111_320 * math.cos(math.radians(lat)))
+    return min(max(lat, south), north), min(max(lng, west), east)
+
+
+def synthetic_listings(n: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """n Listing records clustered around NEIGHBOURHOODS random centres inside BBOX."""
+    rng = random.Random(seed)
+    west, south, east, north = BBOX
+    centres = [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(NEIGHBOURHOODS)]
+    records = []
+    for i in range(n):
+        lat, lng = _jitter(rng, *rng.choice(centres), NEIGHBOURHOOD_SIGMA_M)
+        lat, lng = round(lat, 6), round(lng, 6)
+        beds = rng.randint(0, 5)
+        sale_type = "rent" if rng.random() < 0.6 else "sale"
+        sqft = rng.randint(300 + 250 * beds, 900 + 450 * beds)
+        price = rng.randint(1500, 12_000) if sale_type == "rent" else rng.randint(250, 2500) * sqft
+        address = f"{rng.randint(1, 999)} {rng.choice(STREETS)}, New York, NY"
+        records.append({
+            "id": f"syn-{i:07d}",
+            "title": rng.choice(TITLES).format(unit=f"{beds}BR" if beds else "Studio"),
+            "address": address,
+            "lat": lat,
+            "lng": lng,
+            "price": price,
+            "sale_type": sale_type,
+            "beds": beds,
+            "baths": rng.randint(1, max(1, beds)),
+            "sqft": sqft,
+            "google_maps_link": f"https://www.google.com/maps/search/?api=1&query={lat},{lng}",
+        })
+    return records
+
+
+def synthetic_elements(n: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """n Overpass JSON elements (nodes with lat/lon, ways with center) of ELEMENT_KINDS inside BBOX."""
+    rng = random.Random(seed)
+    west, south, east, north = BBOX
+    weights = [w for w, _ in ELEMENT_KINDS]
+    kinds = [tags for _, tags in ELEMENT_KINDS]
+    elements = []
+    for i, tags in enumerate(rng.choices(kinds, weights, k=n)):
+        lat, lon = round(rng.uniform(south, north), 7), round(rng.uniform(west, east), 7)
+        tags = dict(tags, name=f"Place {i}")
+        if i % 3:
+            elements.append({"type": "node", "id": i, "lat": lat, "lon": lon, "tags": tags})
+        else:
+            elements.append({"type": "way", "id": i, "center": {"lat": lat, "lon": lon}, "tags": tags})
+    return elements
+
+
+def listings_path(n: int, seed: int = 42) -> str:
+    suffix = "" if seed == 42 else f"_s{seed}"
+    return os.path.join(BACKEND_DIR, f"listings_synthetic_{n}{suffix}.json")
+
+
+def ensure_listings_file(n: int, seed: int = 42, path: Optional[str] = None) -> str:
+    """Path of the synthetic inventory of n listings, generating it on first use."""
+    path = path or listings_path(n, seed)
+    if not os.path.exists(path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(synthetic_listings(n, seed)))
+        os.replace(tmp, path)
+    return path
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, nargs="+", default=[1000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="regenerate files that already exist")
+    args = parser.parse_args()
+    for n in args.listings:
+        path = listings_path(n, args.seed)
+        if args.force and os.path.exists(path):
+            os.remove(path)
+        ensure_listings_file(n, args.seed, path)
+        print(f"{n} listings -> {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main_cli()
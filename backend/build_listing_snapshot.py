@@ -0,0 +1,45 @@
+"""Compile the listing inventory JSON into a memory-mapped columnar snapshot.
+
+The server loads LISTINGS_SNAPSHOT_PATH instead of LISTINGS_PATH when it was compiled
+from that JSON as it is now (the snapshot records the JSON's path, size and mtime): the
+typed columns, ids and spatial index are mapped in place rather than parsed, so workers
+start fast and share the inventory's pages, and rows are only decoded when returned.
+Running servers pick up a rebuilt snapshot, or an edited JSON (served as JSON until the
+snapshot is rebuilt), within LISTINGS_RELOAD_INTERVAL_SECONDS.
+Run from backend/, e.g.:
+
+    python build_listing_snapshot.py --input listings_seed.json --output listings_snapshot.bin
+
+Re-run it whenever the JSON changes (and build_proximity_table.py after it, when used).
+"""
+from __future__ import annotations
+import argparse
+import os
+import time
+
+from listing_snapshot import ListingSnapshot, source_stamp
+from listings_store import LISTING_CELL_M, ListingStore
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Same defaults as main.py, which is not imported: it would load the whole inventory first
+DEFAULT_INPUT = os.getenv("LISTINGS_PATH", os.path.join(BACKEND_DIR, "listings_seed.json"))
+DEFAULT_OUTPUT = os.getenv("LISTINGS_SNAPSHOT_PATH", os.path.join(BACKEND_DIR, "listings_snapshot.bin"))
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default=DEFAULT_INPUT, help="listing JSON (default LISTINGS_PATH)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="snapshot path (default LISTINGS_SNAPSHOT_PATH)")
+    parser.add_argument("--cell-m", type=float, default=LISTING_CELL_M, help="spatial index cell size (meters)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    source = source_stamp(args.input)
+    store = ListingStore.from_json(args.input, dict, cell_m=args.cell_m)
+    ListingSnapshot.write(args.output, store.records, store.columns(), store.index, args.cell_m, source=source)
+    print(f"{len(store)} listings -> {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB, "
+          f"{time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,137 @@
+"""Build or incrementally update the listing -> nearest amenity proximity table.
+
+For every listing and every fine-grained amenity type (each WORSHIP_RELIGION_MAP,
+STORE_TAGS, GYM_TAGS and SPORTS_TAGS key, plus parks) the table stores the distance to
+the nearest matching amenity, up to --max-radius. /api/listings then answers proximity
+filters with radii up to that distance from the table, without calling Overpass.
+Run from backend/, e.g.:
+
+    AMENITY_CACHE_BACKEND=sqlite python build_proximity_table.py --max-radius 5000
+
+Listings are grouped by zoom --area-zoom tiles; each area's amenities are fetched through
+the regular tile cache and hashed. When a table already exists, rows are copied from it
+for listings whose id and coordinates are unchanged in areas whose amenities hash the
+same, so only new or moved listings and areas with changed amenities are recomputed.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional
+
+import orjson
+
+import main
+from geo import GridIndex, Tile, expand_bbox_by_radius, tile_bbox, tile_for
+from overpass import Amenity
+from proximity_table import ProximityTable, empty_column
+
+# Cell size for the per-type amenity indexes used by the nearest-amenity searches
+AMENITY_CELL_M = 250
+
+
+def column_predicate(column: str):
+    """Tag predicate for one table column, e.g. "gyms:yoga_studio"."""
+    cat, _, key = column.partition(":")
+    if cat == "parks":
+        return main.amenity_predicates(True, [], [], [], [])["parks"]
+    args = {"worship": [], "stores": [], "gyms": [], "sports": []}
+    args[cat] = [key]
+    return main.amenity_predicates(False, args["worship"], args["stores"], args["gyms"], args["sports"])[cat]
+
+
+def area_hash(amenities: Dict[str, List[Amenity]]) -> str:
+    """Content hash of an area's amenities, independent of fetch order."""
+    rows = sorted((cat, str(a.id), a.lat, a.lng, sorted(a.tags.items()))
+                  for cat, recs in amenities.items() for a in recs)
+    return hashlib.blake2b(orjson.dumps(rows), digest_size=16).hexdigest()
+
+
+def area_key(tile: Tile) -> str:
+    return "/".join(str(v) for v in tile)
+
+
+async def build(args: argparse.Namespace) -> None:
+    store = main.LISTINGS
+    ids = store.ids()
+    names = main.proximity_table_columns()
+    preds = {name: column_predicate(name) for name in names}
+
+    old: Optional[ProximityTable] = None
+    if os.path.exists(args.output) and not args.full:
+        try:
+            old = ProximityTable.load(args.output)
+        except ValueError as exc:
+            print(f"{exc}, rebuilding everything")
+        if old is not None and (old.max_radius != args.max_radius or old.header.get("area_zoom") != args.area_zoom):
+            print("max radius or area zoom changed, rebuilding everything")
+            old = None
+    old_rows: Dict[str, int] = {}
+    old_areas: Dict[str, str] = {}
+    if old is not None:
+        old_rows = {rid: j for j, rid in enumerate(old.ids())}
+        old_areas = old.header.get("areas", {})
+
+    groups: Dict[Tile, List[int]] = {}
+    for i in range(len(store)):
+        groups.setdefault(tile_for(store.lat[i], store.lng[i], args.area_zoom), []).append(i)
+
+    columns = {name: empty_column(len(ids)) for name in names}
+    areas: Dict[str, str] = {}
+    copied = computed = 0
+    for tile, members in groups.items():
+        expanded = expand_bbox_by_radius(tile_bbox(tile), args.max_radius)
+        amenities = await main.fetch_amenities(expanded, True, list(main.WORSHIP_RELIGION_MAP), list(main.STORE_TAGS),
+                                               list(main.GYM_TAGS), list(main.SPORTS_TAGS))
+        key = area_key(tile)
+        areas[key] = area_hash(amenities)
+        area_unchanged = old is not None and old_areas.get(key) == areas[key]
+
+        todo: List[int] = []
+        for i in members:
+            j = old_rows.get(ids[i])
+            if area_unchanged and j is not None and (old.lat[j], old.lng[j]) == (store.lat[i], store.lng[i]):
+                for name in names:
+                    if name in old.columns:
+                        columns[name][i] = float(old.columns[name][j])
+                    else:
+                        todo.append(i)
+                        break
+                else:
+                    copied += 1
+                    continue
+            else:
+                todo.append(i)
+        if not todo:
+            continue
+
+        for name in names:
+            cat = name.partition(":")[0]
+            pred = preds[name]
+            index = GridIndex(((a.lat, a.lng) for a in amenities[cat] if pred(a)), cell_m=AMENITY_CELL_M)
+            col = columns[name]
+            for i in todo:
+                col[i] = index.nearest(store.lat[i], store.lng[i], args.max_radius)
+        computed += len(todo)
+
+    header = {"max_radius": args.max_radius, "area_zoom": args.area_zoom, "inventory": store.inventory_digest(),
+              "areas": areas, "built_at": time.time()}
+    ProximityTable.write(args.output, header, columns, ids, store.lat, store.lng)
+    print(f"{len(ids)} listings x {len(names)} types -> {args.output} ({computed} computed, {copied} reused, {len(groups)} areas)")
+    await main.get_overpass_client().aclose()
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=main.PROXIMITY_TABLE_PATH, help="table path (default PROXIMITY_TABLE_PATH)")
+    parser.add_argument("--max-radius", type=float, default=5000, help="largest radius the table answers (meters)")
+    parser.add_argument("--area-zoom", type=int, default=12, help="tile zoom listings are grouped by for fetching and hashing")
+    parser.add_argument("--full", action="store_true", help="ignore the existing table and recompute every row")
+    args = parser.parse_args()
+    asyncio.run(build(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,178 @@
+from __future__ import annotations
+import statistics
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from geo import Tile, tile_bbox, tile_for, tile_xy_array
+
+try:  # optional: vectorized precomputation
+    import numpy as np
+except ImportError:
+    np = None
+
+# Clusters are grid cells of 64x64 screen pixels: tiles two zoom levels below the map zoom
+CELL_ZOOM_OFFSET = 2
+# Listing cells are stored once at this tile zoom; any coarser cell is a bit shift away
+BASE_CELL_ZOOM = 24
+MAX_CLUSTER_ZOOM = BASE_CELL_ZOOM - CELL_ZOOM_OFFSET
+
+Cell = Tuple[int, int]
+# Inclusive (x0, y0, x1, y1) block of cells at one zoom
+CellRange = Tuple[int, int, int, int]
+
+
+@dataclass
+class ClusterAgg:
+    """Aggregate of the points in one grid cell."""
+    __slots__ = ("cell", "count", "lat", "lng", "price_min", "price_max", "price_median")
+    cell: Tile  # (z, x, y) of the cell
+    count: int
+    lat: float  # centroid
+    lng: float
+    price_min: Optional[int]
+    price_max: Optional[int]
+    price_median: Optional[float]
+
+
+def cell_zoom(zoom: int) -> int:
+    return zoom + CELL_ZOOM_OFFSET
+
+
+def cell_range(bbox: Tuple[float, float, float, float], zoom: int) -> CellRange:
+    """(x0, y0, x1, y1) of the zoom-level cells covering bbox (west, south, east, north)."""
+    west, south, east, north = bbox
+    z = cell_zoom(zoom)
+    _, x0, y0 = tile_for(north, west, z)
+    _, x1, y1 = tile_for(south, east, z)
+    return x0, y0, x1, y1
+
+
+def cell_range_bbox(cells: CellRange, zoom: int) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) of a block of cells. Its edges also touch the neighbouring
+    cells, so points found in it must still be checked against the range.
+    """
+    z = cell_zoom(zoom)
+    x0, y0, x1, y1 = cells
+    west, _, _, north = tile_bbox((z, x0, y0))
+    _, south, east, _ = tile_bbox((z, x1, y1))
+    return west, south, east, north
+
+
+def aggregate(cell: Tile, lats: Sequence[float], lngs: Sequence[float], prices: Optional[Sequence[int]] = None) -> ClusterAgg:
+    n = len(lats)
+    if prices:
+        return ClusterAgg(cell, n, sum(lats) / n, sum(lngs) / n, min(prices), max(prices), statistics.median(prices))
+    return ClusterAgg(cell, n, sum(lats) / n, sum(lngs) / n, None, None, None)
+
+
+def cluster_points(points: Iterable[Tuple[float, float]], zoom: int) -> List[ClusterAgg]:
+    """Grid clusters (count and centroid) of arbitrary points, e.g. amenities, at a map zoom."""
+    z = cell_zoom(zoom)
+    cells: Dict[Tile, Tuple[List[float], List[float]]] = {}
+    for lat, lng in points:
+        lat_list, lng_list = cells.setdefault(tile_for(lat, lng, z), ([], []))
+        lat_list.append(lat)
+        lng_list.append(lng)
+    return [aggregate(cell, la, ln) for cell, (la, ln) in sorted(cells.items())]
+
+
+class ClusterIndex:
+    """Per-zoom grid cluster hierarchy over a listing inventory.
+
+    Every listing's cell is computed once at BASE_CELL_ZOOM; its cell at any map zoom is
+    that cell shifted right, since grid cells nest like map tiles. For map zooms up to
+    `precompute_max_zoom` the aggregates of every non-empty cell are also precomputed,
+    for all listings and per sale type code, so unfiltered zoomed-out views are served by
+    looking up the cells in the viewport instead of touching individual listings.
+    """
+
+    def __init__(
+        self,
+        lats: Sequence[float],
+        lngs: Sequence[float],
+        prices: Sequence[int],
+        sale_codes: Sequence[int],
+        precompute_max_zoom: int = 12,
+    ):
+        self.lats, self.lngs, self.prices = lats, lngs, prices
+        self.cx = array("I")
+        self.cy = array("I")
+        if np is not None:
+            x, y = tile_xy_array(np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64), BASE_CELL_ZOOM)
+            self.cx.frombytes(x.astype(np.uint32).tobytes())
+            self.cy.frombytes(y.astype(np.uint32).tobytes())
+        else:
+            for lat, lng in zip(lats, lngs):
+                _, x, y = tile_for(lat, lng, BASE_CELL_ZOOM)
+                self.cx.append(x)
+                self.cy.append(y)
+        self.precompute_max_zoom = min(precompute_max_zoom, MAX_CLUSTER_ZOOM)
+        # (map zoom, sale type code or None) -> {cell: aggregate}
+        self.levels: Dict[Tuple[int, Optional[int]], Dict[Cell, ClusterAgg]] = {}
+        groups = [(None, range(len(lats)))]
+        groups += [(code, [i for i, c in enumerate(sale_codes) if c == code]) for code in sorted(set(sale_codes))]
+        for zoom in range(self.precompute_max_zoom + 1):
+            for code, rows in groups:
+                aggs = self._clusters_numpy(rows, zoom) if np is not None else self.clusters(rows, zoom)
+                self.levels[(zoom, code)] = {agg.cell[1:]: agg for agg in aggs}
+
+    def cells(self, rows: Iterable[int], zoom: int, within: Optional[CellRange] = None) -> Dict[Cell, List[int]]:
+        """Row ids grouped by their cell at a map zoom, optionally only cells inside `within`."""
+        shift = BASE_CELL_ZOOM - cell_zoom(zoom)
+        cx, cy = self.cx, self.cy
+        x0, y0, x1, y1 = within if within is not None else (0, 0, 1 << BASE_CELL_ZOOM, 1 << BASE_CELL_ZOOM)
+        out: Dict[Cell, List[int]] = {}
+        for i in rows:
+            x, y = cx[i] >> shift, cy[i] >> shift
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                out.setdefault((x, y), []).append(i)
+        return out
+
+    def clusters(self, rows: Iterable[int], zoom: int, within: Optional[CellRange] = None) -> List[ClusterAgg]:
+        """Aggregates of the given rows per cell, in cell order."""
+        z = cell_zoom(zoom)
+        lats, lngs, prices = self.lats, self.lngs, self.prices
+        return [
+            aggregate((z, x, y), [lats[i] for i in ids], [lngs[i] for i in ids], [prices[i] for i in ids])
+            for (x, y), ids in sorted(self.cells(rows, zoom, within).items())
+        ]
+
+    def precomputed(self, cells: CellRange, zoom: int, sale_code: Optional[int] = None) -> Optional[List[ClusterAgg]]:
+        """Precomputed clusters of a block of cells, or None above precompute_max_zoom."""
+        level = self.levels.get((zoom, sale_code))
+        if level is None:
+            return None if zoom > self.precompute_max_zoom else []
+        x0, y0, x1, y1 = cells
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(level):
+            hits = (level.get((x, y)) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+            return [agg for agg in hits if agg is not None]
+        return [agg for (x, y), agg in sorted(level.items()) if x0 <= x <= x1 and y0 <= y <= y1]
+
+    def _clusters_numpy(self, rows: Sequence[int], zoom: int) -> List[ClusterAgg]:
+        """Same aggregates as `clusters`, computed with one sort per zoom instead of per-row Python."""
+        idx = np.asarray(rows, dtype=np.int64)
+        if len(idx) == 0:
+            return []
+        shift = BASE_CELL_ZOOM - cell_zoom(zoom)
+        x = np.frombuffer(self.cx, dtype=np.uint32)[idx].astype(np.int64) >> shift
+        y = np.frombuffer(self.cy, dtype=np.uint32)[idx].astype(np.int64) >> shift
+        price = np.asarray(self.prices, dtype=np.int64)[idx]
+        # Group by cell with prices ascending inside each group
+        order = np.lexsort((price, y, x))
+        x, y, price = x[order], y[order], price[order]
+        lat = np.asarray(self.lats, dtype=np.float64)[idx][order]
+        lng = np.asarray(self.lngs, dtype=np.float64)[idx][order]
+        starts = np.flatnonzero(np.r_[True, (x[1:] != x[:-1]) | (y[1:] != y[:-1])])
+        counts = np.diff(np.r_[starts, len(x)])
+        lo = starts + (counts - 1) // 2
+        hi = starts + counts // 2
+        median = (price[lo] + price[hi]) / 2
+        lat_mean = np.add.reduceat(lat, starts) / counts
+        lng_mean = np.add.reduceat(lng, starts) / counts
+        z = cell_zoom(zoom)
+        return [
+            ClusterAgg((z, int(x[s]), int(y[s])), int(n), float(la), float(ln), int(price[s]), int(price[s + n - 1]),
+                       float(m) if lo_i != hi_i else int(price[lo_i]))
+            for s, n, la, ln, m, lo_i, hi_i in zip(starts, counts, lat_mean, lng_mean, median, lo, hi)
+        ]
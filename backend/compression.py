@@ -0,0 +1,115 @@
+from __future__ import annotations
+import asyncio
+import gzip
+from typing import Dict, List, Optional, Tuple
+
+try:  # optional: enables Content-Encoding: br (pip install brotli)
+    import brotli
+except ImportError:
+    brotli = None
+
+# Media types worth compressing; everything else (and anything already encoded) passes through
+COMPRESSIBLE_TYPES = ("application/json", "application/octet-stream", "text/")
+# Bodies at least this large are compressed in a worker thread (zlib and brotli release the GIL)
+THREAD_MIN_BYTES = 256 * 1024
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """{coding: q} from an Accept-Encoding header; codings listed without q get 1.0."""
+    prefs: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        prefs[coding] = q
+    return prefs
+
+
+def choose_encoding(header: str, available: Tuple[str, ...]) -> Optional[str]:
+    """Best of `available` (in server preference order) the client accepts, or None."""
+    prefs = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = prefs.get(coding, prefs.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with brotli or gzip per Accept-Encoding.
+
+    Brotli is preferred when the optional `brotli` package is installed and the client
+    accepts it. The response body is buffered before compressing, which suits this API's
+    single-body JSON responses; bodies under `minimum_size` are sent as-is. The default
+    levels favour CPU over ratio: multi-MB search responses are compressed per request.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 1, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.available: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        coding = choose_encoding(accept, self.available) if accept else None
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict] = None
+        chunks: List[bytes] = []
+
+        async def send_compressed(message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            headers = [(k, v) for k, v in start["headers"] if k != b"content-length"]
+            header_names = {k for k, _ in headers}
+            content_type = dict(headers).get(b"content-type", b"").decode("latin-1")
+            if (len(body) >= self.minimum_size and b"content-encoding" not in header_names
+                    and content_type.startswith(COMPRESSIBLE_TYPES)):
+                if len(body) >= THREAD_MIN_BYTES:
+                    body = await asyncio.to_thread(self.compress, body, coding)
+                else:
+                    body = self.compress(body, coding)
+                vary = [v for k, v in headers if k == b"vary"]
+                headers = [(k, v) for k, v in headers if k != b"vary"]
+                headers.append((b"content-encoding", coding.encode()))
+                headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+            headers.append((b"content-length", str(len(body)).encode()))
+            await send(dict(start, headers=headers))
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def compress(self, body: bytes, coding: str) -> bytes:
+        if coding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
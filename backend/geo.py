@@ -0,0 +1,391 @@
+from __future__ import annotations
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:  # optional: only needed for VectorProximityEngine and tile_xy_array
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+EARTH_RADIUS_M = 6371000.0
+# Metres per degree of latitude on the haversine sphere
+M_PER_DEG_LAT = EARTH_RADIUS_M * math.pi / 180.0
+
+# The equirectangular prefilter only ever rejects points, so it must never be
+# tighter than haversine. Using the query latitude for the cos() term is within
+# ~0.3% of haversine for radii up to 20 km below 80 degrees; keep a wide margin
+# and skip the prefilter near the poles.
+_PREFILTER_SLACK = 1.02
+_PREFILTER_MAX_ABS_LAT = 80.0
+
+# Vectorized distances within this many meters of the radius are re-checked with
+# the scalar `haversine_m`, so libm/SIMD rounding differences never flip a result.
+_VECTOR_EXACT_TOL_M = 1e-6
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distance in meters between two WGS84 points."""
+    R = EARTH_RADIUS_M
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+def expand_bbox_by_radius(bbox: Tuple[float, float, float, float], radius_m: int) -> Tuple[float, float, float, float]:
+    west, south, east, north = bbox
+    lat_center = (south + north) / 2.0
+    # approx deg per meter
+    dlat = radius_m / 111_000.0
+    dlng = radius_m / (111_000.0 * max(math.cos(math.radians(lat_center)), 0.01))
+    return (west - dlng, south - dlat, east + dlng, north + dlat)
+
+def search_window_deg(lat: float, radius_m: float) -> Tuple[float, float]:
+    """(dlat, dlng) in degrees such that every point within radius_m of a point at `lat`
+    lies inside lat +- dlat and lng +- dlng. dlng is 180 when the circle reaches a pole.
+    """
+    d = radius_m / EARTH_RADIUS_M
+    dlat = math.degrees(d) * (1 + 1e-9)
+    cos_phi = math.cos(math.radians(lat))
+    if math.sin(d) >= cos_phi:
+        return dlat, 180.0
+    dlng = math.degrees(math.asin(math.sin(d) / cos_phi)) * (1 + 1e-9)
+    return dlat, dlng
+
+
+class GridIndex:
+    """Buckets (lat, lng) points into fixed-size cells for radius queries.
+
+    Candidates are limited to the cells overlapping the query window, pruned by an
+    equirectangular distance check and only then confirmed with `haversine_m`, so
+    `any_within` gives exactly the same answer as a brute-force haversine scan.
+    """
+
+    def __init__(self, points: Iterable[Tuple[float, float]], cell_m: float):
+        self.points: List[Tuple[float, float]] = list(points)
+        self.cell_lat = max(cell_m, 1.0) / M_PER_DEG_LAT
+        if self.points:
+            mean_lat = sum(p[0] for p in self.points) / len(self.points)
+        else:
+            mean_lat = 0.0
+        self.cell_lng = self.cell_lat / max(math.cos(math.radians(mean_lat)), 0.01)
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, (lat, lng) in enumerate(self.points):
+            self.cells.setdefault(self._cell(lat, lng), []).append(i)
+
+    @classmethod
+    def from_cells(
+        cls,
+        points: Sequence[Tuple[float, float]],
+        cell_lat: float,
+        cell_lng: float,
+        cells: Dict[Tuple[int, int], Sequence[int]],
+    ) -> "GridIndex":
+        """Index over cells built earlier with the same points and cell size in degrees,
+        e.g. memory-mapped from a listing snapshot, without re-bucketing every point.
+        """
+        index = cls.__new__(cls)
+        index.points = points  # type: ignore[assignment]
+        index.cell_lat = cell_lat
+        index.cell_lng = cell_lng
+        index.cells = cells  # type: ignore[assignment]
+        return index
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_lat), math.floor(lng / self.cell_lng))
+
+    def candidates(self, lat: float, lng: float, radius_m: float) -> List[int]:
+        """Indices of points in the cells overlapping the search window around (lat, lng).
+
+        The window must not wrap the antimeridian; `any_within` handles that case itself.
+        """
+        dlat, dlng = search_window_deg(lat, radius_m)
+        return self.bbox_candidates(lng - dlng, lat - dlat, lng + dlng, lat + dlat)
+
+    def bbox_candidates(self, west: float, south: float, east: float, north: float) -> List[int]:
+        """Indices of points in the cells overlapping the bbox (a superset of the points inside it)."""
+        if not self.points or west > east or south > north:
+            return []
+        r0, c0 = self._cell(south, west)
+        r1, c1 = self._cell(north, east)
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self.cells):
+            return [i for (r, c), idx in self.cells.items() if r0 <= r <= r1 and c0 <= c <= c1 for i in idx]
+        hits: List[int] = []
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                idx = self.cells.get((r, c))
+                if idx:
+                    hits.extend(idx)
+        return hits
+
+    def any_within(self, lat: float, lng: float, radius_m: float) -> bool:
+        """True if any indexed point is within radius_m meters (haversine) of (lat, lng)."""
+        if not self.points:
+            return False
+        dlat, dlng = search_window_deg(lat, radius_m)
+        if lng - dlng < -180.0 or lng + dlng > 180.0:
+            # Window wraps the antimeridian or covers a pole: fall back to a full scan
+            return any_within_brute(lat, lng, self.points, radius_m)
+        use_prefilter = abs(lat) <= _PREFILTER_MAX_ABS_LAT
+        cos_lat = math.cos(math.radians(lat))
+        max_d2 = (radius_m * _PREFILTER_SLACK / EARTH_RADIUS_M) ** 2
+        points = self.points
+        for i in self.candidates(lat, lng, radius_m):
+            plat, plng = points[i]
+            if abs(plat - lat) > dlat or abs(plng - lng) > dlng:
+                continue
+            if use_prefilter:
+                x = math.radians(plng - lng) * cos_lat
+                y = math.radians(plat - lat)
+                if x * x + y * y > max_d2:
+                    continue
+            if haversine_m(lat, lng, plat, plng) <= radius_m:
+                return True
+        return False
+
+    def nearest(self, lat: float, lng: float, max_radius_m: float) -> float:
+        """Haversine distance to the closest indexed point, or inf if none is within max_radius_m.
+
+        Searches windows of doubling radius, so dense areas only look at nearby cells.
+        """
+        if not self.points:
+            return math.inf
+        radius = min(max(self.cell_lat * M_PER_DEG_LAT, 1.0), max_radius_m)
+        points = self.points
+        while True:
+            dlat, dlng = search_window_deg(lat, radius)
+            if lng - dlng < -180.0 or lng + dlng > 180.0:
+                cands: Iterable[int] = range(len(points))
+            else:
+                cands = self.candidates(lat, lng, radius)
+            best = min((haversine_m(lat, lng, points[i][0], points[i][1]) for i in cands), default=math.inf)
+            # Every point within `radius` was a candidate, so a hit inside it is the global minimum
+            if best <= radius:
+                return best
+            if radius >= max_radius_m:
+                return math.inf
+            radius = min(radius * 2, max_radius_m)
+
+
+def any_within_brute(lat: float, lng: float, points: Sequence[Tuple[float, float]], radius_m: float) -> bool:
+    """Reference implementation of `GridIndex.any_within` (linear haversine scan)."""
+    return any(haversine_m(lat, lng, plat, plng) <= radius_m for plat, plng in points)
+
+
+class VectorProximityEngine:
+    """Batch "any amenity within radius" checks using chunked NumPy haversine.
+
+    Listing coordinates and each category's amenity coordinates are held as contiguous
+    float64 arrays. `run()` returns a boolean mask over the listings that is True where
+    every category has a matching amenity within its radius, identical to calling
+    `GridIndex.any_within` per listing and category.
+
+    Each category's amenities are bucketed into cells at least one search window wide
+    (latitude rows of `dlat`, each split into equal longitude columns wide enough for
+    every latitude the row can be queried from, wrapping at the antimeridian). A listing
+    is compared only with the amenities in the 3 x 3 cells around it, one cell offset at
+    a time (its own cell first) so listings that already matched drop out. Candidate
+    pairs for all listings are generated with array operations, never a per-listing
+    loop, and at most `max_pairs` distances are materialized at once so peak memory
+    stays bounded.
+    """
+
+    # Column keys of one row fit below this, row numbers above it
+    _ROW_STRIDE = 1 << 32
+
+    def __init__(self, lats: Sequence[float], lngs: Sequence[float], max_pairs: int = 1 << 20):
+        if np is None:
+            raise RuntimeError("VectorProximityEngine requires numpy")
+        self.lats = np.ascontiguousarray(lats, dtype=np.float64)
+        self.lngs = np.ascontiguousarray(lngs, dtype=np.float64)
+        self.max_pairs = max(1, max_pairs)
+        self.categories: List[_VectorCells] = []
+
+    def add_category(self, lats: Sequence[float], lngs: Sequence[float], radius_m: float,
+                     mask: Optional["np.ndarray"] = None) -> None:
+        """Require an amenity within radius_m; `mask` selects the amenities whose tags match."""
+        alats = np.ascontiguousarray(lats, dtype=np.float64)
+        alngs = np.ascontiguousarray(lngs, dtype=np.float64)
+        if mask is not None:
+            alats, alngs = alats[mask], alngs[mask]
+        self.categories.append(_VectorCells(alats, alngs, float(radius_m)))
+
+    def run(self) -> "np.ndarray":
+        ok = np.ones(len(self.lats), dtype=bool)
+        for cells in self.categories:
+            idx = np.flatnonzero(ok)
+            if len(idx) == 0:
+                break
+            ok[idx] = self._any_within(idx, cells)
+        return ok
+
+    def _any_within(self, idx: "np.ndarray", cells: "_VectorCells") -> "np.ndarray":
+        hit = np.zeros(len(idx), dtype=bool)
+        if len(cells.keys) == 0:
+            return hit
+        llats, llngs = self.lats[idx], self.lngs[idx]
+        row = cells.row_of(llats)
+        # The listing's own cell first: most listings that pass find a match there and
+        # drop out before the neighbouring cells are scanned
+        for dr, dc in ((0, 0), (0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)):
+            pending = np.flatnonzero(~hit)
+            if len(pending) == 0:
+                break
+            r = row[pending] + dr
+            ncols, width = cells.columns(r)
+            keys = r * self._ROW_STRIDE + (cells.col_of(llngs[pending], ncols, width) + dc) % ncols
+            at = np.minimum(np.searchsorted(cells.keys, keys), len(cells.keys) - 1)
+            present = np.flatnonzero(cells.keys[at] == keys)
+            if len(present) == 0:
+                continue
+            pos, start, count = pending[present], cells.starts[at[present]], cells.counts[at[present]]
+
+            # Expand into (listing, amenity) pairs, at most about max_pairs at a time
+            ends = np.cumsum(count)
+            first = 0
+            while first < len(pos):
+                last = max(first + 1, int(np.searchsorted(ends, ends[first] - count[first] + self.max_pairs, side="right")))
+                n = count[first:last]
+                offsets = np.cumsum(n) - n
+                pair_listing = np.repeat(pos[first:last], n)
+                pair_amenity = np.repeat(start[first:last] - offsets, n) + np.arange(int(n.sum()))
+                self._pair_hits(hit, pair_listing, llats, llngs, cells.lats[pair_amenity], cells.lngs[pair_amenity],
+                                cells.radius)
+                first = last
+        return hit
+
+    @staticmethod
+    def _pair_hits(hit: "np.ndarray", pair_listing: "np.ndarray", llats: "np.ndarray", llngs: "np.ndarray",
+                   alats: "np.ndarray", alngs: "np.ndarray", radius: float) -> None:
+        """Set hit[i] for every listing i with a pair within radius."""
+        llat, llng = llats[pair_listing], llngs[pair_listing]
+        # Same operation order as haversine_m
+        phi1, phi2 = np.radians(llat), np.radians(alats)
+        dphi = np.radians(alats - llat)
+        dlambda = np.radians(alngs - llng)
+        a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+        d = EARTH_RADIUS_M * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
+        hit[pair_listing[d <= radius - _VECTOR_EXACT_TOL_M]] = True
+        border = np.flatnonzero(np.abs(d - radius) <= _VECTOR_EXACT_TOL_M)
+        for k in border.tolist():
+            i = int(pair_listing[k])
+            if not hit[i] and haversine_m(float(llat[k]), float(llng[k]), float(alats[k]), float(alngs[k])) <= radius:
+                hit[i] = True
+
+
+class _VectorCells:
+    """One category's amenities sorted by cell for VectorProximityEngine.
+
+    Rows are `dlat` (the search window) tall, so a listing's window spans at most its own
+    row and the two neighbours. Row r is split into `ncols` equal columns no narrower
+    than the longitude window of any latitude in rows r - 1 .. r + 1, so the window also
+    spans at most three columns; near a pole the whole row is one column.
+    """
+
+    def __init__(self, lats: "np.ndarray", lngs: "np.ndarray", radius: float):
+        self.radius = radius
+        self.dlat, _ = search_window_deg(0.0, radius)
+        self._sin_d = math.sin(radius / EARTH_RADIUS_M)
+        row = self.row_of(lats)
+        ncols, width = self.columns(row)
+        keys = row * VectorProximityEngine._ROW_STRIDE + self.col_of(lngs, ncols, width)
+        order = np.argsort(keys, kind="stable")
+        self.lats, self.lngs = lats[order], lngs[order]
+        self.keys, self.starts, self.counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    def row_of(self, lats: "np.ndarray") -> "np.ndarray":
+        return np.floor((lats + 90.0) / self.dlat).astype(np.int64)
+
+    def columns(self, rows: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """(column count, column width in degrees) of each row."""
+        edges = np.stack([(rows - 1) * self.dlat - 90.0, (rows + 2) * self.dlat - 90.0])
+        cos_phi = np.cos(np.radians(np.minimum(np.abs(edges).max(axis=0), 90.0)))
+        # Widest longitude window (search_window_deg) of any latitude the row can be queried from
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dlng = np.where(self._sin_d >= cos_phi, 360.0,
+                            np.degrees(np.arcsin(np.minimum(self._sin_d / cos_phi, 1.0))) * (1 + 1e-9))
+        ncols = np.maximum(1, np.floor(360.0 / dlng)).astype(np.int64)
+        return ncols, 360.0 / ncols
+
+    @staticmethod
+    def col_of(lngs: "np.ndarray", ncols: "np.ndarray", width: "np.ndarray") -> "np.ndarray":
+        return np.floor((lngs + 180.0) / width).astype(np.int64) % ncols
+
+
+# -----------------
+# Slippy-map tiles
+# -----------------
+Tile = Tuple[int, int, int]  # (z, x, y)
+
+_MAX_MERCATOR_LAT = 85.05112878
+
+def tile_for(lat: float, lng: float, z: int) -> Tile:
+    """Web-mercator (slippy map) tile containing the point."""
+    n = 1 << z
+    lat = min(max(lat, -_MAX_MERCATOR_LAT), _MAX_MERCATOR_LAT)
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return (z, min(max(x, 0), n - 1), min(max(y, 0), n - 1))
+
+def tile_xy_array(lats: "np.ndarray", lngs: "np.ndarray", z: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Vectorized `tile_for`: tile x and y arrays for arrays of points (needs numpy)."""
+    n = 1 << z
+    lats = np.clip(lats, -_MAX_MERCATOR_LAT, _MAX_MERCATOR_LAT)
+    x = ((lngs + 180.0) / 360.0 * n).astype(np.int64)
+    y = ((1.0 - np.arcsinh(np.tan(np.radians(lats))) / np.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+def tile_bbox(tile: Tile) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) of a tile."""
+    z, x, y = tile
+    n = 1 << z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return (west, south, east, north)
+
+def tiles_covering(bbox: Tuple[float, float, float, float], z: int) -> List[Tile]:
+    """All zoom-z tiles intersecting bbox (west, south, east, north)."""
+    west, south, east, north = bbox
+    _, x0, y0 = tile_for(north, max(west, -180.0), z)
+    _, x1, y1 = tile_for(south, min(east, 180.0), z)
+    return [(z, x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+def merge_tiles(tiles: Iterable[Tile]) -> List[Tuple[float, float, float, float]]:
+    """Merge same-zoom tiles into as few covering rectangles as a row/column sweep finds,
+    returned as (west, south, east, north) bboxes.
+    """
+    by_zoom: Dict[int, List[Tuple[int, int]]] = {}
+    for z, x, y in tiles:
+        by_zoom.setdefault(z, []).append((y, x))
+    rects: List[Tuple[float, float, float, float]] = []
+    for z, cells in by_zoom.items():
+        # Runs of consecutive x within each row
+        runs: Dict[Tuple[int, int], List[int]] = {}
+        cells.sort()
+        start = prev = None
+        row = None
+        for y, x in cells + [(None, None)]:
+            if row == y and prev is not None and x == prev + 1:
+                prev = x
+                continue
+            if row is not None:
+                runs.setdefault((start, prev), []).append(row)
+            row, start, prev = y, x, x
+        # Stack identical runs from consecutive rows into rectangles
+        for (x0, x1), rows in runs.items():
+            top = bottom = rows[0]
+            for y in rows[1:] + [None]:
+                if y is not None and y == bottom + 1:
+                    bottom = y
+                    continue
+                w, _, _, n = tile_bbox((z, x0, top))
+                _, s, e, _ = tile_bbox((z, x1, bottom))
+                rects.append((w, s, e, n))
+                top = bottom = y
+    return rects
@@ -0,0 +1,175 @@
+from __future__ import annotations
+import mmap
+import os
+import time
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import orjson
+
+from geo import GridIndex
+import mapped_file
+from mapped_file import blob_sections, map_sections, write_sections
+
+# mapped_file sections (write_sections) with magic b"LSNP":
+#   one typed column per entry of header["columns"] (ListingStore.columns: lat, lng, price, ...);
+#   a column named like a row field also supplies that field's value when rows are decoded
+#   id.offsets (q, n + 1) / id.data (B): listing ids, UTF-8
+#   rest.offsets (q, n + 1) / rest.data (B): every other field of each row as an orjson object
+#   cell.keys (i, 2 per cell) / cell.starts (q, cells + 1) / cell.rows (I, n): the GridIndex
+#   buckets of (lat, lng), rows grouped by cell
+# header["source"] is the source_stamp of the JSON the snapshot was compiled from.
+MAGIC = b"LSNP"
+VERSION = 2
+
+
+def source_stamp(path: str) -> Dict[str, Any]:
+    """Resolved path, size and mtime of a listing JSON; take it before reading the file."""
+    st = os.stat(path)
+    return {"path": os.path.realpath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+class _Points(Sequence):
+    """(lat, lng) pairs read from two columns on access, for GridIndex.points."""
+
+    def __init__(self, lat: Sequence[float], lng: Sequence[float]):
+        self.lat, self.lng = lat, lng
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def __getitem__(self, i):  # type: ignore[override]
+        if isinstance(i, slice):
+            return [(self.lat[j], self.lng[j]) for j in range(*i.indices(len(self)))]
+        return self.lat[i], self.lng[i]
+
+    def __iter__(self) -> Iterator[Tuple[float, float]]:
+        return zip(self.lat, self.lng)
+
+
+class SnapshotRecords(Sequence):
+    """Listing rows of a snapshot as dicts, decoded on access.
+
+    Typed fields come from the columns, the id from its string section and everything
+    else from the row's orjson blob; keys follow the field order of the source JSON.
+    """
+
+    def __init__(self, fields: List[str], columns: Dict[str, Sequence], sections: Dict[str, memoryview]):
+        self.fields = fields
+        self.columns = columns
+        self._id_offsets, self._id_data = sections["id.offsets"], sections["id.data"]
+        self._rest_offsets, self._rest_data = sections["rest.offsets"], sections["rest.data"]
+
+    def __len__(self) -> int:
+        return len(self._id_offsets) - 1
+
+    def __getitem__(self, i):  # type: ignore[override]
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        rest = orjson.loads(self._rest_data[self._rest_offsets[i]:self._rest_offsets[i + 1]])
+        row: Dict[str, Any] = {}
+        for name in self.fields:
+            if name == "id":
+                row[name] = self.id(i)
+            elif name in self.columns:
+                row[name] = self.columns[name][i]
+            elif name in rest:
+                row[name] = rest.pop(name)
+        row.update(rest)
+        return row
+
+    def id(self, i: int) -> str:
+        return str(self._id_data[self._id_offsets[i]:self._id_offsets[i + 1]], "utf-8")
+
+    def ids(self) -> List[str]:
+        offsets, data = self._id_offsets, self._id_data
+        return [str(data[offsets[i]:offsets[i + 1]], "utf-8") for i in range(len(self))]
+
+
+class ListingSnapshot:
+    """Memory-mapped, columnar compiled listing inventory (see build_listing_snapshot.py).
+
+    Loading maps the file and wraps its sections in memoryviews, so nothing is parsed up
+    front and worker processes mapping the same file share its pages through the OS page
+    cache. `records` decodes a row only when it is accessed, and the listing GridIndex is
+    rebuilt from its stored cells instead of re-bucketing every listing.
+    """
+
+    def __init__(self, header: Dict, sections: Dict[str, memoryview], mm: Optional[mmap.mmap] = None):
+        self.header = header
+        self.sections = sections
+        self.columns: Dict[str, Sequence] = {name: sections[name] for name in header["columns"]}
+        self.records = SnapshotRecords(header["fields"], self.columns, sections)
+        self._mm = mm
+
+    def __len__(self) -> int:
+        return self.header["rows"]
+
+    @staticmethod
+    def read_header(path: str) -> Dict:
+        """The header alone, without mapping the sections."""
+        return mapped_file.read_header(path, MAGIC, VERSION, "listing snapshot")
+
+    @classmethod
+    def stale_reason(cls, path: str, source: str) -> Optional[str]:
+        """Why the snapshot at `path` can't stand in for the listing JSON at `source`, or None
+        if it was compiled from that file as it is now (or the file is gone).
+        """
+        try:
+            built_from = cls.read_header(path)["source"]
+        except (OSError, ValueError) as exc:
+            return str(exc)
+        if built_from.get("path") != os.path.realpath(source):
+            return f"{path} was built from {built_from.get('path') or 'an unrecorded source'}, not {source}"
+        if os.path.exists(source) and built_from != source_stamp(source):
+            return f"{source} has changed since {path} was built"
+        return None
+
+    @classmethod
+    def load(cls, path: str) -> "ListingSnapshot":
+        header, sections, mm = map_sections(path, MAGIC, VERSION, "listing snapshot")
+        return cls(header, sections, mm)
+
+    @staticmethod
+    def write(path: str, records: Sequence[Dict[str, Any]], columns: Dict[str, "array"], index: GridIndex,
+              cell_m: float, source: Optional[Dict[str, Any]] = None) -> None:
+        """Write atomically (see mapped_file.write_file). `columns` and `index` must be the
+        typed columns and GridIndex built from `records`, and `source` the source_stamp of
+        the JSON they were read from.
+        """
+        fields: Dict[str, None] = {}
+        ids, rest = [], []
+        for r in records:
+            fields.update(dict.fromkeys(r))
+            ids.append(str(r["id"]).encode())
+            rest.append(orjson.dumps({k: v for k, v in r.items() if k != "id" and k not in columns}))
+
+        sections: Dict[str, array] = dict(columns)
+        sections.update(blob_sections("id", ids))
+        sections.update(blob_sections("rest", rest))
+        keys, starts, rows = array("i"), array("q", [0]), array("I")
+        for cell, members in sorted(index.cells.items()):
+            keys.extend(cell)
+            rows.extend(members)
+            starts.append(len(rows))
+        sections.update({"cell.keys": keys, "cell.starts": starts, "cell.rows": rows})
+
+        header = {"rows": len(records), "fields": list(fields), "columns": list(columns),
+                  "grid": {"cell_m": cell_m, "cell_lat": index.cell_lat, "cell_lng": index.cell_lng},
+                  "source": source or {}, "built_at": time.time()}
+        write_sections(path, MAGIC, VERSION, header, sections)
+
+    def ids(self) -> List[str]:
+        return self.records.ids()
+
+    def grid_index(self, cell_m: float) -> Optional[GridIndex]:
+        """The stored listing GridIndex if it was built with `cell_m`, else None."""
+        grid = self.header["grid"]
+        if grid["cell_m"] != cell_m:
+            return None
+        keys, starts, rows = self.sections["cell.keys"], self.sections["cell.starts"], self.sections["cell.rows"]
+        cells = {(keys[2 * j], keys[2 * j + 1]): rows[starts[j]:starts[j + 1]] for j in range(len(starts) - 1)}
+        points = _Points(self.columns["lat"], self.columns["lng"])
+        return GridIndex.from_cells(points, grid["cell_lat"], grid["cell_lng"], cells)
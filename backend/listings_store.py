@@ -0,0 +1,231 @@
+from __future__ import annotations
+import hashlib
+import heapq
+import math
+from array import array
+from typing import Any, Callable, Dict, Generic, List, Literal, Optional, Sequence, Tuple, TypeVar
+
+import orjson
+
+from clusters import ClusterIndex
+from geo import GridIndex, haversine_m
+from listing_snapshot import ListingSnapshot, SnapshotRecords, source_stamp
+
+T = TypeVar("T")
+
+SALE_TYPE_CODES = {"sale": 0, "rent": 1}
+# Spatial index cell size for listing coordinates
+LISTING_CELL_M = 1000
+# Sort orders understood by ListingStore.sort_key; "default" is inventory order
+# (reversed when descending)
+SortField = Literal["default", "price", "sqft", "distance", "price_per_sqft"]
+# Rows are proximity-checked in batches of at least this many while filling a page
+MIN_CHECK_BATCH = 32
+
+# A row's position in a sort order: (key, row id); the row id breaks ties deterministically
+SortPosition = Tuple[float, int]
+
+
+class ListingStore(Generic[T]):
+    """Column-oriented, spatially indexed listing inventory.
+
+    Filterable fields live in typed arrays (lat, lng, price, beds, baths, sqft and a
+    sale_type code) and (lat, lng) is bucketed in a GridIndex, so `query` answers a bbox
+    plus attribute predicates in one pass over the index hits and returns row ids.
+    Row objects are only built by `row_factory` (e.g. the pydantic `Listing` model)
+    for the rows that are actually returned. `from_snapshot` opens a compiled
+    ListingSnapshot instead of JSON, keeping the columns and index memory-mapped.
+    """
+
+    def __init__(
+        self,
+        records: Sequence[Dict[str, Any]],
+        row_factory: Callable[..., T],
+        cell_m: float = LISTING_CELL_M,
+        columns: Optional[Dict[str, Sequence]] = None,
+        index: Optional[GridIndex] = None,
+        source: Optional[Dict[str, Any]] = None,
+    ):
+        """`columns` (as returned by `columns()`) and `index` may be passed ready-made, e.g.
+        memory-mapped from a ListingSnapshot; `records` is then used as given, lazily.
+        `source` is the source_stamp of the listing JSON the rows come from.
+        """
+        self.records = list(records) if columns is None else records
+        self.row_factory = row_factory
+        if columns is None:
+            columns = {
+                "lat": array("d", (float(r["lat"]) for r in self.records)),
+                "lng": array("d", (float(r["lng"]) for r in self.records)),
+                "price": array("q", (int(r["price"]) for r in self.records)),
+                "beds": array("i", (int(r["beds"]) for r in self.records)),
+                "baths": array("i", (int(r["baths"]) for r in self.records)),
+                "sqft": array("i", (int(r["sqft"]) for r in self.records)),
+                "sale_code": array("b", (SALE_TYPE_CODES[r["sale_type"]] for r in self.records)),
+            }
+        self.lat, self.lng = columns["lat"], columns["lng"]
+        self.price, self.beds, self.baths, self.sqft = columns["price"], columns["beds"], columns["baths"], columns["sqft"]
+        self.sale_type = columns["sale_code"]
+        self.cell_m = cell_m
+        self.index = index if index is not None else GridIndex(zip(self.lat, self.lng), cell_m=cell_m)
+        self._clusters: Optional[ClusterIndex] = None
+        self._digest: Optional[str] = None
+        # Identifies the inventory (row ids and values) across reloads and worker processes:
+        # a JSON store and the snapshot compiled from it share it
+        self.version = hashlib.blake2b(orjson.dumps(source or {}), digest_size=8).hexdigest()
+
+    @classmethod
+    def from_json(cls, path: str, row_factory: Callable[..., T], cell_m: float = LISTING_CELL_M) -> "ListingStore[T]":
+        source = source_stamp(path)
+        with open(path, "rb") as f:
+            return cls(orjson.loads(f.read()), row_factory, cell_m, source=source)
+
+    @classmethod
+    def from_snapshot(cls, path: str, row_factory: Callable[..., T], cell_m: float = LISTING_CELL_M) -> "ListingStore[T]":
+        """Store over a memory-mapped ListingSnapshot: columns and spatial index are used in
+        place and rows are only decoded when they are returned.
+        """
+        snapshot = ListingSnapshot.load(path)
+        return cls(snapshot.records, row_factory, cell_m, columns=snapshot.columns, index=snapshot.grid_index(cell_m),
+                   source=snapshot.header.get("source"))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def columns(self) -> Dict[str, Sequence]:
+        """The typed columns by name, sale_code being the SALE_TYPE_CODES value of sale_type."""
+        return {"lat": self.lat, "lng": self.lng, "price": self.price, "beds": self.beds, "baths": self.baths,
+                "sqft": self.sqft, "sale_code": self.sale_type}
+
+    def ids(self) -> List[str]:
+        if isinstance(self.records, SnapshotRecords):
+            return self.records.ids()
+        return [r["id"] for r in self.records]
+
+    def inventory_digest(self) -> str:
+        """Hash of the listing ids and coordinates in row order, the same for a JSON store
+        and its snapshot. Computed once per store.
+        """
+        if self._digest is None:
+            h = hashlib.blake2b(orjson.dumps([str(i) for i in self.ids()]), digest_size=16)
+            h.update(array("d", self.lat))
+            h.update(array("d", self.lng))
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def row(self, i: int) -> T:
+        return self.row_factory(**self.records[i])
+
+    def rows(self, ids: Sequence[int]) -> List[T]:
+        return [self.row(i) for i in ids]
+
+    def row_dicts(self, ids: Sequence[int], fields: Sequence[str], defaults: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Plain dicts of `fields` for serializing rows without building row objects.
+        Numeric fields come from the typed columns, the rest from the records (or `defaults`).
+        """
+        columns = {"lat": self.lat, "lng": self.lng, "price": self.price, "beds": self.beds,
+                   "baths": self.baths, "sqft": self.sqft}
+        getters = [(f, columns.get(f), defaults.get(f)) for f in fields]
+        from_records = any(col is None for _, col, _ in getters)
+        records = self.records
+        out = []
+        for i in ids:
+            rec = records[i] if from_records else None  # decoded once per row on snapshot-backed stores
+            out.append({f: col[i] if col is not None else rec.get(f, default) for f, col, default in getters})
+        return out
+
+    def query(
+        self,
+        bbox: Tuple[float, float, float, float],
+        sale_type: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        min_beds: Optional[int] = None,
+        min_baths: Optional[int] = None,
+    ) -> List[int]:
+        """Row ids inside bbox (west, south, east, north) matching every given predicate,
+        in inventory order.
+        """
+        west, south, east, north = bbox
+        lat, lng, price, beds, baths = self.lat, self.lng, self.price, self.beds, self.baths
+        sale_code = self.sale_type
+        want_sale = SALE_TYPE_CODES.get(sale_type) if sale_type and sale_type != "any" else None
+        lo_price = min_price if min_price is not None else float("-inf")
+        hi_price = max_price if max_price is not None else float("inf")
+        lo_beds = min_beds if min_beds is not None else float("-inf")
+        lo_baths = min_baths if min_baths is not None else float("-inf")
+
+        hits = [
+            i for i in self.index.bbox_candidates(west, south, east, north)
+            if west <= lng[i] <= east and south <= lat[i] <= north
+            and (want_sale is None or sale_code[i] == want_sale)
+            and lo_price <= price[i] <= hi_price
+            and beds[i] >= lo_beds and baths[i] >= lo_baths
+        ]
+        hits.sort()
+        return hits
+
+    def cluster_index(self, precompute_max_zoom: int) -> ClusterIndex:
+        """Per-zoom listing clusters, built on first use (clustering costs nothing until asked for)."""
+        if self._clusters is None or self._clusters.precompute_max_zoom != precompute_max_zoom:
+            self._clusters = ClusterIndex(self.lat, self.lng, self.price, self.sale_type, precompute_max_zoom)
+        return self._clusters
+
+    def sort_key(self, sort: SortField, descending: bool = False,
+                 center: Optional[Tuple[float, float]] = None) -> Callable[[int], float]:
+        """Key function over row ids for a SortField order. "distance" is measured from
+        center (lat, lng); listings without a usable sqft sort last by price per sqft.
+        """
+        sign = -1.0 if descending else 1.0
+        if sort == "default":
+            return (lambda i: -float(i)) if descending else (lambda i: 0.0)
+        if sort == "price":
+            price = self.price
+            return lambda i: sign * price[i]
+        if sort == "sqft":
+            sqft = self.sqft
+            return lambda i: sign * sqft[i]
+        if sort == "price_per_sqft":
+            price, sqft = self.price, self.sqft
+            return lambda i: sign * price[i] / sqft[i] if sqft[i] > 0 else math.inf
+        if sort == "distance":
+            if center is None:
+                raise ValueError("distance sort needs a center")
+            lat, lng = self.lat, self.lng
+            clat, clng = center
+            return lambda i: sign * haversine_m(clat, clng, lat[i], lng[i])
+        raise ValueError(f"Unknown sort: {sort!r}")
+
+
+def select_page(
+    rows: Sequence[int],
+    key: Callable[[int], float],
+    limit: int,
+    check: Optional[Callable[[List[int]], List[bool]]] = None,
+    after: Optional[SortPosition] = None,
+) -> Tuple[List[int], Optional[SortPosition]]:
+    """The first `limit` rows in (key, row id) order that come after `after` and pass `check`.
+
+    Candidates are heapified rather than fully sorted and popped in order, and `check`
+    (e.g. the proximity filter) only sees batches of popped rows until the page is full,
+    so a dense viewport costs about a page of checks, not one per candidate. Returns the
+    page and the position of its last row when more matching rows follow, else None.
+    """
+    heap = [(key(i), i) for i in rows]
+    if after is not None:
+        heap = [pos for pos in heap if pos > after]
+    heapq.heapify(heap)
+    page: List[SortPosition] = []
+    size = MIN_CHECK_BATCH
+    while heap and len(page) <= limit:
+        # One row beyond the page tells whether there is a next page; batches grow so a
+        # low pass rate doesn't mean many tiny checks
+        want = limit + 1 - len(page)
+        batch = [heapq.heappop(heap) for _ in range(min(len(heap), max(want, size)))]
+        size *= 2
+        if check is None:
+            page.extend(batch)
+        else:
+            page.extend(pos for pos, ok in zip(batch, check([i for _, i in batch])) if ok)
+    more = len(page) > limit
+    page = page[:limit]
+    return [i for _, i in page], (page[-1] if more and page else None)
@@ -1,24 +1,104 @@
 from __future__ import annotations
-import math
+import asyncio
+import base64
+import binascii
+import hashlib
 import os
-from typing import List, Literal, Optional, Dict, Any, Tuple, Set
+import time
+import warnings
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Callable, Iterable, List, Literal, NamedTuple, Optional, Dict, Any, Sequence, Tuple, Set
 
-import httpx
-from fastapi import FastAPI, Query
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field
-from cachetools import TTLCache
-import orjson
+
+from geo import (GridIndex, Tile, VectorProximityEngine, expand_bbox_by_radius,
+                 merge_tiles, tile_for, tiles_covering)
+from amenity_cache import AmenityCache, CachedEntry, make_amenity_cache
+from compression import CompressionMiddleware
+from clusters import MAX_CLUSTER_ZOOM, ClusterAgg, cell_range, cell_range_bbox, cluster_points
+from metrics import NULL_TIMER, Histogram, StageTimer, render_counter
+from listing_snapshot import ListingSnapshot
+from listings_store import SALE_TYPE_CODES, ListingStore, SortField, SortPosition, select_page
+from overpass import Amenity, OverpassClient, element_to_amenity
+from proximity_table import ProximityTable
+
+try:  # optional: enables PROXIMITY_ENGINE=numpy
+    import numpy as np
+except ImportError:
+    np = None
 
 # -----------------
 # Config
 # -----------------
 OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+# Comma-separated mirrors tried in turn when one fails or rate-limits us
+OVERPASS_URLS = [u.strip() for u in os.getenv("OVERPASS_URLS", OVERPASS_URL).split(",") if u.strip()]
+OVERPASS_TIMEOUT = float(os.getenv("OVERPASS_TIMEOUT", "30"))
+# Max upstream queries in flight per worker; also sizes the connection pool
+OVERPASS_MAX_CONCURRENCY = int(os.getenv("OVERPASS_MAX_CONCURRENCY", "4"))
+OVERPASS_MAX_RETRIES = int(os.getenv("OVERPASS_MAX_RETRIES", "3"))
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+OVERPASS_HTTP2 = os.getenv("OVERPASS_HTTP2", "0") == "1"
 CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300")) # 5 minutes
+# Soft TTL is CACHE_TTL_SECONDS: older tiles are still served but refreshed in the background.
+# Hard TTL: tiles older than this are dropped and must be fetched on the request path.
+CACHE_HARD_TTL_SECONDS = int(os.getenv("CACHE_HARD_TTL_SECONDS", "86400")) # 1 day
+# Hot-tile refresher: every interval, refresh the most requested tiles that are close to going stale
+HOT_REFRESH_INTERVAL_SECONDS = int(os.getenv("HOT_REFRESH_INTERVAL_SECONDS", "60"))
+HOT_REFRESH_MAX_TILES = int(os.getenv("HOT_REFRESH_MAX_TILES", "256"))
 MAX_LISTINGS = 500
+# Compress responses (brotli if installed, else gzip) per Accept-Encoding; bodies under the minimum go as-is
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "1") == "1"
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "1"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+# Listing inventory JSON (a list of Listing records), e.g. a synthetic set from bench/synthetic.py
+LISTINGS_PATH = os.getenv("LISTINGS_PATH", os.path.join(os.path.dirname(__file__), "listings_seed.json"))
+# Compiled listing snapshot (build_listing_snapshot.py); memory-mapped instead of loading LISTINGS_PATH when it
+# was built from that file as it is now
+LISTINGS_SNAPSHOT_PATH = os.getenv("LISTINGS_SNAPSHOT_PATH", os.path.join(os.path.dirname(__file__), "listings_snapshot.bin"))
+# How often to check the listing source and proximity table for a new version to swap in (0 disables)
+LISTINGS_RELOAD_INTERVAL_SECONDS = int(os.getenv("LISTINGS_RELOAD_INTERVAL_SECONDS", "10"))
+# Per-stage latency histograms and counters on GET /metrics (0 disables stage timing entirely)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Add a Server-Timing header with the stage breakdown to search responses
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+# /api/clusters precomputes per-cell listing aggregates for map zooms up to this one
+CLUSTER_PRECOMPUTE_MAX_ZOOM = int(os.getenv("CLUSTER_PRECOMPUTE_MAX_ZOOM", "12"))
+# "grid" (pure Python spatial index) or "numpy" (vectorized batch haversine, needs numpy)
+PROXIMITY_ENGINE = os.getenv("PROXIMITY_ENGINE", "grid")
+# Precomputed listing -> nearest amenity table (build_proximity_table.py); used when present
+PROXIMITY_TABLE_PATH = os.getenv("PROXIMITY_TABLE_PATH", os.path.join(os.path.dirname(__file__), "proximity_table.bin"))
 
-# Cache amenities per key: (bbox_key, tuple(sorted(categories))) -> list of amenities
-amenities_cache: TTLCache = TTLCache(maxsize=256, ttl=CACHE_TTL_SECONDS)
+# Amenities are cached per slippy-map tile at this zoom (~1.5-2.4 km tiles at z14)
+AMENITY_TILE_ZOOM = int(os.getenv("AMENITY_TILE_ZOOM", "14"))
+# Zoomed-out viewports fall back to coarser tiles so one request never needs more than this
+MAX_TILES_PER_REQUEST = int(os.getenv("MAX_TILES_PER_REQUEST", "256"))
+
+# "memory" (per process) or "sqlite" (on disk, shared by all workers, survives restarts)
+AMENITY_CACHE_BACKEND = os.getenv("AMENITY_CACHE_BACKEND", "memory")
+AMENITY_CACHE_PATH = os.getenv("AMENITY_CACHE_PATH", "")
+
+# Cache hit / stale-hit / miss, eviction, upstream request and coalescing counters,
+# served by /api/amenity_stats and /metrics
+amenity_stats: Counter = Counter()
+# Cache amenities per key: (category tag set, tile) -> {category: list of amenities}
+amenities_cache: AmenityCache = make_amenity_cache(AMENITY_CACHE_BACKEND, int(os.getenv("AMENITY_CACHE_TILES", "8192")),
+                                                   CACHE_HARD_TTL_SECONDS, AMENITY_CACHE_PATH, stats=amenity_stats)
+# Tiles currently being fetched, same keys as amenities_cache; concurrent requests await these
+_inflight_tiles: Dict[Tuple, "asyncio.Future[Dict[str, List[Amenity]]]"] = {}
+_background_tasks: Set[asyncio.Task] = set()
+# Request counts per cache key, decayed each refresher round
+_hot_tiles: Counter = Counter()
+# Search pipeline counters (requests, candidate / proximity-checked / returned rows), served by /metrics
+search_stats: Counter = Counter()
+stage_seconds = Histogram("realestate_stage_seconds", "Wall time per search pipeline stage", ("endpoint", "stage"))
+overpass_seconds = Histogram("realestate_overpass_request_seconds", "Wall time per Overpass request attempt", ("status",))
 
 # -----------------
 # Data models
@@ -38,32 +118,30 @@ class Listing(BaseModel):
     sqft: int
     google_maps_link: str = ""
 
+class Cluster(BaseModel):
+    id: str  # grid cell "z/x/y"
+    count: int
+    lat: float  # centroid
+    lng: float
+    price_min: Optional[int] = None
+    price_max: Optional[int] = None
+    price_median: Optional[float] = None
+
+class ClustersResponse(BaseModel):
+    zoom: int
+    listings: List[Cluster]
+    amenities: Dict[str, List[Cluster]]
+
 class SearchResponse(BaseModel):
     listings: List[Listing]
     amenities_used: Dict[str, list]
+    # Pass as `cursor` (with the same filters and sort) to get the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 # -----------------
 # Utilities
 # -----------------
 
-def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Distance in meters between two WGS84 points."""
-    R = 6371000.0
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
-def expand_bbox_by_radius(bbox: Tuple[float, float, float, float], radius_m: int) -> Tuple[float, float, float, float]:
-    west, south, east, north = bbox
-    lat_center = (south + north) / 2.0
-    # approx deg per meter
-    dlat = radius_m / 111_000.0
-    dlng = radius_m / (111_000.0 * max(math.cos(math.radians(lat_center)), 0.01))
-    return (west - dlng, south - dlat, east + dlng, north + dlat)
-
 # Map UI strings to OSM tags
 WORSHIP_RELIGION_MAP = {
     "synagogue": "jewish",
@@ -101,17 +179,275 @@ SPORTS_TAGS = {
     "golf_course": ["golf_course", "golf"],
 }
 
+AmenityPredicate = Callable[[Amenity], bool]
+
+def amenity_predicates(
+    need_parks: bool,
+    worship_types: List[str],
+    store_types: List[str],
+    gym_types: List[str],
+    sports_types: List[str],
+) -> Dict[str, AmenityPredicate]:
+    """Tag predicates for each category the search must satisfy.
+    A listing passes when, for every returned category, some amenity matching the
+    predicate lies within that category's radius.
+    """
+    preds: Dict[str, AmenityPredicate] = {}
+
+    if need_parks:
+        preds["parks"] = lambda a: True
+    if worship_types and worship_types != ['']:
+        religions = {WORSHIP_RELIGION_MAP.get(w, w) for w in worship_types}
+        preds["worship"] = lambda a: a.tags.get("religion") in religions
+    if store_types and store_types != ['']:
+        allowed_shops: Set[str] = set()
+        for k in store_types:
+            allowed_shops.update(STORE_TAGS.get(k, []))
+        preds["stores"] = lambda a: a.tags.get("shop") in allowed_shops
+    if gym_types and gym_types != ['']:
+        allowed_gyms: Set[str] = set()
+        for k in gym_types:
+            allowed_gyms.update(GYM_TAGS.get(k, []))
+        preds["gyms"] = lambda a: (a.tags.get("amenity") in allowed_gyms or a.tags.get("leisure") in allowed_gyms or
+                                   (a.tags.get("leisure") == "fitness_centre" and a.tags.get("sport") in allowed_gyms))
+    if sports_types and sports_types != ['']:
+        allowed_sports: Set[str] = set()
+        golf_driving_range_requested = False
+        for k in sports_types:
+            if k == "golf_driving_range":
+                golf_driving_range_requested = True
+            else:
+                allowed_sports.update(SPORTS_TAGS.get(k, []))
+
+        def sports_match(a):
+            if golf_driving_range_requested and a.tags.get("golf") == "driving_range":
+                return True
+            return (a.tags.get("leisure") in allowed_sports or
+                   (a.tags.get("leisure") == "sports_centre" and a.tags.get("sport") in allowed_sports))
+
+        preds["sports"] = sports_match
+
+    return preds
+
+def proximity_table_columns() -> List[str]:
+    """Every fine-grained amenity type the proximity table stores a column for."""
+    return (["parks"] + [f"worship:{k}" for k in WORSHIP_RELIGION_MAP] + [f"stores:{k}" for k in STORE_TAGS] +
+            [f"gyms:{k}" for k in GYM_TAGS] + [f"sports:{k}" for k in SPORTS_TAGS])
+
+def proximity_table_selection(
+    need_parks: bool,
+    worship_types: List[str],
+    store_types: List[str],
+    gym_types: List[str],
+    sports_types: List[str],
+) -> Dict[str, List[str]]:
+    """Table columns for each category amenity_predicates would check. A category passes
+    when the nearest amenity of any of its columns is within the radius.
+    """
+    selected = {"parks": [] if need_parks else None, "worship": worship_types, "stores": store_types,
+                "gyms": gym_types, "sports": sports_types}
+    cats = amenity_predicates(need_parks, worship_types, store_types, gym_types, sports_types)
+    return {cat: ["parks"] if cat == "parks" else [f"{cat}:{k}" for k in selected[cat]] for cat in cats}
+
+ProximityCheck = Callable[[Sequence[float], Sequence[float]], List[bool]]
+
+def proximity_check_grid(
+    amenities: Dict[str, List[Amenity]],
+    preds: Dict[str, AmenityPredicate],
+    radii: Dict[str, int],
+) -> ProximityCheck:
+    """Check for (lats, lngs): whether every category in preds has a matching amenity
+    within its radius. The amenity indexes are built once and reused by every call.
+    """
+    # Index only the amenities that satisfy each category's tag predicate so every
+    # listing just probes nearby candidates instead of scanning the whole list.
+    indexes: List[Tuple[GridIndex, int]] = []
+    for cat, pred in preds.items():
+        matching = [(a.lat, a.lng) for a in amenities[cat] if pred(a)]
+        indexes.append((GridIndex(matching, cell_m=radii[cat]), radii[cat]))
+
+    def passes_proximity(lat: float, lng: float) -> bool:
+        return all(index.any_within(lat, lng, radius) for index, radius in indexes)
+
+    return lambda lats, lngs: [passes_proximity(lat, lng) for lat, lng in zip(lats, lngs)]
+
+def proximity_check_numpy(
+    amenities: Dict[str, List[Amenity]],
+    preds: Dict[str, AmenityPredicate],
+    radii: Dict[str, int],
+) -> ProximityCheck:
+    """Same result as proximity_check_grid, computed in batch with VectorProximityEngine."""
+    categories = []
+    for cat, pred in preds.items():
+        items = amenities[cat]
+        m = len(items)
+        # Tag predicates are evaluated once per amenity into a mask, never per pair
+        mask = np.fromiter(map(pred, items), bool, count=m)
+        categories.append((np.fromiter((a.lat for a in items), np.float64, count=m)[mask],
+                           np.fromiter((a.lng for a in items), np.float64, count=m)[mask],
+                           radii[cat]))
+
+    def check(lats: Sequence[float], lngs: Sequence[float]) -> List[bool]:
+        engine = VectorProximityEngine(lats, lngs)
+        for amenity_lats, amenity_lngs, radius in categories:
+            engine.add_category(amenity_lats, amenity_lngs, radius)
+        return engine.run().tolist()
+
+    return check
+
 # -----------------
 # Load seed listings
 # -----------------
-_seed_path = os.path.join(os.path.dirname(__file__), "listings_seed.json")
-with open(_seed_path, "r", encoding="utf-8") as f:
-    LISTINGS: List[Listing] = [Listing(**x) for x in orjson.loads(f.read())]
+def listings_source() -> str:
+    """The snapshot when it was compiled from LISTINGS_PATH as it is now, else the JSON inventory.
+    A snapshot of another or an older JSON is ignored (with a warning), never served.
+    """
+    if LISTINGS_SNAPSHOT_PATH and os.path.exists(LISTINGS_SNAPSHOT_PATH):
+        stale = ListingSnapshot.stale_reason(LISTINGS_SNAPSHOT_PATH, LISTINGS_PATH)
+        if stale is None:
+            return LISTINGS_SNAPSHOT_PATH
+        warnings.warn(f"Ignoring listing snapshot: {stale}; serving {LISTINGS_PATH} (rerun build_listing_snapshot.py)",
+                      RuntimeWarning)
+    return LISTINGS_PATH
+
+def load_listings(path: str) -> ListingStore[Listing]:
+    if path == LISTINGS_SNAPSHOT_PATH:
+        return ListingStore.from_snapshot(path, Listing)
+    return ListingStore.from_json(path, Listing)
+
+LISTINGS: ListingStore[Listing] = load_listings(listings_source())
+
+def load_proximity_table(path: str, store: Optional[ListingStore] = None) -> Optional[ProximityTable]:
+    """The precomputed table if it exists and its rows match `store` (default LISTINGS), else None."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        table = ProximityTable.load(path)
+    except ValueError as exc:
+        warnings.warn(f"Ignoring proximity table: {exc} (rerun build_proximity_table.py)", RuntimeWarning)
+        return None
+    return table if table.matches((store if store is not None else LISTINGS).inventory_digest()) else None
+
+PROXIMITY_TABLE: Optional[ProximityTable] = load_proximity_table(PROXIMITY_TABLE_PATH)
 
 # -----------------
 # FastAPI app
 # -----------------
-app = FastAPI(title="RealEstate Map API")
+async def refresh_hot_tiles() -> int:
+    """Refresh the most requested tiles that will go stale before the next round.
+    Request counts are halved every round so the ranking follows recent traffic.
+    """
+    keys = [key for key, _ in _hot_tiles.most_common(HOT_REFRESH_MAX_TILES)]
+    hits = await cache_get_many(keys)
+    now = time.time()
+    due: Dict[Tuple[Tuple, int], List[Tile]] = {}
+    for key in keys:
+        tag_set, tile = key
+        if key in _inflight_tiles:
+            continue
+        hit = hits.get(key)
+        if hit is None or now - hit.fetched_at >= CACHE_TTL_SECONDS - HOT_REFRESH_INTERVAL_SECONDS:
+            # Tiles of one batch must share a zoom level
+            due.setdefault((tag_set, tile[0]), []).append(tile)
+    for (tag_set, _), tiles in due.items():
+        amenity_stats["hot_refreshes"] += 1
+        futures = start_tile_fetch(tag_set, tiles)
+        await asyncio.gather(*futures.values(), return_exceptions=True)
+
+    for key, count in list(_hot_tiles.items()):
+        if count < 2:
+            del _hot_tiles[key]
+        else:
+            _hot_tiles[key] = count // 2
+    return sum(len(t) for t in due.values())
+
+async def hot_refresh_loop() -> None:
+    while True:
+        await asyncio.sleep(HOT_REFRESH_INTERVAL_SECONDS)
+        try:
+            await refresh_hot_tiles()
+        except Exception:
+            amenity_stats["hot_refresh_errors"] += 1
+
+def file_version(path: str) -> Optional[Tuple[int, int, int]]:
+    """(inode, size, mtime) of a file, or None if it doesn't exist; changes when it's replaced."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+def inventory_version() -> Tuple:
+    """Changes when the listing JSON, the snapshot or the proximity table is edited or replaced;
+    the reload then picks whichever listing source is current.
+    """
+    return tuple(file_version(path) if path else None
+                 for path in (LISTINGS_PATH, LISTINGS_SNAPSHOT_PATH, PROXIMITY_TABLE_PATH))
+
+async def reload_listings() -> None:
+    """Load the current listing source and proximity table off the event loop, warm the
+    cluster index, then swap both in at once. Requests that started on the old store
+    keep using it (and its mapped snapshot) until they finish.
+    """
+    global LISTINGS, PROXIMITY_TABLE
+    store = await asyncio.to_thread(load_listings, listings_source())
+    table = await asyncio.to_thread(load_proximity_table, PROXIMITY_TABLE_PATH, store)
+    await asyncio.to_thread(store.cluster_index, CLUSTER_PRECOMPUTE_MAX_ZOOM)
+    LISTINGS, PROXIMITY_TABLE = store, table
+    search_stats["inventory_reloads"] += 1
+
+async def listings_reload_loop() -> None:
+    version = inventory_version()
+    while True:
+        await asyncio.sleep(LISTINGS_RELOAD_INTERVAL_SECONDS)
+        current = inventory_version()
+        if current == version:
+            continue
+        try:
+            await reload_listings()
+            version = current
+        except Exception:
+            search_stats["inventory_reload_errors"] += 1
+
+overpass_client: Optional[OverpassClient] = None
+
+def get_overpass_client() -> OverpassClient:
+    """The app-lifetime Overpass client (created on demand outside the app, e.g. warm_cache.py)."""
+    global overpass_client
+    if overpass_client is None:
+        overpass_client = OverpassClient(
+            OVERPASS_URLS,
+            timeout=OVERPASS_TIMEOUT,
+            max_concurrency=OVERPASS_MAX_CONCURRENCY,
+            max_retries=OVERPASS_MAX_RETRIES,
+            http2=OVERPASS_HTTP2,
+            stats=amenity_stats,
+            latency=overpass_seconds if METRICS_ENABLED else None,
+        )
+    return overpass_client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global overpass_client
+    get_overpass_client()
+    refresher = asyncio.create_task(hot_refresh_loop()) if HOT_REFRESH_INTERVAL_SECONDS > 0 else None
+    reloader = asyncio.create_task(listings_reload_loop()) if LISTINGS_RELOAD_INTERVAL_SECONDS > 0 else None
+    # Build the listing cluster hierarchy off the event loop so the first /api/clusters call is fast
+    warm_clusters = asyncio.ensure_future(asyncio.to_thread(LISTINGS.cluster_index, CLUSTER_PRECOMPUTE_MAX_ZOOM))
+    _background_tasks.add(warm_clusters)
+    warm_clusters.add_done_callback(_background_tasks.discard)
+    try:
+        yield
+    finally:
+        if refresher is not None:
+            refresher.cancel()
+        if reloader is not None:
+            reloader.cancel()
+        if overpass_client is not None:
+            await overpass_client.aclose()
+            overpass_client = None
+
+app = FastAPI(title="RealEstate Map API", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -119,6 +455,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if RESPONSE_COMPRESSION:
+    app.add_middleware(CompressionMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_BYTES,
+                       gzip_level=RESPONSE_GZIP_LEVEL, brotli_quality=RESPONSE_BROTLI_QUALITY)
 
 # -----------------
 # Overpass helpers
@@ -135,24 +474,40 @@ def build_overpass_query(
     gym_types: List[str],
     sports_types: List[str],
 ) -> Tuple[str, List[str]]:
-    """Build a single Overpass query that returns centers for all requested categories.
+    """Build a single Overpass query that returns node positions and way/relation bounding
+    boxes for all requested categories.
     Returns (query, labels) where labels are the category labels in the same order of blocks added.
     """
-    south, west, north, east = bbox[1], bbox[0], bbox[3], bbox[2] # Overpass wants (S,W,N,E)
+    return build_overpass_batch_query([bbox], need_parks, worship_types, store_types, gym_types, sports_types)
+
+def build_overpass_batch_query(
+    bboxes: List[Tuple[float, float, float, float]],
+    need_parks: bool,
+    worship_types: List[str],
+    store_types: List[str],
+    gym_types: List[str],
+    sports_types: List[str],
+) -> Tuple[str, List[str]]:
+    """Like build_overpass_query, but every selector is repeated for each bbox so several
+    areas are fetched in one round-trip.
+    """
+    areas = [f"({b[1]},{b[0]},{b[3]},{b[2]})" for b in bboxes] # Overpass wants (S,W,N,E)
+
+    def nwr(selector: str) -> str:
+        return "".join(f"{kind}{selector}{area};" for kind in ("node", "way", "relation") for area in areas)
+
     blocks = []
     labels = []
 
     if need_parks:
-        block = f"(node[\"leisure\"=\"park\"]({south},{west},{north},{east});way[\"leisure\"=\"park\"]({south},{west},{north},{east});relation[\"leisure\"=\"park\"]({south},{west},{north},{east}););"
+        block = "(" + nwr("[\"leisure\"=\"park\"]") + ");"
         blocks.append(block)
         labels.append("parks")
 
     if worship_types:
         religions = [WORSHIP_RELIGION_MAP.get(w, w) for w in worship_types]
         regex = "|".join(sorted(set(religions)))
-        block = f"(node[\"amenity\"=\"place_of_worship\"][\"religion\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-        f"way[\"amenity\"=\"place_of_worship\"][\"religion\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-        f"relation[\"amenity\"=\"place_of_worship\"][\"religion\"~\"^({regex})$\"]({south},{west},{north},{east}););"
+        block = "(" + nwr(f"[\"amenity\"=\"place_of_worship\"][\"religion\"~\"^({regex})$\"]") + ");"
         blocks.append(block)
         labels.append("worship")
 
@@ -162,9 +517,7 @@ def build_overpass_query(
             shops.update(STORE_TAGS.get(key, []))
         if shops:
             regex = "|".join(sorted(shops))
-            block = f"(node[\"shop\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                    f"way[\"shop\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                    f"relation[\"shop\"~\"^({regex})$\"]({south},{west},{north},{east}););"
+            block = "(" + nwr(f"[\"shop\"~\"^({regex})$\"]") + ");"
             blocks.append(block)
             labels.append("stores")
 
@@ -185,17 +538,10 @@ def build_overpass_query(
             
             # Query both amenity=fitness_centre and leisure=fitness_centre
             # Also query leisure=fitness_centre with specific sport tags
-            block = f"(node[\"amenity\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                    f"way[\"amenity\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                    f"relation[\"amenity\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                    f"node[\"leisure\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                    f"way[\"leisure\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                    f"relation[\"leisure\"~\"^({regex})$\"]({south},{west},{north},{east});"
+            block = "(" + nwr(f"[\"amenity\"~\"^({regex})$\"]") + nwr(f"[\"leisure\"~\"^({regex})$\"]")
             
             if sport_gyms:
-                block += f"node[\"leisure\"=\"fitness_centre\"][\"sport\"~\"^({sport_regex})$\"]({south},{west},{north},{east});" \
-                        f"way[\"leisure\"=\"fitness_centre\"][\"sport\"~\"^({sport_regex})$\"]({south},{west},{north},{east});" \
-                        f"relation[\"leisure\"=\"fitness_centre\"][\"sport\"~\"^({sport_regex})$\"]({south},{west},{north},{east});"
+                block += nwr(f"[\"leisure\"=\"fitness_centre\"][\"sport\"~\"^({sport_regex})$\"]")
             
             block += ");"
             blocks.append(block)
@@ -215,16 +561,10 @@ def build_overpass_query(
             block = ""
             if sports:
                 regex = "|".join(sorted(sports))
-                block += f"node[\"leisure\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                        f"way[\"leisure\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                        f"relation[\"leisure\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                        f"node[\"leisure\"=\"sports_centre\"][\"sport\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                        f"way[\"leisure\"=\"sports_centre\"][\"sport\"~\"^({regex})$\"]({south},{west},{north},{east});" \
-                        f"relation[\"leisure\"=\"sports_centre\"][\"sport\"~\"^({regex})$\"]({south},{west},{north},{east});"
+                block += nwr(f"[\"leisure\"~\"^({regex})$\"]") + \
+                        nwr(f"[\"leisure\"=\"sports_centre\"][\"sport\"~\"^({regex})$\"]")
             if golf_driving_ranges:
-                block += f"node[\"golf\"=\"driving_range\"]({south},{west},{north},{east});" \
-                        f"way[\"golf\"=\"driving_range\"]({south},{west},{north},{east});" \
-                        f"relation[\"golf\"=\"driving_range\"]({south},{west},{north},{east});"
+                block += nwr("[\"golf\"=\"driving_range\"]")
             
             block = f"({block});"
             blocks.append(block)
@@ -233,65 +573,459 @@ def build_overpass_query(
     if not blocks:
         return "", []
     
-    query = "[out:json][timeout:25];(" + "".join(blocks) + ");out center;"
+    # Bounds rather than centers, so ways/relations can be filed under every tile they span
+    query = "[out:json][timeout:25];(" + "".join(blocks) + ");out bb;"
     return query, labels
 
+def classify_amenity(tags: Dict[str, Any]) -> Optional[str]:
+    """Category label ({parks,worship,stores,gyms,sports}) for an OSM element's tags, or None."""
+    if tags.get("leisure") == "park":
+        return "parks"
+    elif tags.get("amenity") == "place_of_worship":
+        return "worship"
+    elif "shop" in tags:
+        return "stores"
+    # Check both amenity and leisure tags for gyms
+    # Also check for leisure=fitness_centre with specific sport tags
+    elif (tags.get("amenity") in ["fitness_centre", "gym", "yoga", "pilates", "crossfit", "barre", "dance", "martial_arts", "karate", "judo", "taekwondo", "boxing", "muay_thai", "spinning", "swimming_pool", "swimming", "trampoline_park", "climbing", "bouldering"] or
+          tags.get("leisure") in ["fitness_centre", "gym", "yoga", "pilates", "crossfit", "barre", "dance", "martial_arts", "karate", "judo", "taekwondo", "boxing", "muay_thai", "spinning", "swimming_pool", "swimming", "trampoline_park", "climbing", "bouldering"] or
+          (tags.get("leisure") == "fitness_centre" and tags.get("sport") in ["pilates", "crossfit", "yoga", "barre", "dance", "martial_arts", "spinning", "swimming", "trampoline", "climbing", "bouldering"])):
+        return "gyms"
+    # Check for sports facilities
+    elif (tags.get("leisure") in ["tennis_court", "golf_course"] or
+          tags.get("golf") == "driving_range" or
+          (tags.get("leisure") == "sports_centre" and tags.get("sport") in ["tennis", "golf"])):
+        return "sports"
+    return None
+
+def empty_amenities() -> Dict[str, List[Amenity]]:
+    return {"parks": [], "worship": [], "stores": [], "gyms": [], "sports": []}
+
+def _gym_subtype(tags: Dict[str, Any]) -> str:
+    if tags.get("leisure") == "fitness_centre" and "sport" in tags:
+        return tags["sport"]
+    return tags.get("amenity") or tags.get("leisure", "")
+
+def _sports_subtype(tags: Dict[str, Any]) -> str:
+    if tags.get("golf") == "driving_range":
+        return "golf_driving_range"
+    if tags.get("leisure") == "tennis_court" or tags.get("sport") == "tennis":
+        return "tennis_court"
+    if tags.get("leisure") == "golf_course" or tags.get("sport") == "golf":
+        return "golf_course"
+    return tags.get("leisure", "")
+
+# Per category: the tag value the map picks an amenity's icon by, e.g. a place of worship's religion
+AMENITY_SUBTYPES: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "parks": lambda tags: "park",
+    "worship": lambda tags: tags.get("religion", ""),
+    "stores": lambda tags: tags.get("shop", ""),
+    "gyms": _gym_subtype,
+    "sports": _sports_subtype,
+}
+
+def amenity_tiles(bbox: Tuple[float, float, float, float]) -> List[Tile]:
+    """Cache tiles covering bbox, at AMENITY_TILE_ZOOM or coarser so at most
+    MAX_TILES_PER_REQUEST tiles are needed.
+    """
+    z = AMENITY_TILE_ZOOM
+    tiles = tiles_covering(bbox, z)
+    while len(tiles) > MAX_TILES_PER_REQUEST and z > 0:
+        z -= 1
+        tiles = tiles_covering(bbox, z)
+    return tiles
+
+class TileSink:
+    """Routes streamed Overpass elements straight into per-tile category buckets.
+    Nodes go to the tile containing them. A way or relation goes to every requested tile
+    its bounding box overlaps, since each of those tiles' bbox queries returns it even
+    when its center lies elsewhere (e.g. a large park); fetch_category_amenities drops the
+    repeats when it joins tiles.
+    """
+
+    def __init__(self, tiles: List[Tile], categories: Iterable[str]):
+        self.zoom = tiles[0][0]
+        self.categories = set(categories)
+        self.fresh: Dict[Tile, Dict[str, List[Amenity]]] = {tile: empty_amenities() for tile in tiles}
+        self.seen: Set[Tuple[str, Any]] = set()
+
+    def tiles_for(self, el: Dict[str, Any], amenity: Amenity) -> List[Tile]:
+        """The requested tiles an element belongs to."""
+        b = el.get("bounds")
+        if b is not None:
+            _, x0, y0 = tile_for(b["maxlat"], b["minlon"], self.zoom)
+            _, x1, y1 = tile_for(b["minlat"], b["maxlon"], self.zoom)
+            if x0 <= x1:
+                if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(self.fresh):
+                    spanned = [(self.zoom, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+                    return [tile for tile in spanned if tile in self.fresh]
+                return [tile for tile in self.fresh if x0 <= tile[1] <= x1 and y0 <= tile[2] <= y1]
+        tile = tile_for(amenity.lat, amenity.lng, self.zoom)
+        return [tile] if tile in self.fresh else []
+
+    def __call__(self, el: Dict[str, Any]) -> None:
+        amenity = element_to_amenity(el)
+        if amenity is None:
+            return
+        category = classify_amenity(amenity.tags)
+        if category not in self.categories:
+            # Elements classified into another category belong to that category's sub-query
+            return
+        osm_key = (el.get("type", ""), amenity.id)
+        if osm_key in self.seen:
+            return
+        self.seen.add(osm_key)
+        # Elements outside the requested tiles belong to tiles we already have (or don't need)
+        for tile in self.tiles_for(el, amenity):
+            self.fresh[tile][category].append(amenity)
+
+async def fetch_overpass_tiles(
+    tiles: List[Tile],
+    need_parks: bool,
+    worship_types: List[str],
+    store_types: List[str],
+    gym_types: List[str],
+    sports_types: List[str]
+) -> Dict[Tile, Dict[str, List[Amenity]]]:
+    """Fetch same-zoom tiles in one batched Overpass query, parsing the response as it streams."""
+    query, labels = build_overpass_batch_query(merge_tiles(tiles), need_parks, worship_types, store_types, gym_types, sports_types)
+    amenity_stats["overpass_requests"] += 1
+    sink = await get_overpass_client().stream_elements(query, lambda: TileSink(tiles, labels))
+    return sink.fresh
+
+async def _fill_tiles(
+    tag_set: Tuple,
+    futures: Dict[Tile, "asyncio.Future[Dict[str, List[Amenity]]]"],
+    *query_args: Any,
+) -> None:
+    """Fetch the tiles a caller claimed and resolve their in-flight futures.
+    Failures are handed to every waiter but never cached, so the next request retries.
+    Waiters get the fetched tiles before they are written to the cache, and a failed
+    cache write is only counted (cache_write_errors): the tiles are refetched next time.
+    """
+    try:
+        fresh = await fetch_overpass_tiles(list(futures), *query_args)
+    except BaseException as exc:
+        for fut in futures.values():
+            if fut.done():
+                continue
+            if isinstance(exc, Exception):
+                fut.set_exception(exc)
+                fut.exception()  # mark retrieved so an unawaited future doesn't log a warning
+            else:
+                fut.cancel()
+        if not isinstance(exc, Exception):
+            raise
+    else:
+        for tile, entry in fresh.items():
+            if not futures[tile].done():
+                futures[tile].set_result(entry)
+        try:
+            await cache_set_many({(tag_set, tile): entry for tile, entry in fresh.items()})
+        except Exception:
+            amenity_stats["cache_write_errors"] += 1
+    finally:
+        for tile, fut in futures.items():
+            _inflight_tiles.pop((tag_set, tile), None)
+            if not fut.done():
+                # Never leave a coalesced caller waiting on a tile nobody will resolve
+                fut.set_exception(RuntimeError(f"tile {tile} was not fetched"))
+                fut.exception()
+
+def start_tile_fetch(tag_set: Tuple, tiles: List[Tile]) -> Dict[Tile, asyncio.Future]:
+    """Claim tiles as in flight and fetch them in a background task; returns their futures.
+    The task is independent of the caller, so a cancelled request doesn't strand other waiters.
+    """
+    loop = asyncio.get_running_loop()
+    futures: Dict[Tile, asyncio.Future] = {}
+    for tile in tiles:
+        futures[tile] = _inflight_tiles[(tag_set, tile)] = loop.create_future()
+    task = asyncio.ensure_future(_fill_tiles(tag_set, futures, *tag_set_query_args(tag_set)))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return futures
+
+def category_queries(
+    need_parks: bool,
+    worship_types: List[str],
+    store_types: List[str],
+    gym_types: List[str],
+    sports_types: List[str],
+) -> Dict[Tuple, Tuple]:
+    """Split a selection into one sub-query per category: {tag set: build_overpass_query args}.
+
+    The tag set, (category, sorted types), is the cache key prefix for that category's
+    tiles, so changing the gym types leaves the cached parks, worship, stores and sports
+    tiles untouched. Categories whose types select nothing are left out.
+    """
+    types = {"parks": [], "worship": worship_types, "stores": store_types, "gyms": gym_types, "sports": sports_types}
+    queries: Dict[Tuple, Tuple] = {}
+    for category, selected in types.items():
+        if category == "parks" and not need_parks:
+            continue
+        tag_set = (category, tuple(sorted(selected)))
+        args = tag_set_query_args(tag_set)
+        _, labels = build_overpass_query((0.0, 0.0, 0.0, 0.0), *args)
+        if labels:
+            queries[tag_set] = args
+    return queries
+
+def tag_set_query_args(tag_set: Tuple) -> Tuple:
+    """The build_overpass_query selection (need_parks, worship, stores, gyms, sports) a
+    category_queries tag set stands for. Derived from the key itself, so fetching and
+    refreshing a tile needs no registry of the tag sets clients have asked for.
+    """
+    category, types = tag_set
+    args: List[Any] = [category == "parks", [], [], [], []]
+    if category != "parks":
+        args[list(empty_amenities()).index(category)] = list(types)
+    return tuple(args)
+
+async def cache_get_many(keys: List[Tuple]) -> Dict[Tuple, CachedEntry]:
+    """amenities_cache.get_many, in a worker thread for backends that block on I/O (SQLite)."""
+    if amenities_cache.blocking:
+        return await asyncio.to_thread(amenities_cache.get_many, keys)
+    return amenities_cache.get_many(keys)
+
+async def cache_set_many(entries: Dict[Tuple, Dict[str, List[Amenity]]]) -> None:
+    """amenities_cache.set_many, in a worker thread for blocking backends."""
+    if amenities_cache.blocking:
+        await asyncio.to_thread(amenities_cache.set_many, entries)
+    else:
+        amenities_cache.set_many(entries)
+
+async def cache_size() -> int:
+    """len(amenities_cache); a row count on SQLite, so off the event loop there."""
+    if amenities_cache.blocking:
+        return await asyncio.to_thread(len, amenities_cache)
+    return len(amenities_cache)
+
+async def cached_amenities(
+    bbox: Tuple[float, float, float, float],
+    need_parks: bool,
+    worship_types: List[str],
+    store_types: List[str],
+    gym_types: List[str],
+    sports_types: List[str],
+    category_bboxes: Optional[Dict[str, Tuple[float, float, float, float]]] = None,
+) -> Dict[str, List[Amenity]]:
+    """Like fetch_amenities, but only from tiles already in the cache (never calls Overpass)."""
+    result = empty_amenities()
+    keys = [(tag_set, tile)
+            for tag_set in category_queries(need_parks, worship_types, store_types, gym_types, sports_types)
+            for tile in amenity_tiles((category_bboxes or {}).get(tag_set[0], bbox))]
+    hits = await cache_get_many(keys)
+    for key in keys:
+        hit = hits.get(key)
+        if hit is not None:
+            category = key[0][0]
+            result[category].extend(hit.entry[category])
+    return result
+
+async def fetch_category_amenities(tag_set: Tuple, bbox: Tuple[float, float, float, float]) -> List[Amenity]:
+    """Amenities of one category sub-query inside bbox, from the tile cache where possible.
+
+    Only tiles not already cached are requested, in one batched Overpass query. Tiles
+    another request is already fetching are awaited instead of fetched again (single-flight).
+    Tiles past the soft TTL are served as-is and refreshed in the background
+    (stale-while-revalidate).
+    """
+    category = tag_set[0]
+    tiles = amenity_tiles(bbox)
+    # One cache read for every tile; nothing awaits between the in-flight checks and claims below
+    hits = await cache_get_many([(tag_set, tile) for tile in tiles])
+    cached: Dict[Tile, Dict[str, List[Amenity]]] = {}
+    pending: Dict[Tile, asyncio.Future] = {}
+    missing: List[Tile] = []
+    stale: List[Tile] = []
+    now = time.time()
+    for tile in tiles:
+        key = (tag_set, tile)
+        if HOT_REFRESH_INTERVAL_SECONDS > 0:
+            _hot_tiles[key] += 1
+        hit = hits.get(key)
+        if hit is not None:
+            cached[tile] = hit.entry
+            if now - hit.fetched_at < CACHE_TTL_SECONDS:
+                amenity_stats["cache_hits"] += 1
+            else:
+                # Serve the stale tile now, refresh it in the background
+                amenity_stats["cache_stale_hits"] += 1
+                if key not in _inflight_tiles:
+                    stale.append(tile)
+        elif key in _inflight_tiles:
+            amenity_stats["cache_misses"] += 1
+            pending[tile] = _inflight_tiles[key]
+        else:
+            amenity_stats["cache_misses"] += 1
+            missing.append(tile)
+
+    if pending:
+        amenity_stats["coalesced_requests"] += 1
+        amenity_stats["coalesced_tiles"] += len(pending)
+    if stale:
+        amenity_stats["background_refreshes"] += 1
+        start_tile_fetch(tag_set, stale)
+    if missing:
+        pending.update(start_tile_fetch(tag_set, missing))
+    for tile, fut in pending.items():
+        cached[tile] = await asyncio.shield(fut)
+
+    # A way or relation is filed under every tile it spans; Amenity has no OSM element type,
+    # so the id together with the center identifies it
+    result: List[Amenity] = []
+    seen: Set[Tuple[Any, float, float]] = set()
+    for tile in tiles:
+        for amenity in cached[tile][category]:
+            key = (amenity.id, amenity.lat, amenity.lng)
+            if key not in seen:
+                seen.add(key)
+                result.append(amenity)
+    return result
+
 async def fetch_amenities(
     bbox: Tuple[float, float, float, float],
     need_parks: bool,
     worship_types: List[str],
     store_types: List[str],
     gym_types: List[str],
-    sports_types: List[str]
-) -> Dict[str, List[Dict[str, Any]]]:
-    """Fetch amenities for the expanded bbox. Returns dict with keys in {parks,worship,stores,gyms,sports}."""
-    query, labels = build_overpass_query(bbox, need_parks, worship_types, store_types, gym_types, sports_types)
-    result: Dict[str, List[Dict[str, Any]]] = {"parks": [], "worship": [], "stores": [], "gyms": [], "sports": []}
-    if not query:
+    sports_types: List[str],
+    category_bboxes: Optional[Dict[str, Tuple[float, float, float, float]]] = None,
+) -> Dict[str, List[Amenity]]:
+    """Fetch amenities for the expanded bbox. Returns dict with keys in {parks,worship,stores,gyms,sports}.
+
+    Each selected category is its own cached sub-query (see category_queries), and the
+    categories are fetched concurrently, so one slow category doesn't hold up the cached
+    ones. `category_bboxes` overrides bbox per category, e.g. the viewport expanded by
+    that category's radius.
+    """
+    result = empty_amenities()
+    queries = category_queries(need_parks, worship_types, store_types, gym_types, sports_types)
+    if not queries:
         return result
-    
-    # Include specific worship and store types in cache key to avoid stale data
-    cache_key = (bbox_key(bbox), tuple(sorted(labels)), tuple(sorted(worship_types)), tuple(sorted(store_types)), tuple(sorted(gym_types)), tuple(sorted(sports_types)))
-    if cache_key in amenities_cache:
-        return amenities_cache[cache_key]
-    
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(OVERPASS_URL, data={"data": query})
-        resp.raise_for_status()
-        data = resp.json()
-
-    for el in data.get("elements", []):
-        tags = el.get("tags", {}) or {}
-        # Prefer 'center' for ways/relations; nodes have 'lat','lon'
-        if "center" in el:
-            lat, lon = el["center"]["lat"], el["center"]["lon"]
-        else:
-            lat, lon = el.get("lat"), el.get("lon")
-        if lat is None or lon is None:
-            continue
 
-        rec = {"id": el.get("id", f"osm-{lat}-{lon}"), "lat": lat, "lng": lon, "tags": tags}
-        if tags.get("leisure") == "park":
-            result["parks"].append(rec)
-        elif tags.get("amenity") == "place_of_worship":
-            result["worship"].append(rec)
-        elif "shop" in tags:
-            result["stores"].append(rec)
-        # Check both amenity and leisure tags for gyms
-        # Also check for leisure=fitness_centre with specific sport tags
-        elif (tags.get("amenity") in ["fitness_centre", "gym", "yoga", "pilates", "crossfit", "barre", "dance", "martial_arts", "karate", "judo", "taekwondo", "boxing", "muay_thai", "spinning", "swimming_pool", "swimming", "trampoline_park", "climbing", "bouldering"] or
-              tags.get("leisure") in ["fitness_centre", "gym", "yoga", "pilates", "crossfit", "barre", "dance", "martial_arts", "karate", "judo", "taekwondo", "boxing", "muay_thai", "spinning", "swimming_pool", "swimming", "trampoline_park", "climbing", "bouldering"] or
-              (tags.get("leisure") == "fitness_centre" and tags.get("sport") in ["pilates", "crossfit", "yoga", "barre", "dance", "martial_arts", "spinning", "swimming", "trampoline", "climbing", "bouldering"])):
-            result["gyms"].append(rec)
-        # Check for sports facilities
-        elif (tags.get("leisure") in ["tennis_court", "golf_course"] or
-              tags.get("golf") == "driving_range" or
-              (tags.get("leisure") == "sports_centre" and tags.get("sport") in ["tennis", "golf"])):
-            result["sports"].append(rec)
-
-    amenities_cache[cache_key] = result
+    tag_sets = list(queries)
+    fetched = await asyncio.gather(*(
+        fetch_category_amenities(tag_set, (category_bboxes or {}).get(tag_set[0], bbox)) for tag_set in tag_sets
+    ))
+    for tag_set, recs in zip(tag_sets, fetched):
+        result[tag_set[0]] = recs
     return result
 
+LISTING_FIELDS = list(Listing.model_fields)
+LISTING_DEFAULTS = {name: field.default for name, field in Listing.model_fields.items() if not field.is_required()}
+# What the map draws for an amenity in the compact payloads
+COMPACT_AMENITY_FIELDS = ("id", "lat", "lng", "category", "name", "subtype")
+
+def matched_amenities(
+    amenities: Dict[str, List[Amenity]],
+    preds: Dict[str, AmenityPredicate],
+    radii: Dict[str, int],
+    rows: Sequence[int],
+    store: Optional[ListingStore] = None,
+) -> Dict[str, List[Amenity]]:
+    """Only the amenities that satisfied a match: matching a category's predicate and
+    within its radius of at least one of the listing rows (of `store`, default LISTINGS).
+    """
+    result = empty_amenities()
+    store = store if store is not None else LISTINGS
+    points = [(store.lat[i], store.lng[i]) for i in rows]
+    for cat, pred in preds.items():
+        radius = radii[cat]
+        candidates = [a for a in amenities[cat] if pred(a)]
+        if PROXIMITY_ENGINE == "numpy" and np is not None:
+            # Amenities play the listings' role: each needs a listing within the radius
+            engine = VectorProximityEngine([a.lat for a in candidates], [a.lng for a in candidates])
+            engine.add_category([p[0] for p in points], [p[1] for p in points], radius)
+            result[cat] = [a for a, ok in zip(candidates, engine.run()) if ok]
+        else:
+            index = GridIndex(points, cell_m=radius)
+            result[cat] = [a for a in candidates if index.any_within(a.lat, a.lng, radius)]
+    return result
+
+def compact_amenities(amenities: Dict[str, List[Amenity]]) -> Dict[str, List[list]]:
+    """Per category, one [id, lat, lng, name, subtype] row per amenity (COMPACT_AMENITY_FIELDS
+    without the category the grouping already gives).
+    """
+    out: Dict[str, List[list]] = {}
+    for cat, recs in amenities.items():
+        subtype = AMENITY_SUBTYPES[cat]
+        out[cat] = [[a.id, a.lat, a.lng, a.tags.get("name", ""), subtype(a.tags)] for a in recs]
+    return out
+
+def compact_amenity_columns(amenities: Dict[str, List[Amenity]]) -> Dict[str, list]:
+    """COMPACT_AMENITY_FIELDS as parallel columns, categories in order."""
+    cols: Dict[str, list] = {f: [] for f in COMPACT_AMENITY_FIELDS}
+    for cat, recs in amenities.items():
+        subtype = AMENITY_SUBTYPES[cat]
+        cols["id"].extend(a.id for a in recs)
+        cols["lat"].extend(a.lat for a in recs)
+        cols["lng"].extend(a.lng for a in recs)
+        cols["category"].extend([cat] * len(recs))
+        cols["name"].extend(a.tags.get("name", "") for a in recs)
+        cols["subtype"].extend(subtype(a.tags) for a in recs)
+    return cols
+
+def search_payload(
+    rows: Sequence[int],
+    amenities: Dict[str, List[Amenity]],
+    next_cursor: Optional[str],
+    payload: str,
+    debug: Optional[Dict[str, Any]] = None,
+    store: Optional[ListingStore] = None,
+) -> Response:
+    """Serialize a search result with orjson straight from the store columns and amenity
+    records, skipping pydantic validation of the response.
+
+    "full" is the SearchResponse shape. "compact" replaces amenities_used with `amenities`,
+    {category: [[id, lat, lng, name, subtype], ...]}, without full's tags and keys.
+    "columnar" sends listings and amenities as {field: [values]} columns, which compresses
+    best.
+    `debug`, when given, is added under "debug"; rows are of `store` (default LISTINGS).
+    """
+    store = store if store is not None else LISTINGS
+    listings = store.row_dicts(rows, LISTING_FIELDS, LISTING_DEFAULTS)
+    if payload == "full":
+        body = {"listings": listings, "amenities_used": amenities, "next_cursor": next_cursor}
+    elif payload == "compact":
+        body = {"listings": listings, "amenities": compact_amenities(amenities), "next_cursor": next_cursor}
+    else:
+        body = {"listings": {f: [d[f] for d in listings] for f in LISTING_FIELDS},
+                "amenities": compact_amenity_columns(amenities),
+                "next_cursor": next_cursor}
+    if debug is not None:
+        body["debug"] = debug
+    return Response(orjson.dumps(body), media_type="application/json")
+
+def cluster_model(agg: ClusterAgg) -> Cluster:
+    return Cluster(id="/".join(str(v) for v in agg.cell), count=agg.count, lat=agg.lat, lng=agg.lng,
+                   price_min=agg.price_min, price_max=agg.price_max, price_median=agg.price_median)
+
+def query_fingerprint(request: Request) -> str:
+    """Hash of the search parameters a cursor is only valid for (everything but cursor, limit and debug)."""
+    items = sorted((k, v) for k, v in request.query_params.multi_items() if k not in ("cursor", "limit", "debug"))
+    return hashlib.blake2b(orjson.dumps(items), digest_size=8).hexdigest()
+
+def encode_cursor(position: SortPosition, fingerprint: str, store: ListingStore) -> str:
+    key, row = position
+    return base64.urlsafe_b64encode(orjson.dumps([key, row, fingerprint, store.version])).decode().rstrip("=")
+
+def decode_cursor(cursor: str, fingerprint: str, store: ListingStore) -> SortPosition:
+    """Position after which the next page starts; 400 if the cursor is malformed, was
+    issued for different search parameters or for another version of the inventory (its
+    row ids and sort keys mean nothing after a reload).
+    """
+    try:
+        key, row, issued_for, version = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        position = (float("inf") if key is None else float(key), int(row))  # orjson writes inf as null
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if issued_for != fingerprint:
+        raise HTTPException(status_code=400, detail="Cursor does not match these search parameters")
+    if version != store.version:
+        raise HTTPException(status_code=400, detail="Listings have changed since this cursor was issued; start from the first page")
+    return position
+
 # -----------------
 # API endpoints
 # -----------------
@@ -300,13 +1034,47 @@ async def fetch_amenities(
 async def healthz():
     return {"ok": True}
 
-@app.get("/api/listings", response_model=SearchResponse)
-async def search_listings(
-    # Map viewport bbox (west,south,east,north)
-    west: float = Query(..., description="BBox west (lng)"),
-    south: float = Query(..., description="BBox south (lat)"),
-    east: float = Query(..., description="BBox east (lng)"),
-    north: float = Query(..., description="BBox north (lat)"),
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of the stage histograms and pipeline counters."""
+    overpass_status = {(k[len("overpass_status_"):],): v for k, v in amenity_stats.items() if k.startswith("overpass_status_")}
+    events = {(k,): v for k, v in amenity_stats.items() if not k.startswith("overpass_status_")}
+    lines = stage_seconds.render() + overpass_seconds.render()
+    lines += render_counter("realestate_overpass_responses_total", "Overpass responses by HTTP status", overpass_status, ("status",))
+    lines += render_counter("realestate_amenity_events_total", "Amenity cache and Overpass client events "
+                            "(cache hits/misses/evictions, requests, retries, elements, bytes)", events, ("event",))
+    lines += render_counter("realestate_search_events_total", "Search requests, candidate/checked/returned rows and inventory reloads",
+                            {(k,): v for k, v in search_stats.items()}, ("event",))
+    lines += render_counter("realestate_amenity_cache_tiles", "Tiles in the amenity cache", {(): await cache_size()}, kind="gauge")
+    lines += render_counter("realestate_inflight_tiles", "Tiles being fetched from Overpass", {(): len(_inflight_tiles)}, kind="gauge")
+    lines += render_counter("realestate_listings", "Listings in the inventory", {(): len(LISTINGS)}, kind="gauge")
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/api/amenity_stats")
+async def get_amenity_stats():
+    return {"cache_hits": 0, "cache_stale_hits": 0, "cache_misses": 0, "background_refreshes": 0, "hot_refreshes": 0,
+            "overpass_requests": 0, "coalesced_requests": 0, "coalesced_tiles": 0, **amenity_stats,
+            "cached_tiles": await cache_size(), "inflight_tiles": len(_inflight_tiles)}
+
+class ListingFilters(NamedTuple):
+    """Attribute and proximity filters shared by /api/listings and /api/clusters."""
+    sale_type: Optional[str]
+    min_price: Optional[int]
+    max_price: Optional[int]
+    min_beds: Optional[int]
+    min_baths: Optional[int]
+    radii: Dict[str, int]
+    need_parks: bool
+    worship_types: List[str]
+    store_types: List[str]
+    gyms_types: List[str]
+    sports_types: List[str]
+
+    @property
+    def has_proximity(self) -> bool:
+        return bool(self.need_parks or self.worship_types or self.store_types or self.gyms_types or self.sports_types)
+
+def listing_filters(
     sale_type: Optional[Literal["sale", "rent", "any"]] = "any",
     min_price: Optional[int] = None,
     max_price: Optional[int] = None,
@@ -324,87 +1092,198 @@ async def search_listings(
     stores: Optional[List[str]] = Query(None, description="List of store groups: grocery,home_improvement,appliance,farm_supplies"),
     gyms: Optional[List[str]] = Query(None, description="List of gym types: gym,fitness_center,yoga_studio,pilates_studio,crossfit_gym,barre_studio,dance_studio,martial_arts_gym,spinning_studio,swim_studio,trampoline_park,climbing_gym,rock_climbing_gym"),
     sports: Optional[List[str]] = Query(None, description="List of sports facility types: tennis_court,golf_driving_range,golf_course"),
+) -> ListingFilters:
+    radii = {"parks": parks_radius, "worship": worship_radius, "stores": stores_radius,
+             "gyms": gyms_radius, "sports": sports_radius}
+    return ListingFilters(sale_type, min_price, max_price, min_beds, min_baths, radii,
+                          need_parks, worship or [], stores or [], gyms or [], sports or [])
+
+def request_timer(endpoint: str, debug: bool) -> StageTimer:
+    """Stage timer for one request; NULL_TIMER (no timing at all) unless metrics,
+    Server-Timing or the debug flag need it.
+    """
+    if METRICS_ENABLED or SERVER_TIMING or debug:
+        return StageTimer(stage_seconds if METRICS_ENABLED else None, endpoint)
+    return NULL_TIMER
+
+def finish_request(timer: StageTimer, response: Response) -> None:
+    """Fold a request's counts into search_stats and add the Server-Timing header."""
+    if not timer.enabled:
+        return
+    if METRICS_ENABLED:
+        search_stats[f"{timer.endpoint}_requests"] += 1
+        for name, value in timer.counts.items():
+            search_stats[f"{timer.endpoint}_{name}"] += value
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = timer.server_timing()
+
+def query_rows(bbox: Tuple[float, float, float, float], f: ListingFilters,
+               store: Optional[ListingStore] = None) -> List[int]:
+    """Rows in bbox matching the attribute filters, in one pass over the spatial index hits."""
+    return (store if store is not None else LISTINGS).query(
+        bbox, sale_type=f.sale_type, min_price=f.min_price, max_price=f.max_price,
+        min_beds=f.min_beds, min_baths=f.min_baths)
+
+async def proximity_filter(
+    bbox: Tuple[float, float, float, float],
+    f: ListingFilters,
+    timer: StageTimer = NULL_TIMER,
+    store: Optional[ListingStore] = None,
+) -> Tuple[Callable[[List[int]], List[bool]], Dict[str, List[Amenity]]]:
+    """Row check for the proximity filters of listings in bbox, and the amenities behind it.
+    Rows are of `store` (default LISTINGS).
+    """
+    store = store if store is not None else LISTINGS
+    radii = f.radii
+    max_radius = max(radii.values())
+    expanded = expand_bbox_by_radius(bbox, max_radius)
+    # Each category only needs amenities within its own radius of the viewport
+    category_bboxes = {cat: expand_bbox_by_radius(bbox, r) for cat, r in radii.items()}
+
+    # Answer from the precomputed table when it covers every selected type and radius:
+    # no Overpass call, and the map shows whatever amenities are already cached
+    # The table belongs to the current inventory; a request still on a replaced store checks live
+    table = PROXIMITY_TABLE if store is LISTINGS else None
+    if table is not None and max_radius <= table.max_radius:
+        selection = proximity_table_selection(f.need_parks, f.worship_types, f.store_types, f.gyms_types, f.sports_types)
+        if all(c in table.columns for cols in selection.values() for c in cols):
+            def table_check(batch: List[int]) -> List[bool]:
+                keep = [True] * len(batch)
+                for cat, cols in selection.items():
+                    keep = [k and ok for k, ok in zip(keep, table.within(batch, cols, radii[cat]))]
+                return keep
+
+            with timer.stage("amenities"):
+                amenities = await cached_amenities(expanded, f.need_parks, f.worship_types, f.store_types, f.gyms_types,
+                                                   f.sports_types, category_bboxes)
+            return table_check, amenities
+
+    # Fetch every selected category concurrently, each for the bbox expanded by its own radius
+    with timer.stage("amenities"):
+        amenities = await fetch_amenities(expanded, f.need_parks, f.worship_types, f.store_types, f.gyms_types,
+                                          f.sports_types, category_bboxes)
+    timer.count("amenities", sum(len(v) for v in amenities.values()))
+
+    preds = amenity_predicates(f.need_parks, f.worship_types, f.store_types, f.gyms_types, f.sports_types)
+    with timer.stage("proximity_index"):
+        if PROXIMITY_ENGINE == "numpy" and np is not None:
+            proximity = proximity_check_numpy(amenities, preds, radii)
+        else:
+            proximity = proximity_check_grid(amenities, preds, radii)
+
+    def check(batch: List[int]) -> List[bool]:
+        return proximity([store.lat[i] for i in batch], [store.lng[i] for i in batch])
+
+    return check, amenities
+
+@app.get("/api/listings", response_model=SearchResponse)
+async def search_listings(
+    request: Request,
+    # Map viewport bbox (west,south,east,north)
+    west: float = Query(..., description="BBox west (lng)"),
+    south: float = Query(..., description="BBox south (lat)"),
+    east: float = Query(..., description="BBox east (lng)"),
+    north: float = Query(..., description="BBox north (lat)"),
+    filters: ListingFilters = Depends(listing_filters),
+
+    # Ordering and pagination
+    sort: SortField = Query("default", description="default (inventory order), price, sqft, distance (to the viewport center) or price_per_sqft; order=desc reverses each"),
+    order: Literal["asc", "desc"] = "asc",
+    limit: int = Query(MAX_LISTINGS, ge=1, le=MAX_LISTINGS, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+
+    # Response encoding
+    payload: Literal["full", "compact", "columnar"] = Query("full", description="full (SearchResponse), compact ([id, lat, lng, name, subtype] rows per amenity category) or columnar"),
+    matched_only: bool = Query(False, description="Only return amenities within radius of a returned listing"),
+    debug: bool = Query(False, description="Include the per-stage timing breakdown in the response"),
 ):
+    timer = request_timer("listings", debug)
+    # One inventory for the whole request, even if a reload swaps LISTINGS meanwhile
+    store = LISTINGS
     bbox = (west, south, east, north)
-
-    # Filter by bbox & basic fields first (in-memory for demo)
-    def in_bbox(lst: Listing) -> bool:
-        return (west <= lst.lng <= east) and (south <= lst.lat <= north)
-    
-    candidates: List[Listing] = [l for l in LISTINGS if in_bbox(l)]
-
-    if sale_type and sale_type != "any":
-        candidates = [l for l in candidates if l.sale_type == sale_type]
-    if min_price is not None:
-        candidates = [l for l in candidates if l.price >= min_price]
-    if max_price is not None:
-        candidates = [l for l in candidates if l.price <= max_price]
-    if min_beds is not None:
-        candidates = [l for l in candidates if l.beds >= min_beds]
-    if min_baths is not None:
-        candidates = [l for l in candidates if l.baths >= min_baths]
+    fingerprint = query_fingerprint(request)
+    after = decode_cursor(cursor, fingerprint, store) if cursor else None
+    key = store.sort_key(sort, descending=order == "desc", center=((south + north) / 2, (west + east) / 2))
+    with timer.stage("bbox_query"):
+        rows = query_rows(bbox, filters, store)
+    timer.count("candidates", len(rows))
 
     # If no proximity constraints, return basics
-    worship_types = worship or []
-    store_types = stores or []
-    gyms_types = gyms or []
-    sports_types = sports or []
-    if not need_parks and not worship_types and not store_types and not gyms_types and not sports_types:
-        return SearchResponse(listings=candidates[:MAX_LISTINGS], amenities_used={"parks": [], "worship": [], "stores": [], "gyms": [], "sports": []})
-    
-    # Expand bbox by the maximum radius needed and fetch amenities once
-    max_radius = max(parks_radius, worship_radius, stores_radius, gyms_radius, sports_radius)
-    expanded = expand_bbox_by_radius(bbox, max_radius)
-    amenities = await fetch_amenities(expanded, need_parks, worship_types, store_types, gyms_types, sports_types)
-
-    def passes_proximity(lst: Listing) -> bool:
-        ok = True
-
-        if need_parks:
-            ok = ok and any(haversine_m(lst.lat, lst.lng, a["lat"], a["lng"]) <= parks_radius for a in amenities["parks"]) \
-                    if amenities["parks"] else False
-        if worship_types and worship_types != ['']:
-            ok = ok and any(haversine_m(lst.lat, lst.lng, a["lat"], a["lng"]) <= worship_radius and \
-                    (a["tags"].get("religion") in {WORSHIP_RELIGION_MAP.get(w, w) for w in worship_types})
-                    for a in amenities["worship"]) if amenities["worship"] else False
-        if store_types and store_types != ['']:
-            allowed_shops = set()
-            for k in store_types:
-                allowed_shops.update(STORE_TAGS.get(k, []))
-            ok = ok and any(haversine_m(lst.lat, lst.lng, a["lat"], a["lng"]) <= stores_radius and \
-                    (a["tags"].get("shop") in allowed_shops)
-                    for a in amenities["stores"]) if amenities["stores"] else False
-        if gyms_types and gyms_types != ['']:
-            allowed_gyms = set()
-            for k in gyms_types:
-                allowed_gyms.update(GYM_TAGS.get(k, []))
-            ok = ok and any(haversine_m(lst.lat, lst.lng, a["lat"], a["lng"]) <= gyms_radius and \
-                    (a["tags"].get("amenity") in allowed_gyms or a["tags"].get("leisure") in allowed_gyms or
-                     (a["tags"].get("leisure") == "fitness_centre" and a["tags"].get("sport") in allowed_gyms))
-                    for a in amenities["gyms"]) if amenities["gyms"] else False
-        if sports_types and sports_types != ['']:
-            allowed_sports = set()
-            golf_driving_range_requested = False
-            for k in sports_types:
-                if k == "golf_driving_range":
-                    golf_driving_range_requested = True
-                else:
-                    allowed_sports.update(SPORTS_TAGS.get(k, []))
-            
-            def sports_match(a):
-                if golf_driving_range_requested and a["tags"].get("golf") == "driving_range":
-                    return True
-                return (a["tags"].get("leisure") in allowed_sports or
-                       (a["tags"].get("leisure") == "sports_centre" and a["tags"].get("sport") in allowed_sports))
-            
-            ok = ok and any(haversine_m(lst.lat, lst.lng, a["lat"], a["lng"]) <= sports_radius and sports_match(a)
-                    for a in amenities["sports"]) if amenities["sports"] else False
+    if not filters.has_proximity:
+        check, amenities = None, empty_amenities()
+    else:
+        check, amenities = await proximity_filter(bbox, filters, timer, store)
+        if timer.enabled:
+            untimed_check = check
 
-        return ok
-    
-    filtered = [l for l in candidates if passes_proximity(l)]
+            def check(batch: List[int]) -> List[bool]:
+                timer.count("checked", len(batch))
+                with timer.stage("proximity"):
+                    return untimed_check(batch)
 
-    return SearchResponse(
-        listings=filtered[:MAX_LISTINGS],
-        amenities_used={k: v for k, v in amenities.items()},
-    )
\ No newline at end of file
+    # Proximity is only checked for the rows a page actually needs, in sort order
+    with timer.stage("select"):
+        page, last = select_page(rows, key, limit, check=check, after=after)
+    timer.count("results", len(page))
+    if matched_only and filters.has_proximity:
+        preds = amenity_predicates(filters.need_parks, filters.worship_types, filters.store_types,
+                                   filters.gyms_types, filters.sports_types)
+        with timer.stage("matched"):
+            amenities = matched_amenities(amenities, preds, filters.radii, page, store)
+    next_cursor = encode_cursor(last, fingerprint, store) if last is not None else None
+    with timer.stage("serialize"):
+        response = search_payload(page, amenities, next_cursor, payload, timer.breakdown() if debug else None, store)
+    finish_request(timer, response)
+    return response
+
+@app.get("/api/clusters", response_model=ClustersResponse)
+async def get_clusters(
+    response: Response,
+    west: float = Query(..., description="BBox west (lng)"),
+    south: float = Query(..., description="BBox south (lat)"),
+    east: float = Query(..., description="BBox east (lng)"),
+    north: float = Query(..., description="BBox north (lat)"),
+    zoom: int = Query(..., ge=0, le=MAX_CLUSTER_ZOOM, description="Map zoom level"),
+    filters: ListingFilters = Depends(listing_filters),
+):
+    """Listings and amenities aggregated into 64px grid cells at the given map zoom.
+
+    Cells on the viewport edge are counted whole. Views with no filters other than the
+    sale type, at zooms up to CLUSTER_PRECOMPUTE_MAX_ZOOM, are served from the
+    precomputed per-zoom clusters.
+    """
+    timer = request_timer("clusters", False)
+    cells = cell_range((west, south, east, north), zoom)
+    bbox = cell_range_bbox(cells, zoom)
+    store = LISTINGS
+    index = store.cluster_index(CLUSTER_PRECOMPUTE_MAX_ZOOM)
+
+    attribute_filters = (filters.min_price, filters.max_price, filters.min_beds, filters.min_baths)
+    clusters = None
+    if not filters.has_proximity and all(v is None for v in attribute_filters):
+        sale_code = SALE_TYPE_CODES.get(filters.sale_type) if filters.sale_type != "any" else None
+        with timer.stage("precomputed"):
+            clusters = index.precomputed(cells, zoom, sale_code)
+
+    amenities = empty_amenities()
+    if clusters is None:
+        with timer.stage("bbox_query"):
+            rows = query_rows(bbox, filters, store)
+        timer.count("candidates", len(rows))
+        if filters.has_proximity:
+            check, amenities = await proximity_filter(bbox, filters, timer, store)
+            with timer.stage("proximity"):
+                rows = [i for i, ok in zip(rows, check(rows)) if ok]
+        with timer.stage("cluster"):
+            clusters = index.clusters(rows, zoom, within=cells)
+
+    with timer.stage("cluster_amenities"):
+        result = ClustersResponse(
+            zoom=zoom,
+            listings=[cluster_model(agg) for agg in clusters],
+            amenities={cat: [cluster_model(agg) for agg in cluster_points(((a.lat, a.lng) for a in recs), zoom)]
+                       for cat, recs in amenities.items()},
+        )
+    timer.count("results", len(clusters))
+    finish_request(timer, response)
+    return result
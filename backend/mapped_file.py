@@ -0,0 +1,98 @@
+from __future__ import annotations
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, Iterable, Iterator, Sequence, Tuple
+
+import orjson
+
+# Framing shared by the memory-mapped binary formats (proximity_table.py, listing_snapshot.py).
+# File layout (little endian):
+#   4 byte magic | u32 version | u64 header length | orjson header | zero padding to 8 bytes | body
+# The body starts on an 8 byte boundary, so typed sections in it can be cast in place.
+# write_sections/map_sections lay the body out as typed arrays, each starting on an 8 byte
+# boundary, at header["sections"][name] = [typecode, offset, count] (offsets relative to the body).
+_PREFIX = struct.Struct("<4sIQ")
+
+
+def aligned(offset: int) -> int:
+    return (offset + 7) // 8 * 8
+
+
+def padding(size: int) -> bytes:
+    """Zero bytes taking `size` bytes to the next 8 byte boundary."""
+    return b"\0" * (aligned(size) - size)
+
+
+def _header_len(path: str, prefix: bytes, magic: bytes, version: int, kind: str) -> int:
+    if len(prefix) < _PREFIX.size or _PREFIX.unpack_from(prefix)[:2] != (magic, version):
+        raise ValueError(f"{path} is not a version {version} {kind}")
+    return _PREFIX.unpack_from(prefix)[2]
+
+
+def read_header(path: str, magic: bytes, version: int, kind: str) -> Dict:
+    """The header alone, read without mapping the file. ValueError if it is not a `kind`."""
+    with open(path, "rb") as f:
+        header_len = _header_len(path, f.read(_PREFIX.size), magic, version, kind)
+        return orjson.loads(f.read(header_len))
+
+
+def map_file(path: str, magic: bytes, version: int, kind: str) -> Tuple[Dict, mmap.mmap, int]:
+    """Map the file read-only: (header, mapping, offset of the body). ValueError if it is not a `kind`."""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        header_len = _header_len(path, mm[:_PREFIX.size], magic, version, kind)
+        header = orjson.loads(mm[_PREFIX.size:_PREFIX.size + header_len])
+    except ValueError:
+        mm.close()
+        raise
+    return header, mm, aligned(_PREFIX.size + header_len)
+
+
+def write_file(path: str, magic: bytes, version: int, header: Dict, body: Iterable[bytes]) -> None:
+    """Write atomically (temp file + rename) so a running server never maps a partial file."""
+    blob = orjson.dumps(header)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(magic, version, len(blob)))
+        f.write(blob)
+        f.write(padding(_PREFIX.size + len(blob)))
+        for chunk in body:
+            f.write(chunk)
+    os.replace(tmp, path)
+
+
+def blob_sections(name: str, blobs: Sequence[bytes]) -> Dict[str, "array"]:
+    """Variable-length byte strings as two sections: `name`.offsets (q, n + 1) and `name`.data (B)."""
+    offsets = array("q", [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return {f"{name}.offsets": offsets, f"{name}.data": array("B", b"".join(blobs))}
+
+
+def _padded(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    for data in chunks:
+        yield data
+        yield padding(len(data))
+
+
+def write_sections(path: str, magic: bytes, version: int, header: Dict, sections: Dict[str, "array"]) -> None:
+    """write_file with a body of typed sections, recorded in header["sections"]."""
+    layout, offset = {}, 0
+    for name, arr in sections.items():
+        layout[name] = [arr.typecode, offset, len(arr)]
+        offset = aligned(offset + len(arr) * arr.itemsize)
+    write_file(path, magic, version, dict(header, sections=layout), _padded(arr.tobytes() for arr in sections.values()))
+
+
+def map_sections(path: str, magic: bytes, version: int, kind: str) -> Tuple[Dict, Dict[str, memoryview], mmap.mmap]:
+    """map_file, with each section of header["sections"] cast to a typed memoryview."""
+    header, mm, base = map_file(path, magic, version, kind)
+    view = memoryview(mm)
+    sections = {}
+    for name, (typecode, offset, count) in header["sections"].items():
+        start = base + offset
+        sections[name] = view[start:start + count * struct.calcsize(typecode)].cast(typecode)
+    return header, sections, mm
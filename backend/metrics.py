@@ -0,0 +1,127 @@
+from __future__ import annotations
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; covers cache-hit requests (sub-millisecond stages) up to slow Overpass queries
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label value tuple."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> ([count per bucket, +Inf last], sum)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total[0])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render_counter(name: str, help: str, values: Dict[Tuple[str, ...], float], labelnames: Sequence[str] = (),
+                   kind: str = "counter") -> List[str]:
+    """Exposition lines for a counter (or gauge) family given as {label values: value}."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in sorted(values.items()):
+        lines.append(f"{name}{_labels(labelnames, labels)} {_number(value)}")
+    return lines
+
+
+class StageTimer:
+    """Wall time per pipeline stage of one request.
+
+    `stage` records into `durations` and, when a histogram is given, observes it there
+    too. Disabled requests get NULL_TIMER, whose `stage` does no timing at all.
+    """
+
+    enabled = True
+
+    def __init__(self, histogram: Optional[Histogram] = None, endpoint: str = ""):
+        self.histogram = histogram
+        self.endpoint = endpoint
+        self.durations: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+            if self.histogram is not None:
+                self.histogram.observe(elapsed, self.endpoint, name)
+
+    def count(self, name: str, value: int) -> None:
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, durations in milliseconds."""
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.durations.items())
+
+    def breakdown(self) -> Dict[str, Dict[str, float]]:
+        return {"stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.durations.items()},
+                "counts": dict(self.counts)}
+
+
+class _NullStage:
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+class _NullTimer(StageTimer):
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name: str) -> _NullStage:  # type: ignore[override]
+        return self._stage
+
+    def count(self, name: str, value: int) -> None:
+        pass
+
+
+NULL_TIMER = _NullTimer()
@@ -0,0 +1,230 @@
+from __future__ import annotations
+import asyncio
+import codecs
+import email.utils
+import json
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+
+from metrics import Histogram
+
+T = TypeVar("T")
+
+# Statuses worth retrying: rate limited, or the server/gateway is overloaded
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Tags read by category classification, the proximity predicates and the frontend popups;
+# everything else an element carries is dropped while parsing
+KEPT_TAGS = ("name", "amenity", "leisure", "shop", "religion", "sport", "golf")
+
+
+@dataclass
+class Amenity:
+    """Compact amenity record: element center plus the kept tags only."""
+    __slots__ = ("id", "lat", "lng", "tags")
+    id: Any
+    lat: float
+    lng: float
+    tags: Dict[str, str]
+
+
+def element_to_amenity(el: Dict[str, Any]) -> Optional[Amenity]:
+    """Amenity for an Overpass element (center for ways/relations), or None without coordinates."""
+    # Ways/relations carry 'bounds' (out bb) or 'center' (out center); nodes have 'lat','lon'
+    if "bounds" in el:
+        # Overpass's own center is the middle of the bounding box too
+        b = el["bounds"]
+        lat, lon = (b["minlat"] + b["maxlat"]) / 2, (b["minlon"] + b["maxlon"]) / 2
+    elif "center" in el:
+        lat, lon = el["center"]["lat"], el["center"]["lon"]
+    else:
+        lat, lon = el.get("lat"), el.get("lon")
+    if lat is None or lon is None:
+        return None
+    tags = el.get("tags") or {}
+    kept = {k: tags[k] for k in KEPT_TAGS if k in tags}
+    return Amenity(el.get("id", f"osm-{lat}-{lon}"), lat, lon, kept)
+
+
+_ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+_json_decoder = json.JSONDecoder()
+
+
+async def iter_elements(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the objects of an Overpass JSON response's "elements" array as bytes arrive.
+
+    Only the current partial element is buffered, never the whole payload or its parsed
+    tree. A response without an "elements" array yields nothing; a truncated array raises
+    ValueError.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    in_array = done = False
+    async for chunk in chunks:
+        if done:
+            continue
+        buf += utf8.decode(chunk)
+        if not in_array:
+            m = _ELEMENTS_START.search(buf)
+            if m is None:
+                continue
+            in_array = True
+            pos = m.end()
+        n = len(buf)
+        while True:
+            while pos < n and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= n:
+                break
+            if buf[pos] == "]":
+                done = True
+                break
+            try:
+                el, end = _json_decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # element continues in the next chunk
+            yield el
+            pos = end
+        buf = buf[pos:]
+        pos = 0
+    if in_array and not done:
+        raise ValueError("Truncated Overpass response: elements array not terminated")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class OverpassClient:
+    """Long-lived Overpass API client shared by every request.
+
+    Keeps one pooled httpx.AsyncClient (keep-alive, optional HTTP/2), caps in-flight
+    upstream queries with a semaphore, and retries 429/5xx responses and transport errors
+    with jittered exponential backoff. A Retry-After header blocks that mirror until the
+    given time, and retries go to the next mirror in `urls` that is not blocked.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        timeout: float = 30,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_retry_after: float = 60.0,
+        http2: bool = False,
+        stats: Optional[Counter] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        latency: Optional[Histogram] = None,
+    ):
+        if not urls:
+            raise ValueError("OverpassClient needs at least one URL")
+        self.urls = list(urls)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.stats = stats if stats is not None else Counter()
+        # Wall time per attempt, labelled by status code (or "error"), when given
+        self.latency = latency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._blocked_until: Dict[str, float] = {}
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency * 2, max_keepalive_connections=max_concurrency),
+            http2=http2,
+            transport=transport,
+        )
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _pick_url(self, attempt: int) -> str:
+        now = time.monotonic()
+        n = len(self.urls)
+        order = [self.urls[(attempt + i) % n] for i in range(n)]
+        for url in order:
+            if self._blocked_until.get(url, 0.0) <= now:
+                return url
+        return min(order, key=lambda u: self._blocked_until.get(u, 0.0))
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+    async def _request(self, query: str, consume: Callable[[httpx.Response], Awaitable[T]]) -> T:
+        """POST a query with retries and failover; `consume` reads the streamed 2xx response.
+        Transport errors while consuming are retried too, so `consume` must start from scratch.
+        """
+        last_exc: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            url = self._pick_url(attempt)
+            wait = self._blocked_until.get(url, 0.0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    status = "error"
+                    try:
+                        async with self._client.stream("POST", url, data={"data": query}) as resp:
+                            status = str(resp.status_code)
+                            self.stats[f"overpass_status_{resp.status_code}"] += 1
+                            if resp.status_code not in RETRY_STATUSES:
+                                resp.raise_for_status()
+                                return await consume(resp)
+                    finally:
+                        if self.latency is not None:
+                            self.latency.observe(time.perf_counter() - started, status)
+                last_exc = httpx.HTTPStatusError(f"Overpass returned {resp.status_code}", request=resp.request, response=resp)
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if retry_after is not None:
+                    self._blocked_until[url] = time.monotonic() + min(retry_after, self.max_retry_after)
+            except httpx.TransportError as exc:
+                self.stats["overpass_transport_errors"] += 1
+                last_exc = exc
+            if attempt < self.max_retries:
+                self.stats["overpass_retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+        assert last_exc is not None
+        raise last_exc
+
+    async def query(self, query: str) -> Dict[str, Any]:
+        """POST an Overpass QL query and return the decoded JSON body."""
+        async def consume(resp: httpx.Response) -> Dict[str, Any]:
+            await resp.aread()
+            return resp.json()
+        return await self._request(query, consume)
+
+    async def stream_elements(self, query: str, make_sink: Callable[[], Callable[[Dict[str, Any]], None]]) -> Any:
+        """POST a query and feed each element to a sink as it is parsed from the stream.
+        Every attempt gets a fresh sink from `make_sink`; the one that saw the whole response
+        is returned.
+        """
+        async def consume(resp: httpx.Response) -> Any:
+            sink = make_sink()
+            count = 0
+            async for el in iter_elements(resp.aiter_bytes()):
+                sink(el)
+                count += 1
+            self.stats["overpass_elements"] += count
+            self.stats["overpass_bytes"] += resp.num_bytes_downloaded
+            return sink
+        return await self._request(query, consume)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+import math
+import mmap
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from mapped_file import blob_sections, map_sections, write_sections
+
+try:  # optional: vectorized lookups
+    import numpy as np
+except ImportError:
+    np = None
+
+# mapped_file sections (write_sections) with magic b"PXTB":
+#   one float32 column of n values per entry of header["columns"]: meters to the nearest
+#   amenity of that type, inf when none lies within header["max_radius"]
+#   lat / lng (d, n) and id.offsets (q, n + 1) / id.data (B): the listings the rows were
+#   computed for, read only by the builder to reuse unchanged rows
+# header["inventory"] is the ListingStore.inventory_digest of those listings.
+MAGIC = b"PXTB"
+VERSION = 2
+
+
+class ProximityTable:
+    """Memory-mapped listing -> nearest-amenity distance table.
+
+    One float32 column per fine-grained amenity type (e.g. "stores:grocery"), one row per
+    listing in inventory order. The header holds a digest of the listings the rows were
+    computed for, so checking the table against an inventory reads nothing else; their ids
+    and coordinates are body sections, and a content hash per amenity area is kept, so the
+    builder can recompute only what changed.
+    """
+
+    def __init__(self, header: Dict, sections: Dict[str, memoryview], mm: Optional[mmap.mmap] = None):
+        self.header = header
+        self.sections = sections
+        self.columns: Dict[str, Sequence[float]] = {
+            name: np.frombuffer(sections[name], dtype="<f4") if np is not None else sections[name]
+            for name in header["columns"]
+        }
+        self.max_radius: float = header["max_radius"]
+        self.lat, self.lng = sections["lat"], sections["lng"]
+        self._mm = mm
+
+    def __len__(self) -> int:
+        return self.header["rows"]
+
+    @classmethod
+    def load(cls, path: str) -> "ProximityTable":
+        header, sections, mm = map_sections(path, MAGIC, VERSION, "proximity table")
+        return cls(header, sections, mm)
+
+    @staticmethod
+    def write(path: str, header: Dict, columns: Dict[str, "array[float]"], ids: Sequence[str],
+              lat: Sequence[float], lng: Sequence[float]) -> None:
+        """Write atomically, see mapped_file.write_file. `header` must carry the
+        inventory_digest of the listings `ids`, `lat` and `lng` describe.
+        """
+        sections = {name: array("f", col) for name, col in columns.items()}
+        sections.update({"lat": array("d", lat), "lng": array("d", lng)})
+        sections.update(blob_sections("id", [str(i).encode() for i in ids]))
+        write_sections(path, MAGIC, VERSION, dict(header, rows=len(ids), columns=list(columns)), sections)
+
+    def ids(self) -> List[str]:
+        offsets, data = self.sections["id.offsets"], self.sections["id.data"]
+        return [str(data[offsets[i]:offsets[i + 1]], "utf-8") for i in range(len(self))]
+
+    def matches(self, inventory_digest: str) -> bool:
+        """True if the rows line up with the listing inventory of that digest (same ids,
+        coordinates and order), see ListingStore.inventory_digest.
+        """
+        return self.header.get("inventory") == inventory_digest
+
+    def within(self, rows: Sequence[int], columns: Sequence[str], radius: float) -> List[bool]:
+        """For each row, whether the nearest amenity of any of `columns` is within radius."""
+        if not columns:
+            return [False] * len(rows)
+        if np is not None:
+            idx = np.asarray(rows, dtype=np.intp)
+            nearest = np.min(np.stack([self.columns[c][idx] for c in columns]), axis=0)
+            return (nearest <= radius).tolist()
+        cols = [self.columns[c] for c in columns]
+        return [min(col[i] for col in cols) <= radius for i in rows]
+
+
+def empty_column(n: int) -> "array[float]":
+    return array("f", [math.inf]) * n
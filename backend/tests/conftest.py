@@ -0,0 +1,10 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# main reads its configuration at import time: serve the seed JSON, never a local snapshot,
+# proximity table or real Overpass server, and start no background loops
+os.environ.update(LISTINGS_SNAPSHOT_PATH="", PROXIMITY_TABLE_PATH="", OVERPASS_URLS="http://overpass.test/api/interpreter",
+                  HOT_REFRESH_INTERVAL_SECONDS="0", LISTINGS_RELOAD_INTERVAL_SECONDS="0", AMENITY_CACHE_BACKEND="memory")
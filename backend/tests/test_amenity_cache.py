@@ -0,0 +1,78 @@
+import time
+from collections import Counter
+
+import pytest
+
+from amenity_cache import MemoryAmenityCache, SqliteAmenityCache
+from overpass import Amenity
+
+TAG_SET = ("parks", ())
+
+
+def entry(i):
+    return {"parks": [Amenity(i, 40.75, -73.98, {"leisure": "park"})], "worship": [], "stores": [], "gyms": [],
+            "sports": []}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryAmenityCache(maxsize=64, ttl=60)
+    return SqliteAmenityCache(str(tmp_path / "cache.sqlite3"), maxsize=64, ttl=60)
+
+
+def test_get_many_returns_only_live_entries(cache):
+    for i in range(5):
+        cache.set((TAG_SET, (14, i, 0)), entry(i))
+    keys = [(TAG_SET, (14, i, 0)) for i in range(8)]
+    hits = cache.get_many(keys)
+    assert sorted(hits) == keys[:5]
+    assert [a.id for a in hits[keys[3]].entry["parks"]] == [3]
+    assert cache.get(keys[3]).entry == hits[keys[3]].entry
+    assert cache.get(keys[7]) is None
+
+
+def test_set_many_stores_a_whole_fetch(cache):
+    keys = [(TAG_SET, (14, i, 0)) for i in range(40)]
+    cache.set_many({key: entry(i) for i, key in enumerate(keys)})
+    assert sorted(cache.get_many(keys)) == keys
+    assert [a.id for a in cache.get(keys[39]).entry["parks"]] == [39]
+    # One more batch than fits: the overflow is evicted, whichever backend
+    cache.set_many({(TAG_SET, (15, i, 0)): entry(i) for i in range(40)})
+    assert len(cache) == 64
+
+
+def test_sqlite_expired_entries_are_misses(tmp_path):
+    cache = SqliteAmenityCache(str(tmp_path / "cache.sqlite3"), maxsize=64, ttl=60)
+    cache.set((TAG_SET, (14, 0, 0)), entry(0), fetched_at=time.time() - 61)
+    cache.set((TAG_SET, (14, 1, 0)), entry(1), fetched_at=time.time() - 30)
+    hits = cache.get_many([(TAG_SET, (14, 0, 0)), (TAG_SET, (14, 1, 0))])
+    assert list(hits) == [(TAG_SET, (14, 1, 0))]
+    assert hits[(TAG_SET, (14, 1, 0))].fetched_at < time.time() - 29
+
+
+def test_sqlite_eviction_sees_buffered_reads(tmp_path):
+    writes = SqliteAmenityCache._EVICT_EVERY  # the last of these writes runs an eviction pass
+    cache = SqliteAmenityCache(str(tmp_path / "cache.sqlite3"), maxsize=writes - 2, ttl=60)
+    for i in range(writes - 1):
+        cache.set((TAG_SET, (14, i, 0)), entry(i))
+    time.sleep(0.01)
+    # Reading the oldest entry makes it the most recently used, so the next two oldest go instead
+    assert cache.get((TAG_SET, (14, 0, 0))) is not None
+    cache.set((TAG_SET, (14, writes, 0)), entry(writes))
+    assert len(cache) == writes - 2
+    assert cache.get((TAG_SET, (14, 0, 0))) is not None
+    assert cache.get((TAG_SET, (14, 1, 0))) is None
+    assert cache.get((TAG_SET, (14, 2, 0))) is None
+
+
+def test_memory_clear_is_not_counted_as_eviction():
+    stats = Counter()
+    cache = MemoryAmenityCache(maxsize=4, ttl=60, stats=stats)
+    for i in range(6):
+        cache.set((TAG_SET, (14, i, 0)), entry(i))
+    assert stats["cache_evictions"] == 2
+    cache.clear()
+    assert len(cache) == 0
+    assert stats["cache_evictions"] == 2
+    assert stats["cache_expirations"] == 0
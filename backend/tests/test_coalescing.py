@@ -0,0 +1,149 @@
+"""Single-flight tile fetches: concurrent fetch_amenities calls share one Overpass request."""
+import asyncio
+import sqlite3
+
+import httpx
+import orjson
+import pytest
+
+import main
+from overpass import OverpassClient
+
+# A few hundred metres of Manhattan, inside a handful of zoom-14 tiles
+BBOX = (-73.99, 40.75, -73.98, 40.76)
+PARKS = (BBOX, True, [], [], [], [])
+BODY = orjson.dumps({"elements": [
+    {"type": "node", "id": 1, "lat": 40.755, "lon": -73.985, "tags": {"leisure": "park", "name": "Bryant Park"}},
+]})
+
+
+class SlowOverpass:
+    """MockTransport handler answering every query after `delay` seconds with `status`."""
+
+    def __init__(self, delay: float = 0.2, status: int = 200, body: bytes = BODY):
+        self.delay = delay
+        self.status = status
+        self.body = body
+        self.calls = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return httpx.Response(self.status, content=self.body if self.status == 200 else b"")
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    main.amenities_cache.clear()
+    main._inflight_tiles.clear()
+    yield
+    main.amenities_cache.clear()
+    main._inflight_tiles.clear()
+
+
+def run_with(upstream: SlowOverpass, scenario):
+    async def run():
+        main.overpass_client = OverpassClient(["http://overpass.test/api/interpreter"], max_retries=0,
+                                              transport=httpx.MockTransport(upstream))
+        try:
+            return await scenario()
+        finally:
+            await asyncio.gather(*main._background_tasks, return_exceptions=True)
+            await main.overpass_client.aclose()
+            main.overpass_client = None
+    return asyncio.run(run())
+
+
+def test_concurrent_calls_share_one_upstream_request():
+    upstream = SlowOverpass()
+
+    async def scenario():
+        return await asyncio.gather(*(main.fetch_amenities(*PARKS) for _ in range(20)))
+
+    results = run_with(upstream, scenario)
+    assert upstream.calls == 1
+    assert all([a.id for a in r["parks"]] == [1] for r in results)
+    assert not main._inflight_tiles
+    assert len(main.amenities_cache) > 0
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    upstream = SlowOverpass(status=500)
+
+    async def scenario():
+        return await asyncio.gather(*(main.fetch_amenities(*PARKS) for _ in range(20)), return_exceptions=True)
+
+    results = run_with(upstream, scenario)
+    assert upstream.calls == 1
+    assert len(results) == 20
+    assert all(isinstance(r, httpx.HTTPStatusError) and r.response.status_code == 500 for r in results)
+    assert len(main.amenities_cache) == 0
+    assert not main._inflight_tiles
+
+    # The next call goes upstream again instead of replaying the failure
+    upstream.status = 200
+    result = run_with(upstream, lambda: main.fetch_amenities(*PARKS))
+    assert upstream.calls == 2
+    assert [a.id for a in result["parks"]] == [1]
+
+
+def test_cancelling_the_first_caller_does_not_strand_the_others():
+    upstream = SlowOverpass()
+
+    async def scenario():
+        first = asyncio.ensure_future(main.fetch_amenities(*PARKS))
+        await asyncio.sleep(0.05)  # first has claimed the tiles and is waiting on Overpass
+        assert main._inflight_tiles
+        others = [asyncio.ensure_future(main.fetch_amenities(*PARKS)) for _ in range(19)]
+        await asyncio.sleep(0)
+        first.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*others), timeout=5)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return results
+
+    results = run_with(upstream, scenario)
+    assert upstream.calls == 1
+    assert all([a.id for a in r["parks"]] == [1] for r in results)
+    assert not main._inflight_tiles
+
+
+def test_failed_cache_write_still_resolves_every_waiter(monkeypatch):
+    upstream = SlowOverpass()
+
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(main.amenities_cache, "set_many", locked)
+    errors = main.amenity_stats["cache_write_errors"]
+
+    async def scenario():
+        return await asyncio.wait_for(asyncio.gather(*(main.fetch_amenities(*PARKS) for _ in range(20))), timeout=5)
+
+    results = run_with(upstream, scenario)
+    assert upstream.calls == 1
+    assert all([a.id for a in r["parks"]] == [1] for r in results)
+    assert main.amenity_stats["cache_write_errors"] == errors + 1
+    assert not main._inflight_tiles
+    assert len(main.amenities_cache) == 0
+
+
+def test_large_way_is_kept_for_every_tile_it_spans():
+    # A park whose center lies south of every BBOX tile but whose outline covers them all
+    upstream = SlowOverpass(delay=0, body=orjson.dumps({"elements": [
+        {"type": "way", "id": 7, "tags": {"leisure": "park", "name": "Big Park"},
+         "bounds": {"minlat": 40.70, "minlon": -74.00, "maxlat": 40.77, "maxlon": -73.97}},
+        {"type": "node", "id": 7, "lat": 40.755, "lon": -73.985, "tags": {"leisure": "park"}},
+    ]}))
+    result = run_with(upstream, lambda: main.fetch_amenities(*PARKS))
+    assert upstream.calls == 1
+    # Stored under several tiles, returned once; the node with the same id is another element
+    assert sorted((a.id, a.lat) for a in result["parks"]) == [(7, 40.735), (7, 40.755)]
+    assert sum(len(hit.entry["parks"]) for hit in main.amenities_cache.get_many(
+        [(("parks", ()), tile) for tile in main.amenity_tiles(BBOX)]).values()) > 2
+
+    # A viewport inside a single one of those tiles is answered from the cache, park included
+    small = (-73.9855, 40.7555, -73.9845, 40.7565)
+    result = run_with(upstream, lambda: main.fetch_amenities(small, True, [], [], [], []))
+    assert upstream.calls == 1
+    assert {a.lat for a in result["parks"]} == {40.735, 40.755}
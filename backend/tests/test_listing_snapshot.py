@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from listing_snapshot import ListingSnapshot, source_stamp
+from listings_store import ListingStore
+
+SEED = os.path.join(os.path.dirname(main.__file__), "listings_seed.json")
+
+
+def build(json_path: str, snapshot_path: str) -> None:
+    source = source_stamp(json_path)
+    store = ListingStore.from_json(json_path, dict)
+    ListingSnapshot.write(snapshot_path, store.records, store.columns(), store.index, store.cell_m, source=source)
+
+
+def edit(json_path: str, rows) -> None:
+    st = os.stat(json_path)
+    with open(json_path, "w") as f:
+        json.dump(rows, f)
+    # Make the edit visible even on filesystems with coarse mtimes
+    os.utime(json_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def inventory(tmp_path, monkeypatch):
+    json_path, snapshot_path = str(tmp_path / "listings.json"), str(tmp_path / "listings.bin")
+    shutil.copy(SEED, json_path)
+    build(json_path, snapshot_path)
+    monkeypatch.setattr(main, "LISTINGS_PATH", json_path)
+    monkeypatch.setattr(main, "LISTINGS_SNAPSHOT_PATH", snapshot_path)
+    monkeypatch.setattr(main, "LISTINGS", main.LISTINGS)
+    monkeypatch.setattr(main, "PROXIMITY_TABLE", None)
+    return json_path, snapshot_path
+
+
+def test_snapshot_rows_match_json(inventory):
+    json_path, snapshot_path = inventory
+    snapshot = ListingStore.from_snapshot(snapshot_path, dict)
+    assert list(snapshot.records) == json.load(open(json_path))
+    assert snapshot.ids() == ListingStore.from_json(json_path, dict).ids()
+
+
+def test_snapshot_of_current_json_is_served(inventory):
+    json_path, snapshot_path = inventory
+    assert ListingSnapshot.stale_reason(snapshot_path, json_path) is None
+    assert main.listings_source() == snapshot_path
+
+
+def test_snapshot_of_another_json_is_ignored(inventory, tmp_path, monkeypatch):
+    other = str(tmp_path / "other.json")
+    shutil.copy(SEED, other)
+    monkeypatch.setattr(main, "LISTINGS_PATH", other)
+    assert "was built from" in ListingSnapshot.stale_reason(inventory[1], other)
+    with pytest.warns(RuntimeWarning, match="Ignoring listing snapshot"):
+        assert main.listings_source() == other
+
+
+def test_snapshot_older_than_json_is_ignored(inventory):
+    json_path, snapshot_path = inventory
+    edit(json_path, json.load(open(json_path))[:5])
+    assert "has changed" in ListingSnapshot.stale_reason(snapshot_path, json_path)
+    with pytest.warns(RuntimeWarning):
+        assert main.listings_source() == json_path
+
+    build(json_path, snapshot_path)
+    assert main.listings_source() == snapshot_path
+
+
+def test_reload_follows_json_edits(inventory):
+    json_path, snapshot_path = inventory
+    main.LISTINGS = main.load_listings(main.listings_source())
+    version = main.inventory_version()
+    assert len(main.LISTINGS) == 25
+
+    edit(json_path, json.load(open(json_path))[:5])
+    assert main.inventory_version() != version
+    with pytest.warns(RuntimeWarning):
+        asyncio.run(main.reload_listings())
+    assert len(main.LISTINGS) == 5
+    assert main.LISTINGS.ids() == [r["id"] for r in json.load(open(json_path))]
+
+
+def test_row_dicts_decode_each_record_once(inventory, monkeypatch):
+    snapshot = ListingStore.from_snapshot(inventory[1], dict)
+    records, reads = snapshot.records, []
+
+    class Counting:
+        def __getitem__(self, i):
+            reads.append(i)
+            return records[i]
+
+    monkeypatch.setattr(snapshot, "records", Counting())
+    rows = snapshot.row_dicts([0, 3, 7], main.LISTING_FIELDS, main.LISTING_DEFAULTS)
+    assert reads == [0, 3, 7]
+    assert rows == ListingStore.from_json(inventory[0], dict).row_dicts([0, 3, 7], main.LISTING_FIELDS,
+                                                                          main.LISTING_DEFAULTS)
+
+
+# The whole seed inventory
+VIEWPORT = {"west": -75, "south": 40, "east": -73, "north": 41.5}
+
+
+def test_cursor_is_rejected_after_the_inventory_changes(inventory):
+    json_path, snapshot_path = inventory
+    main.LISTINGS = main.load_listings(main.listings_source())
+    # The JSON and the snapshot compiled from it are the same inventory
+    assert main.LISTINGS.version == ListingStore.from_json(json_path, dict).version
+    client = TestClient(main.app)
+    first = client.get("/api/listings", params={**VIEWPORT, "limit": 10}).json()
+    second = client.get("/api/listings", params={**VIEWPORT, "limit": 10, "cursor": first["next_cursor"]})
+    assert second.status_code == 200
+
+    edit(json_path, json.load(open(json_path))[5:])
+    with pytest.warns(RuntimeWarning):
+        asyncio.run(main.reload_listings())
+    stale = client.get("/api/listings", params={**VIEWPORT, "limit": 10, "cursor": first["next_cursor"]})
+    assert stale.status_code == 400
+    assert "changed" in stale.json()["detail"]
+
+
+def test_default_order_desc_is_reverse_inventory_order(inventory):
+    main.LISTINGS = main.load_listings(main.listings_source())
+    client = TestClient(main.app)
+    ids = [r["id"] for r in json.load(open(inventory[0]))]
+    pages, cursor = [], None
+    while True:
+        params = {**VIEWPORT, "limit": 10, "order": "desc", **({"cursor": cursor} if cursor else {})}
+        body = client.get("/api/listings", params=params).json()
+        pages += [listing["id"] for listing in body["listings"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == ids[::-1]
@@ -0,0 +1,33 @@
+import random
+
+import orjson
+
+import main
+from overpass import Amenity
+
+TAGS = [{"leisure": "park", "name": "Bryant Park"}, {"amenity": "place_of_worship", "religion": "jewish"},
+        {"shop": "supermarket", "name": "Whole Foods"}, {"leisure": "fitness_centre", "sport": "yoga"},
+        {"leisure": "tennis_court"}]
+
+
+def amenities(n: int):
+    rng = random.Random(5)
+    out = main.empty_amenities()
+    for i in range(n):
+        tags = dict(rng.choice(TAGS))
+        out[main.classify_amenity(tags)].append(Amenity(1000 + i, rng.uniform(40.7, 40.8), rng.uniform(-74.0, -73.9), tags))
+    return out
+
+
+def test_compact_rows_carry_the_full_amenities_in_less_space():
+    found = amenities(300)
+    rows = list(range(len(main.LISTINGS)))
+    full = main.search_payload(rows, found, None, "full").body
+    compact = main.search_payload(rows, found, None, "compact").body
+    assert len(compact) < len(full)
+
+    body = orjson.loads(compact)
+    assert body["listings"] == orjson.loads(full)["listings"]
+    for cat, recs in found.items():
+        subtype = main.AMENITY_SUBTYPES[cat]
+        assert body["amenities"][cat] == [[a.id, a.lat, a.lng, a.tags.get("name", ""), subtype(a.tags)] for a in recs]
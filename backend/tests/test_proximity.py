@@ -0,0 +1,169 @@
+"""proximity_check_grid / proximity_check_numpy against the original per-listing scan."""
+import math
+import random
+from typing import Dict, List
+
+import pytest
+
+import main
+from geo import haversine_m, np
+from overpass import Amenity
+
+TAG_POOLS = {
+    "parks": [{"leisure": "park"}],
+    "worship": [{"amenity": "place_of_worship", "religion": r} for r in ("christian", "jewish", "muslim", "buddhist")],
+    "stores": [{"shop": s} for s in ("supermarket", "convenience", "hardware", "electronics", "clothes")],
+    "gyms": [{"leisure": "fitness_centre"}, {"leisure": "fitness_centre", "sport": "yoga"},
+             {"leisure": "fitness_centre", "sport": "boxing"}, {"amenity": "dojo"}, {"leisure": "swimming_pool"}],
+    "sports": [{"leisure": "tennis_court"}, {"leisure": "sports_centre", "sport": "tennis"},
+               {"leisure": "golf_course"}, {"golf": "driving_range"}, {"leisure": "pitch", "sport": "soccer"}],
+}
+
+FILTERS = [
+    # need_parks, worship, stores, gyms, sports
+    (True, [], [], [], []),
+    (False, ["church", "synagogue"], [], [], []),
+    (False, [], ["grocery"], [], []),
+    (False, [], [], ["gym", "yoga_studio"], []),
+    (False, [], [], [], ["tennis_court", "golf_driving_range"]),
+    (True, ["mosque"], ["home_improvement", "appliance"], ["martial_arts_gym"], ["golf_course"]),
+]
+
+CHECKS = [main.proximity_check_grid,
+          pytest.param(main.proximity_check_numpy, marks=pytest.mark.skipif(np is None, reason="numpy not installed"))]
+
+
+def passes_proximity(lat, lng, amenities, need_parks, worship_types, store_types, gym_types, sports_types, radii):
+    """The per-listing scan main.search_listings used before the grid index, kept as the reference."""
+    ok = True
+
+    if need_parks:
+        ok = ok and any(haversine_m(lat, lng, a.lat, a.lng) <= radii["parks"] for a in amenities["parks"]) \
+                if amenities["parks"] else False
+    if worship_types and worship_types != ['']:
+        ok = ok and any(haversine_m(lat, lng, a.lat, a.lng) <= radii["worship"] and
+                        (a.tags.get("religion") in {main.WORSHIP_RELIGION_MAP.get(w, w) for w in worship_types})
+                        for a in amenities["worship"]) if amenities["worship"] else False
+    if store_types and store_types != ['']:
+        allowed_shops = set()
+        for k in store_types:
+            allowed_shops.update(main.STORE_TAGS.get(k, []))
+        ok = ok and any(haversine_m(lat, lng, a.lat, a.lng) <= radii["stores"] and
+                        (a.tags.get("shop") in allowed_shops)
+                        for a in amenities["stores"]) if amenities["stores"] else False
+    if gym_types and gym_types != ['']:
+        allowed_gyms = set()
+        for k in gym_types:
+            allowed_gyms.update(main.GYM_TAGS.get(k, []))
+        ok = ok and any(haversine_m(lat, lng, a.lat, a.lng) <= radii["gyms"] and
+                        (a.tags.get("amenity") in allowed_gyms or a.tags.get("leisure") in allowed_gyms or
+                         (a.tags.get("leisure") == "fitness_centre" and a.tags.get("sport") in allowed_gyms))
+                        for a in amenities["gyms"]) if amenities["gyms"] else False
+    if sports_types and sports_types != ['']:
+        allowed_sports = set()
+        golf_driving_range_requested = False
+        for k in sports_types:
+            if k == "golf_driving_range":
+                golf_driving_range_requested = True
+            else:
+                allowed_sports.update(main.SPORTS_TAGS.get(k, []))
+
+        def sports_match(a):
+            if golf_driving_range_requested and a.tags.get("golf") == "driving_range":
+                return True
+            return (a.tags.get("leisure") in allowed_sports or
+                    (a.tags.get("leisure") == "sports_centre" and a.tags.get("sport") in allowed_sports))
+
+        ok = ok and any(haversine_m(lat, lng, a.lat, a.lng) <= radii["sports"] and sports_match(a)
+                        for a in amenities["sports"]) if amenities["sports"] else False
+
+    return ok
+
+
+def random_amenities(rng: random.Random, counts: Dict[str, int], south: float, west: float, north: float,
+                     east: float) -> Dict[str, List[Amenity]]:
+    amenities = main.empty_amenities()
+    for cat, n in counts.items():
+        for _ in range(n):
+            lng = (rng.uniform(west, east) + 180) % 360 - 180
+            tags = dict(rng.choice(TAG_POOLS[cat]))
+            amenities[cat].append(Amenity(f"node/{rng.getrandbits(40)}", rng.uniform(south, north), lng, tags))
+    return amenities
+
+
+def amenity_counts(filters, radii: Dict[str, int], area_m2: float, share: float = 0.55) -> Dict[str, int]:
+    """Amenities per category for about `share` of uniformly spread listings to pass `filters`
+    (Poisson: a category passes with probability 1 - exp(-matching density * pi r^2)).
+    """
+    preds = main.amenity_predicates(*filters)
+    per_category = -math.log(1 - share ** (1 / len(preds)))
+    counts = dict.fromkeys(TAG_POOLS, 20)
+    for cat, pred in preds.items():
+        matching = sum(pred(Amenity("", 0, 0, tags)) for tags in TAG_POOLS[cat]) / len(TAG_POOLS[cat])
+        counts[cat] = round(per_category * area_m2 / (math.pi * radii[cat] ** 2) / matching)
+    return counts
+
+
+def expected(lats, lngs, amenities, filters, radii) -> List[bool]:
+    return [passes_proximity(lat, lng, amenities, *filters, radii) for lat, lng in zip(lats, lngs)]
+
+
+def run_check(check, lats, lngs, amenities, filters, radii) -> List[bool]:
+    preds = main.amenity_predicates(*filters)
+    return check(amenities, preds, {cat: radii[cat] for cat in preds})(lats, lngs)
+
+
+@pytest.mark.parametrize("check", CHECKS)
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_matches_reference(check, filters, seed):
+    rng = random.Random(seed)
+    # About 1.1 x 1.1 km of Manhattan
+    south, west, north, east = 40.75, -73.99, 40.76, -73.977
+    area = haversine_m(south, west, north, west) * haversine_m(40.755, west, 40.755, east)
+    radii = {cat: rng.randint(60, 150) for cat in TAG_POOLS}
+    amenities = random_amenities(rng, amenity_counts(filters, radii, area), south, west, north, east)
+    lats = [rng.uniform(south, north) for _ in range(2000)]
+    lngs = [rng.uniform(west, east) for _ in range(2000)]
+
+    want = expected(lats, lngs, amenities, filters, radii)
+    # Only some listings pass, so a check that accepts or rejects everything fails
+    assert 0.25 <= sum(want) / len(want) <= 0.8
+    assert run_check(check, lats, lngs, amenities, filters, radii) == want
+
+
+@pytest.mark.parametrize("check", CHECKS)
+@pytest.mark.parametrize("south,north", [(89.997, 90.0), (-90.0, -89.997)], ids=["north_pole", "south_pole"])
+def test_poles(check, south, north):
+    rng = random.Random(11)
+    # Meridians converge: points spread over every longitude lie in a cap of radius ~330 m
+    area = math.pi * haversine_m(south, 0, north, 0) ** 2
+    for filters in FILTERS:
+        radii = {cat: rng.randint(60, 150) for cat in TAG_POOLS}
+        amenities = random_amenities(rng, amenity_counts(filters, radii, area), south, -180, north, 180)
+        lats = [rng.uniform(south, north) for _ in range(500)]
+        lngs = [rng.uniform(-180, 180) for _ in range(500)]
+        want = expected(lats, lngs, amenities, filters, radii)
+        assert 0 < sum(want) < len(want)
+        assert run_check(check, lats, lngs, amenities, filters, radii) == want
+
+
+@pytest.mark.parametrize("check", CHECKS)
+def test_antimeridian(check):
+    rng = random.Random(13)
+    # Fiji, straddling 180: amenities just east of it must count for listings just west of it
+    south, west, north, east = -17.005, 179.995, -16.995, 180.005
+    area = haversine_m(south, west, north, west) * haversine_m(-17.0, west, -17.0, east)
+    for filters in FILTERS:
+        radii = {cat: rng.randint(60, 150) for cat in TAG_POOLS}
+        amenities = random_amenities(rng, amenity_counts(filters, radii, area), south, west, north, east)
+        lats = [rng.uniform(south, north) for _ in range(1000)]
+        lngs = [(rng.uniform(west, east) + 180) % 360 - 180 for _ in range(1000)]
+        want = expected(lats, lngs, amenities, filters, radii)
+        assert 0.25 <= sum(want) / len(want) <= 0.8
+        assert run_check(check, lats, lngs, amenities, filters, radii) == want
+
+    # A park 20 m east of 180 is within 60 m of a listing 20 m west of it
+    amenities = main.empty_amenities()
+    amenities["parks"].append(Amenity("node/1", -17.0, -179.99982, {"leisure": "park"}))
+    assert run_check(check, [-17.0], [179.99982], amenities, FILTERS[0], {"parks": 60}) == [True]
@@ -0,0 +1,50 @@
+import json
+import math
+import os
+from array import array
+
+import main
+from listing_snapshot import ListingSnapshot, source_stamp
+from listings_store import ListingStore
+from proximity_table import ProximityTable
+
+SEED = os.path.join(os.path.dirname(main.__file__), "listings_seed.json")
+
+
+def write_table(path: str, store: ListingStore) -> None:
+    n = len(store)
+    columns = {"parks": array("f", [float(i) for i in range(n)]), "stores:grocery": array("f", [math.inf]) * n}
+    header = {"max_radius": 5000, "area_zoom": 12, "inventory": store.inventory_digest(), "areas": {}}
+    ProximityTable.write(path, header, columns, store.ids(), store.lat, store.lng)
+
+
+def test_table_round_trips_and_keeps_listings_out_of_the_header(tmp_path):
+    store = ListingStore.from_json(SEED, dict)
+    path = str(tmp_path / "table.bin")
+    write_table(path, store)
+
+    table = ProximityTable.load(path)
+    assert "ids" not in table.header and "coords" not in table.header
+    assert len(table) == len(store)
+    assert table.ids() == store.ids()
+    assert list(table.lat) == list(store.lat) and list(table.lng) == list(store.lng)
+    assert table.within([0, 3, 7], ["parks", "stores:grocery"], 3) == [True, True, False]
+
+    # A snapshot of the same JSON is the same inventory
+    snapshot_path = str(tmp_path / "listings.bin")
+    ListingSnapshot.write(snapshot_path, store.records, store.columns(), store.index, store.cell_m,
+                          source=source_stamp(SEED))
+    assert table.matches(ListingStore.from_snapshot(snapshot_path, dict).inventory_digest())
+
+
+def test_table_of_another_inventory_is_not_loaded(tmp_path):
+    path = str(tmp_path / "table.bin")
+    write_table(path, ListingStore.from_json(SEED, dict))
+    assert main.load_proximity_table(path, ListingStore.from_json(SEED, main.Listing)) is not None
+
+    rows = json.load(open(SEED))
+    rows[0]["lat"] += 0.001
+    moved = str(tmp_path / "moved.json")
+    with open(moved, "w") as f:
+        json.dump(rows, f)
+    assert main.load_proximity_table(path, ListingStore.from_json(moved, main.Listing)) is None
@@ -0,0 +1,68 @@
+"""Pre-warm the amenity cache for a list of bboxes.
+
+Only useful with a persistent backend (AMENITY_CACHE_BACKEND=sqlite), so that a fresh
+deploy serves warm tiles immediately. Run from backend/, e.g.:
+
+    AMENITY_CACHE_BACKEND=sqlite python warm_cache.py \\
+        --bbox=-74.1,40.6,-73.8,40.9 --parks --stores grocery --gyms gym,yoga_studio
+
+The bbox is expanded by --radius the same way /api/listings expands the viewport, and
+the category options must match the combinations the frontend requests, since tiles
+are cached per category tag set.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import sys
+from typing import List, Tuple
+
+import main
+from geo import expand_bbox_by_radius
+
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    parts = [float(x) for x in value.split(",")]
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError("bbox must be west,south,east,north")
+    return parts[0], parts[1], parts[2], parts[3]
+
+
+def parse_list(value: str) -> List[str]:
+    return [x for x in value.split(",") if x]
+
+
+async def warm(args: argparse.Namespace) -> None:
+    bboxes = list(args.bbox or [])
+    if args.bbox_file:
+        with open(args.bbox_file, "r", encoding="utf-8") as f:
+            bboxes.extend(parse_bbox(line.strip()) for line in f if line.strip() and not line.startswith("#"))
+    if not bboxes:
+        raise SystemExit("no bboxes given (use --bbox or --bbox-file)")
+
+    for bbox in bboxes:
+        expanded = expand_bbox_by_radius(bbox, args.radius)
+        amenities = await main.fetch_amenities(expanded, args.parks, args.worship, args.stores, args.gyms, args.sports)
+        counts = ", ".join(f"{k} {len(v)}" for k, v in amenities.items())
+        print(f"{','.join(str(x) for x in bbox)}: {counts}")
+    print(f"{len(main.amenities_cache)} cached tiles in {main.AMENITY_CACHE_BACKEND} backend")
+    await main.get_overpass_client().aclose()
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bbox", type=parse_bbox, action="append", help="west,south,east,north (repeatable)")
+    parser.add_argument("--bbox-file", help="file with one west,south,east,north bbox per line")
+    parser.add_argument("--radius", type=int, default=1000, help="proximity radius the bbox is expanded by (meters)")
+    parser.add_argument("--parks", action="store_true")
+    parser.add_argument("--worship", type=parse_list, default=[], help="e.g. synagogue,church")
+    parser.add_argument("--stores", type=parse_list, default=[], help="e.g. grocery,appliance")
+    parser.add_argument("--gyms", type=parse_list, default=[], help="e.g. gym,yoga_studio")
+    parser.add_argument("--sports", type=parse_list, default=[], help="e.g. tennis_court,golf_course")
+    args = parser.parse_args()
+    if main.AMENITY_CACHE_BACKEND == "memory":
+        print("warning: AMENITY_CACHE_BACKEND=memory, warmed tiles are lost when this process exits", file=sys.stderr)
+    asyncio.run(warm(args))
+
+
+if __name__ == "__main__":
+    main_cli()